@@ -0,0 +1,180 @@
+"""
+Administrador de credenciales de Google en memoria.
+
+Lee el token de cada usuario del almacén una sola vez, lo renueva en segundo
+plano antes de que expire y garantiza que solo un hilo ejecute la renovación
+mientras los demás esperan su resultado. El almacén solo se actualiza cuando
+el token cambia. Las credenciales residentes forman una caché LRU acotada.
+"""
+import asyncio
+import copy
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from google.auth.transport.requests import Request
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import settings
+from app.auth.token_store import TokenStore, get_token_store
+
+
+def _utcnow() -> datetime:
+    # google-auth guarda expiry como datetime UTC sin zona horaria
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CredentialManager:
+    """Credenciales cacheadas con renovación única y anticipada"""
+
+    def __init__(self, user_id: str, token_store: TokenStore, refresh_margin: Optional[int] = None):
+        self.user_id = user_id
+        self.token_store = token_store
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.CREDENTIAL_REFRESH_MARGIN
+        self._credentials = None
+        self._loaded = False
+        self._saved_token = None
+        self._lock = threading.Lock()
+        # Serializa las renovaciones (single-flight)
+        self._refresh_lock = threading.Lock()
+
+    # -- Persistencia -----------------------------------------------------
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._credentials = self.token_store.get_credentials(self.user_id)
+            self._saved_token = getattr(self._credentials, 'token', None)
+            self._loaded = True
+
+    def _save(self, credentials):
+        """Persiste el token solo si cambió (una transacción de SQLite)"""
+        if credentials.token == self._saved_token:
+            return
+        self.token_store.put_credentials(self.user_id, credentials)
+        self._saved_token = credentials.token
+
+    # -- Consulta y renovación -------------------------------------------
+
+    def _seconds_left(self, credentials) -> Optional[float]:
+        if credentials.expiry is None:
+            return None
+        return (credentials.expiry - _utcnow()).total_seconds()
+
+    def _expiring(self, credentials, margin: float) -> bool:
+        if not credentials.token:
+            return True
+        seconds_left = self._seconds_left(credentials)
+        return seconds_left is not None and seconds_left <= margin
+
+    def get(self):
+        """Retorna credenciales válidas, renovándolas solo si ya expiraron"""
+        self._load()
+        credentials = self._credentials
+        if not credentials:
+            return None
+        if credentials.valid:
+            return credentials
+        if credentials.refresh_token:
+            return self.refresh()
+        return None
+
+    def refresh(self, margin: float = 0):
+        """Renueva el token si expira dentro de margin segundos
+
+        Solo un hilo llama a Google; los que llegan mientras tanto esperan y
+        reciben las credenciales ya renovadas.
+        """
+        with self._refresh_lock:
+            credentials = self._credentials
+            if not credentials or not credentials.refresh_token:
+                return credentials
+            if credentials.valid and not self._expiring(credentials, margin):
+                return credentials
+
+            # Renovar una copia para no exponer un objeto a medio actualizar
+            refreshed = copy.copy(credentials)
+            refreshed.refresh(Request())
+            with self._lock:
+                self._credentials = refreshed
+                self._save(refreshed)
+            return refreshed
+
+    def store(self, credentials):
+        """Reemplaza las credenciales (por ejemplo tras autorizar)"""
+        with self._lock:
+            self._credentials = credentials
+            self._loaded = True
+            self._save(credentials)
+
+    def clear(self):
+        """Olvida las credenciales y las elimina del almacén"""
+        with self._lock:
+            self._credentials = None
+            self._saved_token = None
+            self._loaded = True
+            self.token_store.delete_credentials(self.user_id)
+
+    def seconds_until_refresh(self) -> Optional[float]:
+        """Segundos hasta la siguiente renovación anticipada, o None si no aplica"""
+        self._load()
+        credentials = self._credentials
+        if not credentials or not credentials.refresh_token:
+            return None
+        seconds_left = self._seconds_left(credentials)
+        if seconds_left is None:
+            return None
+        return max(0.0, seconds_left - self.refresh_margin)
+
+
+_managers: "OrderedDict[str, CredentialManager]" = OrderedDict()
+_managers_lock = threading.Lock()
+
+
+def get_credential_manager(user_id: str) -> CredentialManager:
+    """Retorna el administrador del usuario, manteniendo residentes solo los más recientes"""
+    with _managers_lock:
+        manager = _managers.get(user_id)
+        if manager is None:
+            manager = CredentialManager(user_id, get_token_store())
+            _managers[user_id] = manager
+            # Los desalojados se recargan del almacén al volver a usarse
+            while len(_managers) > settings.CREDENTIAL_CACHE_SIZE:
+                _managers.popitem(last=False)
+        else:
+            _managers.move_to_end(user_id)
+        return manager
+
+
+def refresh_expiring() -> int:
+    """Renueva los tokens residentes que expiran dentro del margen configurado"""
+    with _managers_lock:
+        managers = list(_managers.values())
+
+    refreshed = 0
+    for manager in managers:
+        delay = manager.seconds_until_refresh()
+        if delay is None or delay > 0:
+            continue
+        try:
+            manager.refresh(manager.refresh_margin)
+            refreshed += 1
+        except Exception as e:
+            print(f"Error al renovar el token de Google de {manager.user_id}: {e}")
+    return refreshed
+
+
+async def run_refresh_loop():
+    """Renueva en segundo plano los tokens residentes antes de que expiren"""
+    while True:
+        try:
+            refreshed = await run_in_threadpool(refresh_expiring)
+            if refreshed:
+                print(f"🔑 {refreshed} tokens de Google renovados en segundo plano")
+        except Exception as e:
+            print(f"Error en la renovación de tokens: {e}")
+        await asyncio.sleep(settings.CREDENTIAL_REFRESH_INTERVAL)
@@ -0,0 +1,33 @@
+"""
+Dependencias de FastAPI para identificar al usuario de cada petición.
+"""
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.auth.identity import InvalidIdentity, verify_bearer_token
+from app.services.calendar_service import GoogleCalendarService
+from app.services.async_io import AsyncGoogleCalendarService
+
+
+async def get_user_id(authorization: Optional[str] = Header(None)) -> str:
+    """Usuario de la petición, verificado a partir de su token (401 si no lo hay)"""
+    try:
+        # Verificar un ID token de Firebase puede descargar sus certificados
+        return await run_in_threadpool(verify_bearer_token, authorization)
+    except InvalidIdentity as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={'WWW-Authenticate': 'Bearer'})
+
+
+def get_user_calendar_service(user_id: str = Depends(get_user_id)) -> GoogleCalendarService:
+    """Servicio de Google Calendar con las credenciales del usuario"""
+    return GoogleCalendarService(user_id)
+
+
+def get_user_async_calendar_service(
+    calendar_service: GoogleCalendarService = Depends(get_user_calendar_service)
+) -> AsyncGoogleCalendarService:
+    """Contraparte asíncrona del servicio de Google Calendar del usuario"""
+    return AsyncGoogleCalendarService(calendar_service)
+
@@ -1,23 +1,38 @@
 import os
-import pickle
 import json
+import secrets
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 from config.settings import settings
+from app.auth.credential_manager import get_credential_manager
+from app.auth.token_store import get_token_store
+
+def create_state(user_id: str) -> str:
+    """Genera un state aleatorio de OAuth y lo registra para el usuario que inicia el flujo"""
+    state = secrets.token_urlsafe(32)
+    get_token_store().put_oauth_state(state, user_id, settings.OAUTH_STATE_TTL)
+    return state
+
+def consume_state(state: str) -> str:
+    """Usuario que inició el flujo del state; ValueError si es desconocido, expiró o ya se usó"""
+    user_id = get_token_store().pop_oauth_state(state) if state else None
+    if not user_id:
+        raise ValueError("Parámetro state inválido o expirado")
+    return user_id
 
 class GoogleAuthService:
-    def __init__(self):
+    def __init__(self, user_id: str = None):
+        self.user_id = user_id or settings.DEFAULT_USER_ID
         self.scopes = settings.GOOGLE_SCOPES
         # Usar ruta absoluta para el archivo de credenciales (fallback)
         current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         self.credentials_file = os.path.join(current_dir, "config", "credentials.json")
-        self.token_dir = os.path.join(current_dir, "tokens")
-        self.token_file = os.path.join(self.token_dir, "token.pickle")
-        
-        # Crear directorio de tokens si no existe
-        os.makedirs(self.token_dir, exist_ok=True)
+    
+    @property
+    def credential_manager(self):
+        """Credenciales en memoria del usuario (caché LRU respaldada por SQLite)"""
+        return get_credential_manager(self.user_id)
     
     def _get_client_config(self):
         """Obtiene la configuración del cliente desde variables de entorno o archivo"""
@@ -65,7 +80,8 @@ class GoogleAuthService:
             
             authorization_url, state = flow.authorization_url(
                 access_type='offline',
-                include_granted_scopes='true'
+                include_granted_scopes='true',
+                state=create_state(self.user_id)
             )
             
             print(f"✅ URL de autorización generada correctamente")
@@ -99,28 +115,12 @@ class GoogleAuthService:
             raise
     
     def get_stored_credentials(self):
-        """Obtiene las credenciales almacenadas"""
-        if os.path.exists(self.token_file):
-            with open(self.token_file, 'rb') as token:
-                credentials = pickle.load(token)
-                
-            # Verificar si las credenciales son válidas
-            if credentials and credentials.valid:
-                return credentials
-            
-            # Refrescar si han expirado
-            if credentials and credentials.expired and credentials.refresh_token:
-                credentials.refresh(Request())
-                self._save_credentials(credentials)
-                return credentials
-                
-        return None
+        """Obtiene las credenciales almacenadas (desde memoria)"""
+        return self.credential_manager.get()
     
     def _save_credentials(self, credentials):
-        """Guarda las credenciales en archivo"""
-        os.makedirs(os.path.dirname(self.token_file), exist_ok=True)
-        with open(self.token_file, 'wb') as token:
-            pickle.dump(credentials, token)
+        """Guarda las credenciales en memoria y en archivo"""
+        self.credential_manager.store(credentials)
     
     def revoke_credentials(self):
         """Revoca las credenciales y elimina el archivo"""
@@ -128,14 +128,16 @@ class GoogleAuthService:
         if credentials:
             credentials.revoke(Request())
         
-        if os.path.exists(self.token_file):
-            os.remove(self.token_file)
+        self.credential_manager.clear()
+        
+        from app.services.google_client import get_calendar_client
+        get_calendar_client(self.user_id).reset()
     
     def get_calendar_service(self):
-        """Obtiene el servicio de Google Calendar"""
+        """Obtiene el servicio de Google Calendar (construido una sola vez)"""
         credentials = self.get_stored_credentials()
         if not credentials:
             raise Exception("No hay credenciales válidas. El usuario debe autenticarse primero.")
         
-        service = build('calendar', 'v3', credentials=credentials)
-        return service
+        from app.services.google_client import get_calendar_client
+        return get_calendar_client(self.user_id).get_service()
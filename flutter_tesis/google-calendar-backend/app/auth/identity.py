@@ -0,0 +1,103 @@
+"""
+Identidad verificada del usuario de cada petición.
+
+El cliente envía Authorization: Bearer <token>. Se acepta el ID token de
+Firebase Authentication del usuario (verificado con el SDK de
+administración cuando Firebase está configurado) o un token de sesión
+firmado con SESSION_SECRET (HMAC-SHA256), pensado para entornos sin
+Firebase. Una petición sin un token válido se rechaza.
+
+Uso: python -m app.auth.identity <user_id> imprime un token de sesión.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import sys
+import time
+from typing import Optional
+
+from config.settings import settings
+
+
+class InvalidIdentity(Exception):
+    """El token de la petición no es válido o no identifica a un usuario"""
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _signature(payload: str) -> str:
+    secret = settings.SESSION_SECRET.encode('utf-8')
+    return _b64encode(hmac.new(secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def create_session_token(user_id: str, ttl: Optional[int] = None) -> str:
+    """Token de sesión firmado para el usuario, válido durante ttl segundos"""
+    if not settings.SESSION_SECRET:
+        raise InvalidIdentity("SESSION_SECRET no está configurado")
+    claims = {'sub': user_id, 'exp': int(time.time()) + (ttl or settings.SESSION_TOKEN_TTL)}
+    payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{_signature(payload)}"
+
+
+def verify_session_token(token: str) -> str:
+    """Usuario de un token de sesión; InvalidIdentity si la firma o la vigencia fallan"""
+    if not settings.SESSION_SECRET or token.count('.') != 1:
+        raise InvalidIdentity("Token de sesión inválido")
+    payload, signature = token.split('.')
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise InvalidIdentity("Token de sesión inválido")
+    try:
+        claims = json.loads(_b64decode(payload))
+        user_id, expires_at = claims['sub'], int(claims['exp'])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidIdentity("Token de sesión inválido")
+    if not user_id or expires_at < time.time():
+        raise InvalidIdentity("Token de sesión expirado")
+    return user_id
+
+
+def _firebase_app_ready() -> bool:
+    try:
+        import firebase_admin
+        return bool(firebase_admin._apps)
+    except ImportError:
+        return False
+
+
+def verify_firebase_token(token: str) -> str:
+    """Usuario (uid) de un ID token de Firebase Authentication"""
+    from firebase_admin import auth
+    try:
+        return auth.verify_id_token(token)['uid']
+    except Exception as e:
+        raise InvalidIdentity(f"ID token de Firebase inválido: {e}")
+
+
+def verify_bearer_token(authorization: Optional[str]) -> str:
+    """Usuario de la cabecera Authorization (puede tocar la red: llamar fuera del event loop)"""
+    scheme, _, token = (authorization or '').partition(' ')
+    token = token.strip()
+    if scheme.lower() != 'bearer' or not token:
+        raise InvalidIdentity("Falta la cabecera Authorization: Bearer <token>")
+
+    # Los tokens de sesión tienen dos partes; los ID tokens de Firebase (JWT), tres
+    if token.count('.') == 1:
+        return verify_session_token(token)
+    if _firebase_app_ready():
+        return verify_firebase_token(token)
+    raise InvalidIdentity("Firebase no está configurado para verificar ID tokens")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python -m app.auth.identity <user_id>")
+        sys.exit(1)
+    print(create_session_token(sys.argv[1]))
@@ -0,0 +1,159 @@
+"""
+Almacén de estado por usuario en SQLite.
+
+Guarda las credenciales de Google y los syncToken de cada usuario indexados
+por user_id, de modo que cada consulta lee una sola fila sin cargar el
+resto de usuarios, y los state pendientes de los flujos OAuth.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from google.oauth2.credentials import Credentials
+
+from config.settings import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_tokens (
+    user_id TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    sync_token TEXT NOT NULL,
+    PRIMARY KEY (user_id, calendar_id)
+);
+CREATE TABLE IF NOT EXISTS oauth_states (
+    state TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class TokenStore:
+    """Credenciales y syncToken por usuario en una base SQLite local"""
+
+    def __init__(self, db_file: Optional[str] = None):
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.db_file = db_file or settings.TOKEN_DB_PATH or os.path.join(base_dir, "tokens", "tokens.db")
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # -- Credenciales -----------------------------------------------------
+
+    def get_credentials(self, user_id: str) -> Optional[Credentials]:
+        row = self._connection().execute(
+            "SELECT data FROM credentials WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return Credentials.from_authorized_user_info(json.loads(row[0]))
+
+    def put_credentials(self, user_id: str, credentials: Credentials):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO credentials (user_id, data, updated_at) VALUES (?, ?, ?)",
+                (user_id, credentials.to_json(), time.time())
+            )
+
+    def delete_credentials(self, user_id: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+    def count_users(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM credentials").fetchone()[0]
+
+    # -- syncToken --------------------------------------------------------
+
+    def get_sync_token(self, user_id: str, calendar_id: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT sync_token FROM sync_tokens WHERE user_id = ? AND calendar_id = ?",
+            (user_id, calendar_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_sync_token(self, user_id: str, calendar_id: str, sync_token: Optional[str]):
+        with self._connection() as conn:
+            if sync_token:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_tokens (user_id, calendar_id, sync_token) VALUES (?, ?, ?)",
+                    (user_id, calendar_id, sync_token)
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM sync_tokens WHERE user_id = ? AND calendar_id = ?",
+                    (user_id, calendar_id)
+                )
+
+    # -- state de OAuth -------------------------------------------------
+
+    def put_oauth_state(self, state: str, user_id: str, ttl: int):
+        """Registra el state de un flujo OAuth iniciado por el usuario"""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM oauth_states WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT INTO oauth_states (state, user_id, expires_at) VALUES (?, ?, ?)",
+                (state, user_id, now + ttl)
+            )
+
+    def pop_oauth_state(self, state: str) -> Optional[str]:
+        """Consume el state y retorna su usuario (None si no existe, ya se usó o expiró)"""
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT user_id, expires_at FROM oauth_states WHERE state = ?", (state,)
+            ).fetchone()
+            # Solo quien logra eliminar la fila puede usar el state
+            deleted = conn.execute("DELETE FROM oauth_states WHERE state = ?", (state,)).rowcount
+        if not row or not deleted or row[1] < time.time():
+            return None
+        return row[0]
+
+    # -- Migración --------------------------------------------------------
+
+    def import_legacy_pickle(self, user_id: str, token_file: str):
+        """Importa el token.pickle de la versión de un solo usuario"""
+        if not os.path.exists(token_file) or self.get_credentials(user_id):
+            return
+        with open(token_file, 'rb') as token:
+            credentials = pickle.load(token)
+        if credentials:
+            self.put_credentials(user_id, credentials)
+            os.replace(token_file, f"{token_file}.migrated")
+            print(f"🔑 Credenciales de {token_file} migradas al usuario '{user_id}'")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_token_store() -> TokenStore:
+    """Retorna el almacén compartido por el proceso"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = TokenStore()
+                base_dir = os.path.dirname(store.db_file)
+                store.import_legacy_pickle(settings.DEFAULT_USER_ID, os.path.join(base_dir, "token.pickle"))
+                _store = store
+    return _store
@@ -1,67 +1,118 @@
+import asyncio
+from typing import List, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 
 from config.settings import settings
+from app.auth.credential_manager import run_refresh_loop
+from app.services.change_tracking import claim_single_process, run_compaction_loop
+from app.services.change_broker import get_change_broker
 from app.routes.auth_routes import router as auth_router
 from app.routes.calendar_routes import router as calendar_router
-from app.routes.sync_routes import router as sync_router
+from app.routes.sync_routes import router as sync_router, watch_channel_manager
+from app.services.async_io import close_async_http_client
 
-# Crear la aplicación FastAPI
-app = FastAPI(
-    title="Google Calendar Integration API",
-    description="API para sincronización entre Flutter/Firebase y Google Calendar",
-    version="1.0.0"
-)
-
-# Configurar CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Registrar rutas
-app.include_router(auth_router, prefix="/api")
-app.include_router(calendar_router, prefix="/api")
-app.include_router(sync_router, prefix="/api")
-
-@app.get("/")
-async def root():
-    """Endpoint raíz de la API"""
-    return {
-        "message": "Google Calendar Integration API",
-        "version": "1.0.0",
-        "endpoints": {
-            "auth": "/api/auth",
-            "calendar": "/api/calendar",
-            "sync": "/api/sync",
-            "docs": "/docs",
-            "redoc": "/redoc"
+def create_app(allowed_origins: Optional[List[str]] = None) -> FastAPI:
+    """Crea la aplicación con sus rutas, CORS y tareas en segundo plano
+    
+    Todos los puntos de entrada (uvicorn app.main:app, simple_server.py)
+    usan esta fábrica para que las tareas de arranque siempre se ejecuten.
+    """
+    app = FastAPI(
+        title="Google Calendar Integration API",
+        description="API para sincronización entre Flutter/Firebase y Google Calendar",
+        version="1.0.0"
+    )
+    
+    # Configurar CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins or settings.ALLOWED_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
+    )
+    
+    # Registrar rutas
+    app.include_router(auth_router, prefix="/api")
+    app.include_router(calendar_router, prefix="/api")
+    app.include_router(sync_router, prefix="/api")
+    
+    @app.on_event("startup")
+    async def claim_change_tracker():
+        """Impide un segundo worker: el registro de cambios vive en memoria"""
+        claim_single_process()
+    
+    @app.on_event("startup")
+    async def start_watch_channel_renewal():
+        """Inicia la renovación periódica de los canales de notificaciones"""
+        app.state.watch_renewal_task = asyncio.create_task(
+            watch_channel_manager.run_renewal_loop()
+        )
+    
+    @app.on_event("startup")
+    async def start_credential_refresh():
+        """Inicia la renovación anticipada de los tokens de Google en memoria"""
+        app.state.credential_refresh_task = asyncio.create_task(run_refresh_loop())
+    
+    @app.on_event("startup")
+    async def start_change_log_compaction():
+        """Inicia la compactación periódica del log de cambios"""
+        app.state.change_compaction_task = asyncio.create_task(run_compaction_loop())
+    
+    @app.on_event("startup")
+    async def start_change_broker():
+        """Conecta el broker de cambios en vivo al event loop del servidor"""
+        get_change_broker().attach(asyncio.get_running_loop())
+    
+    @app.on_event("shutdown")
+    async def close_http_clients():
+        """Detiene tareas en segundo plano y cierra el pool de conexiones HTTP asíncronas"""
+        app.state.watch_renewal_task.cancel()
+        app.state.credential_refresh_task.cancel()
+        app.state.change_compaction_task.cancel()
+        await close_async_http_client()
+    
+    @app.get("/")
+    async def root():
+        """Endpoint raíz de la API"""
+        return {
+            "message": "Google Calendar Integration API",
+            "version": "1.0.0",
+            "endpoints": {
+                "auth": "/api/auth",
+                "calendar": "/api/calendar",
+                "sync": "/api/sync",
+                "docs": "/docs",
+                "redoc": "/redoc"
+            }
         }
-    }
-
-@app.get("/health")
-async def health_check():
-    """Endpoint de verificación de salud"""
-    return {
-        "status": "healthy",
-        "message": "API funcionando correctamente"
-    }
-
-@app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    """Manejador global de excepciones"""
-    return JSONResponse(
-        status_code=500,
-        content={
-            "error": "Error interno del servidor",
-            "detail": str(exc) if settings.DEBUG else "Error interno"
+    
+    @app.get("/health")
+    async def health_check():
+        """Endpoint de verificación de salud"""
+        return {
+            "status": "healthy",
+            "message": "API funcionando correctamente"
         }
-    )
+    
+    @app.exception_handler(Exception)
+    async def global_exception_handler(request, exc):
+        """Manejador global de excepciones"""
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": "Error interno del servidor",
+                "detail": str(exc) if settings.DEBUG else "Error interno"
+            }
+        )
+    
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     uvicorn.run(
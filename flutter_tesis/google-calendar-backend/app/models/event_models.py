@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel
 
 class EventBase(BaseModel):
@@ -11,7 +11,7 @@ class EventBase(BaseModel):
     reminder: bool = False
 
 class EventCreate(EventBase):
-    pass
+    calendar_id: Optional[str] = None
 
 class EventUpdate(EventBase):
     title: Optional[str] = None
@@ -25,10 +25,49 @@ class EventResponse(EventBase):
     id: str
     google_event_id: Optional[str] = None
     firebase_id: Optional[str] = None
+    calendar_id: Optional[str] = None
+    recurrence: Optional[List[str]] = None
+    series_id: Optional[str] = None
+    original_start: Optional[str] = None
     
     class Config:
         orm_mode = True
 
+class EventBatchCreate(BaseModel):
+    events: List[EventCreate]
+
+class EventBatchUpdateItem(EventUpdate):
+    id: str
+
+class EventBatchUpdate(BaseModel):
+    events: List[EventBatchUpdateItem]
+
+class EventBatchDelete(BaseModel):
+    ids: List[str]
+
+class BatchItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    success: bool
+    status: int
+    error: Optional[str] = None
+    event: Optional[EventResponse] = None
+
+class BatchResponse(BaseModel):
+    success: bool
+    results: List[BatchItemResult]
+
+class EventChange(BaseModel):
+    id: str
+    kind: str
+    version: int
+    event: Optional[EventResponse] = None
+
+class ChangesResponse(BaseModel):
+    changes: List[EventChange]
+    cursor: str
+    has_more: bool = False
+
 class SyncResponse(BaseModel):
     success: bool
     message: str
@@ -1,16 +1,27 @@
-from fastapi import APIRouter, HTTPException, Query
-from app.auth.google_oauth import GoogleAuthService
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+from app.auth.dependencies import get_user_id
+from app.auth.google_oauth import GoogleAuthService, consume_state
 from app.services.calendar_service import GoogleCalendarService
+from app.services.async_io import AsyncServiceAdapter
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
-auth_service = GoogleAuthService()
+def get_async_auth_service(user_id: str = Depends(get_user_id)) -> AsyncServiceAdapter:
+    """Servicio de autenticación del usuario de la petición"""
+    return AsyncServiceAdapter(GoogleAuthService(user_id))
 
 @router.get("/google")
-async def login_google():
-    """Inicia el proceso de autenticación con Google"""
+async def login_google(async_auth_service: AsyncServiceAdapter = Depends(get_async_auth_service)):
+    """Inicia el proceso de autenticación con Google
+    
+    El parámetro state queda registrado en el servidor para el usuario
+    autenticado; el callback lo consume (un solo uso) para saber a quién
+    asociar las credenciales.
+    """
     try:
-        auth_url, state = auth_service.get_authorization_url()
+        auth_url, state = await async_auth_service.get_authorization_url()
         return {
             "auth_url": auth_url,
             "state": state,
@@ -20,14 +31,20 @@ async def login_google():
         raise HTTPException(status_code=500, detail=f"Error al generar URL de autorización: {str(e)}")
 
 @router.get("/callback")
-async def auth_callback(code: str = Query(...)):
+async def auth_callback(code: str = Query(...), state: Optional[str] = Query(None)):
     """Maneja el callback de autorización de Google"""
     try:
-        credentials = auth_service.get_credentials_from_code(code)
+        user_id = await run_in_threadpool(consume_state, state)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        async_auth_service = AsyncServiceAdapter(GoogleAuthService(user_id))
+        credentials = await async_auth_service.get_credentials_from_code(code)
         
-        # Verificar que las credenciales funcionan
-        calendar_service = GoogleCalendarService()
-        service = calendar_service.get_service()
+        # Verificar con una petición real que las credenciales funcionan
+        calendar_service = AsyncServiceAdapter(GoogleCalendarService(user_id))
+        await calendar_service.check_access()
         
         return {
             "success": True,
@@ -38,10 +55,10 @@ async def auth_callback(code: str = Query(...)):
         raise HTTPException(status_code=400, detail=f"Error en la autenticación: {str(e)}")
 
 @router.get("/status")
-async def auth_status():
+async def auth_status(async_auth_service: AsyncServiceAdapter = Depends(get_async_auth_service)):
     """Verifica el estado de la autenticación"""
     try:
-        credentials = auth_service.get_stored_credentials()
+        credentials = await async_auth_service.get_stored_credentials()
         if credentials and credentials.valid:
             return {
                 "authenticated": True,
@@ -59,10 +76,10 @@ async def auth_status():
         }
 
 @router.post("/revoke")
-async def revoke_auth():
+async def revoke_auth(async_auth_service: AsyncServiceAdapter = Depends(get_async_auth_service)):
     """Revoca la autenticación de Google"""
     try:
-        auth_service.revoke_credentials()
+        await async_auth_service.revoke_credentials()
         return {
             "success": True,
             "message": "Autenticación revocada exitosamente"
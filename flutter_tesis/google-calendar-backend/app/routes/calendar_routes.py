@@ -1,29 +1,56 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.models.event_models import EventCreate, EventResponse, EventUpdate
-from app.services.calendar_service import GoogleCalendarService
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Dict, Any
+from config.settings import settings
+from app.models.event_models import (
+    EventCreate, EventResponse, EventUpdate,
+    EventBatchCreate, EventBatchUpdate, EventBatchDelete, BatchItemResult, BatchResponse,
+    EventChange, ChangesResponse
+)
+from app.auth.dependencies import get_user_id, get_user_async_calendar_service
+from app.services.event_index import MAX_PAGE_SIZE, decode_cursor, owns_event
+from app.services.event_stream import NDJSON_MEDIA_TYPE, stream_events, wants_ndjson
+from app.services.change_tracking import (
+    CREATED, UPDATED, DELETED, Change, ChangeCursorExpired, etag_matches, get_change_tracker, record_changes
+)
+from app.services.change_broker import SSE_MEDIA_TYPE, change_message, get_change_broker
+from app.services.calendar_service import EventConflict
 from app.services.mock_firebase import get_firebase_service
+from app.services.async_io import AsyncGoogleCalendarService, get_async_firebase_service
+from app.services.recurrence import expand_events
 
 router = APIRouter(prefix="/calendar", tags=["calendar"])
 
-calendar_service = GoogleCalendarService()
 firebase_service = get_firebase_service()
+async_firebase_service = get_async_firebase_service(firebase_service)
 
 @router.post("/events", response_model=EventResponse)
-async def create_event(event: EventCreate):
+async def create_event(
+    event: EventCreate,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
     """Crea un evento en Google Calendar y Firebase"""
     try:
         # Convertir el evento a diccionario
-        event_data = event.dict()
+        event_data = event.dict(exclude_none=True)
+        event_data['user_id'] = user_id
         
         # Crear en Google Calendar
-        google_event_id = calendar_service.create_event(event_data)
+        google_event = await async_calendar_service.insert_event(
+            event_data,
+            event_data.get('calendar_id', 'primary')
+        )
         
-        # Agregar el ID de Google al evento
-        event_data['google_event_id'] = google_event_id
+        # Agregar el ID y el ETag de Google al evento
+        event_data['google_event_id'] = google_event['id']
+        event_data['google_etag'] = google_event['etag']
         
         # Crear en Firebase
-        firebase_id = firebase_service.create_event(event_data)
+        firebase_id = await async_firebase_service.create_event(event_data)
+        record_changes(user_id, [Change(CREATED, firebase_id, event_data)])
         
         # Preparar respuesta
         response_data = event_data.copy()
@@ -35,11 +62,281 @@ async def create_event(event: EventCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al crear evento: {str(e)}")
 
+def _check_batch_size(count: int):
+    if count > settings.MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Máximo {settings.MAX_BATCH_ITEMS} eventos por petición batch"
+        )
+
+async def _get_owned_events(event_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+    """Eventos del usuario por firebase_id (los ajenos o inexistentes se omiten)"""
+    unique_ids = list(dict.fromkeys(event_ids))
+    events = await asyncio.gather(*(async_firebase_service.get_event(event_id) for event_id in unique_ids))
+    return {
+        event_id: event
+        for event_id, event in zip(unique_ids, events)
+        if event and owns_event(event, user_id)
+    }
+
+def _batch_response(results: List[BatchItemResult]) -> BatchResponse:
+    return BatchResponse(success=all(result.success for result in results), results=results)
+
+@router.post("/events:batch", response_model=BatchResponse)
+async def create_events_batch(
+    batch: EventBatchCreate,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
+    """Crea varios eventos en Google Calendar y Firebase
+    
+    Los eventos se crean en Google con peticiones batch y en Firebase con
+    escrituras en lote. Retorna un resultado por evento, en el mismo orden.
+    """
+    _check_batch_size(len(batch.events))
+    
+    try:
+        events_data = []
+        for event in batch.events:
+            event_data = event.dict(exclude_none=True)
+            event_data['user_id'] = user_id
+            events_data.append(event_data)
+        
+        results = [None] * len(events_data)
+        google_results = await async_calendar_service.create_events_batch(events_data)
+        
+        created = []
+        for index, (event_data, google_result) in enumerate(zip(events_data, google_results)):
+            if google_result['error']:
+                results[index] = BatchItemResult(index=index, success=False, status=502, error=google_result['error'])
+                continue
+            event_data['google_event_id'] = google_result['google_event_id']
+            event_data['google_etag'] = google_result['google_etag']
+            created.append(index)
+        
+        firebase_results = await async_firebase_service.create_events([events_data[i] for i in created])
+        changes = []
+        for index, firebase_result in zip(created, firebase_results):
+            if firebase_result['error']:
+                results[index] = BatchItemResult(index=index, success=False, status=500, error=firebase_result['error'])
+                continue
+            firebase_id = firebase_result['firebase_id']
+            changes.append(Change(CREATED, firebase_id, events_data[index]))
+            response_data = {**events_data[index], 'id': firebase_id, 'firebase_id': firebase_id}
+            results[index] = BatchItemResult(
+                index=index, id=firebase_id, success=True, status=201, event=EventResponse(**response_data)
+            )
+        record_changes(user_id, changes)
+        
+        return _batch_response(results)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al crear eventos: {str(e)}")
+
+@router.post("/events:batchUpdate", response_model=BatchResponse)
+async def update_events_batch(
+    batch: EventBatchUpdate,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
+    """Actualiza varios eventos en Google Calendar y Firebase
+    
+    Como en PUT /events/{id}, a Google solo se envían los campos
+    modificados con el ETag almacenado como precondición (409 por evento
+    si cambió en Google). Retorna un resultado por evento, en el mismo orden.
+    """
+    _check_batch_size(len(batch.events))
+    
+    try:
+        current_events = await _get_owned_events([item.id for item in batch.events], user_id)
+        
+        results = [None] * len(batch.events)
+        updates: Dict[int, Dict[str, Any]] = {}
+        patches, patched = [], []
+        for index, item in enumerate(batch.events):
+            current_event = current_events.get(item.id)
+            if current_event is None:
+                results[index] = BatchItemResult(index=index, id=item.id, success=False, status=404, error="Evento no encontrado")
+                continue
+            
+            update_data = item.dict(exclude_unset=True, exclude={'id'})
+            updates[index] = update_data
+            if current_event.get('google_event_id') and update_data:
+                patches.append({
+                    'google_event_id': current_event['google_event_id'],
+                    'update_data': update_data,
+                    'etag': current_event.get('google_etag'),
+                    'calendar_id': current_event.get('calendar_id'),
+                })
+                patched.append(index)
+        
+        # Actualizar en Google Calendar con peticiones batch
+        google_results = await async_calendar_service.patch_events_batch(patches) if patches else []
+        for index, google_result in zip(patched, google_results):
+            if google_result['error']:
+                status = 409 if google_result['conflict'] else 502
+                results[index] = BatchItemResult(
+                    index=index, id=batch.events[index].id, success=False, status=status, error=google_result['error']
+                )
+                del updates[index]
+            elif google_result['google_etag']:
+                updates[index]['google_etag'] = google_result['google_etag']
+        
+        # Actualizar en Firebase con escrituras en lote (un id repetido se combina)
+        firebase_updates: Dict[str, Dict[str, Any]] = {}
+        for index, update_data in updates.items():
+            firebase_updates.setdefault(batch.events[index].id, {}).update(update_data)
+        changed = {event_id: update_data for event_id, update_data in firebase_updates.items() if update_data}
+        update_errors = await async_firebase_service.update_events(changed) if changed else {}
+        record_changes(user_id, [
+            Change(UPDATED, event_id, {**current_events[event_id], **update_data}, current_events[event_id])
+            for event_id, update_data in changed.items() if not update_errors.get(event_id)
+        ])
+        
+        for index, update_data in updates.items():
+            event_id = batch.events[index].id
+            error = update_errors.get(event_id)
+            if error:
+                results[index] = BatchItemResult(index=index, id=event_id, success=False, status=500, error=error)
+                continue
+            response_data = {**current_events[event_id], **firebase_updates[event_id], 'id': event_id}
+            results[index] = BatchItemResult(
+                index=index, id=event_id, success=True, status=200, event=EventResponse(**response_data)
+            )
+        
+        return _batch_response(results)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al actualizar eventos: {str(e)}")
+
+@router.post("/events:batchDelete", response_model=BatchResponse)
+async def delete_events_batch(
+    batch: EventBatchDelete,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
+    """Elimina varios eventos de Google Calendar y Firebase
+    
+    Un evento solo se elimina de Firebase si se eliminó de Google (o ya no
+    existía allí). Retorna un resultado por id, en el mismo orden.
+    """
+    _check_batch_size(len(batch.ids))
+    
+    try:
+        current_events = await _get_owned_events(batch.ids, user_id)
+        
+        # Eliminar de Google Calendar con peticiones batch
+        in_google = [
+            event_id for event_id, event in current_events.items()
+            if event.get('google_event_id')
+        ]
+        google_errors = await async_calendar_service.delete_events_batch([
+            (current_events[event_id]['google_event_id'], current_events[event_id].get('calendar_id'))
+            for event_id in in_google
+        ]) if in_google else []
+        errors = dict(zip(in_google, google_errors))
+        
+        # Eliminar de Firebase con escrituras en lote
+        to_delete = [event_id for event_id in current_events if not errors.get(event_id)]
+        delete_errors = await async_firebase_service.delete_events(to_delete) if to_delete else {}
+        record_changes(user_id, [
+            Change(DELETED, event_id, current_events[event_id])
+            for event_id in to_delete if not delete_errors.get(event_id)
+        ])
+        
+        results = []
+        for index, event_id in enumerate(batch.ids):
+            if event_id not in current_events:
+                results.append(BatchItemResult(index=index, id=event_id, success=False, status=404, error="Evento no encontrado"))
+            elif errors.get(event_id):
+                results.append(BatchItemResult(index=index, id=event_id, success=False, status=502, error=errors[event_id]))
+            elif delete_errors.get(event_id):
+                results.append(BatchItemResult(index=index, id=event_id, success=False, status=500, error=delete_errors[event_id]))
+            else:
+                results.append(BatchItemResult(index=index, id=event_id, success=True, status=200))
+        
+        return _batch_response(results)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al eliminar eventos: {str(e)}")
+
 @router.get("/events", response_model=List[EventResponse])
-async def get_events():
-    """Obtiene todos los eventos de Firebase"""
+async def get_events(
+    response: Response,
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    event_type: Optional[str] = Query(None, alias="type"),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id)
+):
+    """Obtiene los eventos del usuario en Firebase
+    
+    Filtra por fecha de inicio en [from, to) y por tipo. Con limit los
+    eventos se paginan: el cursor de la siguiente página viaja en la
+    cabecera X-Next-Cursor. Una serie recurrente es un solo documento con la
+    fecha de su primera ocurrencia: para mostrar un rango con sus
+    repeticiones usa GET /occurrences.
+    
+    Con Accept: application/x-ndjson o stream=true la respuesta es NDJSON
+    (un evento por línea) enviada página por página; limit acota entonces
+    el total de eventos enviados.
+    
+    La respuesta lleva un ETag con la versión de los cambios de la ventana
+    consultada; con If-None-Match igual se responde 304 sin cuerpo. La
+    versión es la del registro de cambios del proceso: solo cubre las
+    escrituras hechas a través de esta API.
+    """
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    ndjson = stream or wants_ndjson(accept)
+    # Versión leída antes de consultar: un cambio concurrente invalida el ETag
+    etag = get_change_tracker().etag(
+        user_id, from_date, to_date, scope=(event_type, limit, cursor, ndjson)
+    )
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    
+    if ndjson:
+        async def fetch_page(page_size, page_cursor):
+            return await async_firebase_service.query_events(
+                user_id=user_id,
+                date_from=from_date,
+                date_to=to_date,
+                event_type=event_type,
+                limit=page_size,
+                cursor=page_cursor
+            )
+        
+        return StreamingResponse(
+            stream_events(fetch_page, settings.STREAM_PAGE_SIZE, limit, cursor),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers={'ETag': etag}
+        )
+    
+    if limit is not None and limit > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=422, detail=f"limit no puede superar {MAX_PAGE_SIZE}")
+    
     try:
-        events = firebase_service.get_all_events()
+        events, next_cursor = await async_firebase_service.query_events(
+            user_id=user_id,
+            date_from=from_date,
+            date_to=to_date,
+            event_type=event_type,
+            limit=limit,
+            cursor=cursor
+        )
+        
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['ETag'] = etag
         
         response_events = []
         for event in events:
@@ -51,34 +348,175 @@ async def get_events():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener eventos: {str(e)}")
 
+@router.get("/changes", response_model=ChangesResponse)
+async def get_changes(
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: str = Depends(get_user_id)
+):
+    """Eventos creados, actualizados o eliminados desde el cursor
+    
+    Cada evento aparece una vez con su estado actual; los eliminados llegan
+    como tombstones (kind 'deleted' sin evento). Sin since solo se retorna
+    el cursor actual, que el cliente guarda antes de su carga completa. Un
+    cursor demasiado antiguo, o emitido antes de reiniciar el servidor,
+    recibe 410 y requiere volver a cargar todo. Solo aparecen las escrituras
+    hechas a través de esta API.
+    """
+    tracker = get_change_tracker()
+    try:
+        since_version = tracker.decode_cursor(since) if since else None
+        changes, next_version, has_more = tracker.changes_since(user_id, since_version, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ChangeCursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    
+    try:
+        upserted = [firebase_id for _, kind, firebase_id in changes if kind != DELETED]
+        current_events = await _get_owned_events(upserted, user_id) if upserted else {}
+        
+        response_changes = []
+        for version, kind, firebase_id in changes:
+            event = current_events.get(firebase_id)
+            if kind == DELETED or event is None:
+                response_changes.append(EventChange(id=firebase_id, kind=DELETED, version=version))
+                continue
+            event['id'] = firebase_id
+            response_changes.append(EventChange(id=firebase_id, kind=kind, version=version, event=EventResponse(**event)))
+        
+        return ChangesResponse(
+            changes=response_changes,
+            cursor=tracker.encode_cursor(next_version),
+            has_more=has_more
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener cambios: {str(e)}")
+
+@router.get("/stream")
+async def stream_changes(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = None,
+    user_id: str = Depends(get_user_id)
+):
+    """Cambios de los eventos en vivo como Server-Sent Events
+    
+    Cada cambio se envía como un evento 'created', 'updated' o 'deleted'
+    con el mismo cursor que GET /changes como id. Al reconectar, el cliente
+    reenvía Last-Event-ID (o since) y recibe primero lo que se perdió. Si el
+    cursor venció o el cliente se atrasó demasiado recibe un evento 'resync'
+    y debe ponerse al día con GET /changes.
+    """
+    tracker = get_change_tracker()
+    broker = get_change_broker()
+    cursor = last_event_id or since
+    
+    # Suscribirse antes del replay para no perder cambios intermedios
+    subscription = broker.subscribe(user_id)
+    replay = []
+    resync = False
+    try:
+        if cursor:
+            changes, _, has_more = tracker.changes_since(user_id, tracker.decode_cursor(cursor), MAX_PAGE_SIZE)
+            upserted = [firebase_id for _, kind, firebase_id in changes if kind != DELETED]
+            current_events = await _get_owned_events(upserted, user_id) if upserted else {}
+            for version, kind, firebase_id in changes:
+                event = current_events.get(firebase_id)
+                replay.append(change_message(version, kind if event is not None else DELETED, firebase_id, event))
+            resync = has_more
+    except ValueError as e:
+        broker.unsubscribe(subscription)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ChangeCursorExpired:
+        resync = True
+    except Exception as e:
+        broker.unsubscribe(subscription)
+        raise HTTPException(status_code=500, detail=f"Error al obtener cambios: {str(e)}")
+    
+    return StreamingResponse(
+        broker.stream(subscription, replay, request.is_disconnected, resync=resync),
+        media_type=SSE_MEDIA_TYPE,
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@router.get("/occurrences", response_model=List[EventResponse])
+async def get_occurrences(
+    response: Response,
+    from_date: datetime = Query(..., alias="from"),
+    to_date: datetime = Query(..., alias="to"),
+    if_none_match: Optional[str] = Header(None),
+    user_id: str = Depends(get_user_id)
+):
+    """Obtiene los eventos del rango, expandiendo localmente las series recurrentes
+    
+    Una serie puede tener ocurrencias en cualquier ventana, así que el ETag
+    usa la versión de todos los eventos del usuario.
+    """
+    if to_date < from_date:
+        raise HTTPException(status_code=400, detail="'to' debe ser posterior a 'from'")
+    
+    etag = get_change_tracker().etag(user_id, scope=('occurrences', from_date, to_date))
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    response.headers['ETag'] = etag
+    
+    try:
+        # Solo los eventos del usuario que solapan la ventana y sus series
+        events = await async_firebase_service.find_overlapping(from_date, to_date, user_id)
+        
+        response_events = []
+        for event in expand_events(events, from_date, to_date):
+            if event.get('series_id'):
+                event['id'] = f"{event['series_id']}_{event['original_start']}"
+            else:
+                event['id'] = event.get('firebase_id', '')
+            response_events.append(EventResponse(**event))
+        
+        return response_events
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener ocurrencias: {str(e)}")
+
 @router.put("/events/{event_id}", response_model=EventResponse)
-async def update_event(event_id: str, event_update: EventUpdate):
+async def update_event(
+    event_id: str,
+    event_update: EventUpdate,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
     """Actualiza un evento en Google Calendar y Firebase"""
     try:
         # Obtener el evento actual de Firebase
-        events = firebase_service.get_all_events()
-        current_event = None
-        
-        for event in events:
-            if event.get('firebase_id') == event_id:
-                current_event = event
-                break
+        current_event = await async_firebase_service.get_event(event_id)
         
-        if not current_event:
+        if not current_event or not owns_event(current_event, user_id):
             raise HTTPException(status_code=404, detail="Evento no encontrado")
         
         # Preparar datos actualizados
         update_data = event_update.dict(exclude_unset=True)
         
-        # Actualizar en Google Calendar si tiene ID de Google
+        # Actualizar en Google Calendar si tiene ID de Google, enviando solo
+        # los campos modificados y el ETag almacenado como precondición
         google_event_id = current_event.get('google_event_id')
-        if google_event_id:
-            # Combinar datos actuales con actualizaciones
-            updated_data = {**current_event, **update_data}
-            calendar_service.update_event(google_event_id, updated_data)
+        if google_event_id and update_data:
+            try:
+                new_etag = await async_calendar_service.patch_event(
+                    google_event_id,
+                    update_data,
+                    etag=current_event.get('google_etag'),
+                    calendar_id=current_event.get('calendar_id') or 'primary'
+                )
+            except EventConflict as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            
+            if new_etag:
+                update_data['google_etag'] = new_etag
         
         # Actualizar en Firebase
-        firebase_service.update_event(event_id, update_data)
+        if await async_firebase_service.update_event(event_id, update_data):
+            record_changes(user_id, [Change(UPDATED, event_id, {**current_event, **update_data}, current_event)])
         
         # Preparar respuesta
         response_data = {**current_event, **update_data}
@@ -92,28 +530,30 @@ async def update_event(event_id: str, event_update: EventUpdate):
         raise HTTPException(status_code=500, detail=f"Error al actualizar evento: {str(e)}")
 
 @router.delete("/events/{event_id}")
-async def delete_event(event_id: str):
+async def delete_event(
+    event_id: str,
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
     """Elimina un evento de Google Calendar y Firebase"""
     try:
         # Obtener el evento actual de Firebase
-        events = firebase_service.get_all_events()
-        current_event = None
-        
-        for event in events:
-            if event.get('firebase_id') == event_id:
-                current_event = event
-                break
+        current_event = await async_firebase_service.get_event(event_id)
         
-        if not current_event:
+        if not current_event or not owns_event(current_event, user_id):
             raise HTTPException(status_code=404, detail="Evento no encontrado")
         
         # Eliminar de Google Calendar si tiene ID de Google
         google_event_id = current_event.get('google_event_id')
         if google_event_id:
-            calendar_service.delete_event(google_event_id)
+            await async_calendar_service.delete_event(
+                google_event_id,
+                current_event.get('calendar_id') or 'primary'
+            )
         
         # Eliminar de Firebase
-        firebase_service.delete_event(event_id)
+        if await async_firebase_service.delete_event(event_id):
+            record_changes(user_id, [Change(DELETED, event_id, current_event)])
         
         return {
             "success": True,
@@ -1,45 +1,167 @@
-from fastapi import APIRouter, HTTPException
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from config.settings import settings
+from app.auth.dependencies import get_user_id, get_user_async_calendar_service
 from app.models.event_models import SyncResponse
 from app.services.calendar_service import GoogleCalendarService
+from app.services.delta_sync import DeltaSyncEngine
+from app.services.watch_channels import WatchChannelManager
+from app.services.rate_limiter import get_quota_limiter
+from app.services.recurrence import (
+    RECURRENCE_FIELDS,
+    exception_from_google,
+    is_series_exception,
+    series_exception_updates
+)
 from app.services.mock_firebase import get_firebase_service
+from app.services.change_tracking import CREATED, UPDATED, Change, record_changes
+from app.services.async_io import (
+    AsyncServiceAdapter,
+    AsyncGoogleCalendarService,
+    get_async_firebase_service
+)
 
 router = APIRouter(prefix="/sync", tags=["synchronization"])
 
-calendar_service = GoogleCalendarService()
 firebase_service = get_firebase_service()
+async_firebase_service = get_async_firebase_service(firebase_service)
 
-@router.post("/import-from-google", response_model=SyncResponse)
-async def import_events_from_google():
-    """Importa todos los eventos de Google Calendar a Firebase"""
+def get_delta_sync_engine(user_id: str) -> DeltaSyncEngine:
+    """Motor de sincronización incremental con el Calendar y los syncToken del usuario"""
+    return DeltaSyncEngine(GoogleCalendarService(user_id), firebase_service)
+
+watch_channel_manager = WatchChannelManager(get_delta_sync_engine)
+async_watch_channel_manager = AsyncServiceAdapter(watch_channel_manager)
+
+# Eventos de Google que se concilian contra Firebase en una sola consulta
+IMPORT_BATCH_SIZE = 250
+
+async def _import_events_batch(calendar_service, batch, errors) -> int:
+    """Crea en Firebase, con escrituras en lote, los eventos del lote que todavía no existen"""
+    existing_events = await async_firebase_service.find_events_by_google_ids(
+        [google_event.get('id') for _, google_event in batch],
+        calendar_service.user_id
+    )
+    
+    new_events = []
+    for calendar_id, google_event in batch:
+        try:
+            if google_event.get('id') in existing_events:
+                continue
+            # Convertir formato de Google a formato interno
+            new_events.append(calendar_service._convert_from_google_format(google_event, calendar_id))
+        except Exception as e:
+            error_msg = f"Error al procesar evento {google_event.get('summary', 'Sin título')}: {str(e)}"
+            errors.append(error_msg)
+            print(error_msg)
+    
+    if not new_events:
+        return 0
+    
+    changes = []
+    for event_data, result in zip(new_events, await async_firebase_service.create_events(new_events)):
+        if result['error']:
+            error_msg = f"Error al importar evento {event_data.get('title', 'Sin título')}: {result['error']}"
+            errors.append(error_msg)
+            print(error_msg)
+        else:
+            changes.append(Change(CREATED, result['firebase_id'], event_data))
+    record_changes(calendar_service.user_id, changes)
+    
+    imported = len(changes)
+    
+    print(f"Lote importado: {imported} eventos nuevos de {len(batch)}")
+    return imported
+
+@router.get("/calendars")
+async def list_google_calendars(
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
+    """Lista los calendarios de Google del usuario"""
     try:
-        # Obtener eventos de Google Calendar
-        google_events = calendar_service.list_events()
+        calendars = await async_calendar_service.list_calendars()
         
+        response = []
+        for calendar in calendars:
+            is_primary = calendar.get('primary', False)
+            response.append({
+                "id": calendar.get('id'),
+                "summary": calendar.get('summary'),
+                "primary": is_primary,
+                "access_role": calendar.get('accessRole'),
+                "time_zone": calendar.get('timeZone'),
+                "synced": calendar.get('id') in settings.SYNC_CALENDAR_IDS
+                          or (is_primary and 'primary' in settings.SYNC_CALENDAR_IDS)
+            })
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener calendarios: {str(e)}")
+
+@router.post("/import-from-google", response_model=SyncResponse)
+async def import_events_from_google(
+    calendar_ids: Optional[List[str]] = Query(None),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
+    """Importa los eventos de los calendarios de Google elegidos a Firebase
+    
+    Los calendarios se leen en paralelo y sus eventos se procesan en un solo
+    flujo, a medida que llegan sus páginas.
+    """
+    try:
+        calendar_service = async_calendar_service.sync
         events_synced = 0
         errors = []
+        # Instancias modificadas o canceladas agrupadas por serie
+        series_exceptions = {}
+        # Eventos pendientes de conciliar con Firebase
+        batch = []
         
-        for google_event in google_events:
+        # Procesar los eventos de Google Calendar a medida que llegan las páginas.
+        # Las series llegan una sola vez (maestro + excepciones) y se expanden
+        # localmente al consultarlas
+        async for calendar_id, google_event in async_calendar_service.iter_calendars_events(
+            calendar_ids or settings.SYNC_CALENDAR_IDS,
+            extra_fields=RECURRENCE_FIELDS,
+            single_events=False
+        ):
             try:
-                # Convertir formato de Google a formato interno
-                event_data = calendar_service._convert_from_google_format(google_event)
-                
-                # Verificar si el evento ya existe en Firebase
-                existing_event = firebase_service.find_event_by_google_id(
-                    google_event.get('id')
-                )
-                
-                if not existing_event:
-                    # Crear nuevo evento en Firebase
-                    firebase_id = firebase_service.create_event(event_data)
-                    events_synced += 1
-                    print(f"Evento importado: {event_data.get('title')} -> {firebase_id}")
-                else:
-                    print(f"Evento ya existe: {event_data.get('title')}")
-                    
+                if is_series_exception(google_event):
+                    key, override = exception_from_google(calendar_service, google_event)
+                    series_exceptions.setdefault(google_event['recurringEventId'], {})[key] = override
+                    continue
+                if google_event.get('status') == 'cancelled':
+                    continue
             except Exception as e:
                 error_msg = f"Error al procesar evento {google_event.get('summary', 'Sin título')}: {str(e)}"
                 errors.append(error_msg)
                 print(error_msg)
+                continue
+            
+            batch.append((calendar_id, google_event))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                events_synced += await _import_events_batch(calendar_service, batch, errors)
+                batch = []
+        
+        if batch:
+            events_synced += await _import_events_batch(calendar_service, batch, errors)
+        
+        # Guardar las excepciones dentro de sus series
+        series_events = await async_firebase_service.find_events_by_google_ids(
+            list(series_exceptions), calendar_service.user_id
+        )
+        series_by_id = {series['firebase_id']: series for series in series_events.values()}
+        series_updates = series_exception_updates(series_events, series_exceptions)
+        if series_updates:
+            changes = []
+            for firebase_id, error in (await async_firebase_service.update_events(series_updates)).items():
+                if error:
+                    error_msg = f"Error al guardar excepciones de la serie {firebase_id}: {error}"
+                    errors.append(error_msg)
+                    print(error_msg)
+                else:
+                    series = series_by_id[firebase_id]
+                    changes.append(Change(UPDATED, firebase_id, {**series, **series_updates[firebase_id]}, series))
+            record_changes(calendar_service.user_id, changes)
         
         return SyncResponse(
             success=True,
@@ -56,36 +178,150 @@ async def import_events_from_google():
             errors=[str(e)]
         )
 
+@router.post("/incremental-from-google", response_model=SyncResponse)
+async def incremental_import_from_google(
+    calendar_ids: Optional[List[str]] = Query(None),
+    user_id: str = Depends(get_user_id)
+):
+    """Importa solo los cambios de Google Calendar desde la última sincronización"""
+    try:
+        async_delta_sync_engine = AsyncServiceAdapter(get_delta_sync_engine(user_id))
+        result = await async_delta_sync_engine.run_many(calendar_ids or settings.SYNC_CALENDAR_IDS)
+        
+        events_synced = result['created'] + result['updated'] + result['deleted']
+        mode = "completa" if result['full_resync'] else "incremental"
+        
+        return SyncResponse(
+            success=True,
+            message=(
+                f"Sincronización {mode} completada. {result['created']} creados, "
+                f"{result['updated']} actualizados, {result['deleted']} eliminados."
+            ),
+            events_synced=events_synced,
+            errors=result['errors']
+        )
+        
+    except Exception as e:
+        return SyncResponse(
+            success=False,
+            message=f"Error en la sincronización incremental: {str(e)}",
+            events_synced=0,
+            errors=[str(e)]
+        )
+
+@router.post("/watch")
+async def register_watch_channel(calendar_id: str = 'primary', user_id: str = Depends(get_user_id)):
+    """Registra un canal de notificaciones push para un calendario"""
+    try:
+        channel = await async_watch_channel_manager.register(calendar_id, user_id)
+        return {
+            "success": True,
+            "channel_id": channel['id'],
+            "calendar_id": channel['calendar_id'],
+            "expiration": channel['expiration']
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al registrar el canal: {str(e)}")
+
+@router.get("/watch")
+async def list_watch_channels(user_id: str = Depends(get_user_id)):
+    """Lista los canales de notificaciones activos del usuario"""
+    channels = await async_watch_channel_manager.list_channels(user_id)
+    return [
+        {
+            "channel_id": channel_id,
+            "calendar_id": channel['calendar_id'],
+            "expiration": channel['expiration']
+        }
+        for channel_id, channel in channels.items()
+    ]
+
+@router.delete("/watch/{channel_id}")
+async def stop_watch_channel(channel_id: str, user_id: str = Depends(get_user_id)):
+    """Detiene un canal de notificaciones"""
+    if not await async_watch_channel_manager.stop(channel_id, user_id):
+        raise HTTPException(status_code=404, detail="Canal no encontrado")
+    return {
+        "success": True,
+        "message": "Canal detenido exitosamente"
+    }
+
+@router.post("/webhook")
+async def google_calendar_webhook(
+    x_goog_channel_id: str = Header(...),
+    x_goog_resource_state: str = Header(...),
+    x_goog_channel_token: Optional[str] = Header(None)
+):
+    """Recibe los avisos de cambios de Google Calendar
+    
+    Responde de inmediato; la sincronización incremental del calendario
+    afectado se ejecuta en segundo plano tras agrupar los avisos.
+    """
+    accepted = watch_channel_manager.handle_notification(
+        x_goog_channel_id,
+        x_goog_resource_state,
+        x_goog_channel_token
+    )
+    if not accepted:
+        raise HTTPException(status_code=404, detail="Canal desconocido")
+    return Response(status_code=200)
+
+async def _events_without_google_id(user_id: str) -> List[Dict[str, Any]]:
+    """Eventos del usuario sin ID de Google, leídos por páginas con su consulta indexada"""
+    events, cursor = [], None
+    while True:
+        page, cursor = await async_firebase_service.query_events(
+            user_id=user_id, limit=settings.STREAM_PAGE_SIZE, cursor=cursor
+        )
+        events.extend(event for event in page if not event.get('google_event_id'))
+        if not cursor:
+            return events
+
 @router.post("/sync-to-google", response_model=SyncResponse)
-async def sync_firebase_to_google():
+async def sync_firebase_to_google(
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
     """Sincroniza eventos de Firebase que no están en Google Calendar"""
     try:
-        # Obtener eventos de Firebase
-        firebase_events = firebase_service.get_all_events()
+        # Obtener eventos del usuario en Firebase que no tienen ID de Google
+        firebase_events = await _events_without_google_id(user_id)
         
         events_synced = 0
         errors = []
         
-        for firebase_event in firebase_events:
-            try:
-                # Solo sincronizar eventos que no tienen ID de Google
-                if not firebase_event.get('google_event_id'):
-                    # Crear en Google Calendar
-                    google_event_id = calendar_service.create_event(firebase_event)
-                    
-                    # Actualizar Firebase con el ID de Google
-                    firebase_service.add_google_id_to_event(
-                        firebase_event.get('firebase_id'),
-                        google_event_id
-                    )
-                    
-                    events_synced += 1
-                    print(f"Evento sincronizado a Google: {firebase_event.get('title')}")
-                    
-            except Exception as e:
-                error_msg = f"Error al sincronizar evento {firebase_event.get('title', 'Sin título')}: {str(e)}"
+        # Crear en Google Calendar con peticiones batch
+        results = await async_calendar_service.create_events_batch(firebase_events)
+        
+        google_ids = {}
+        for firebase_event, result in zip(firebase_events, results):
+            if result['error']:
+                error_msg = f"Error al sincronizar evento {firebase_event.get('title', 'Sin título')}: {result['error']}"
                 errors.append(error_msg)
                 print(error_msg)
+            else:
+                google_ids[firebase_event.get('firebase_id')] = {
+                    'google_event_id': result['google_event_id'],
+                    'google_etag': result['google_etag']
+                }
+        
+        # Actualizar Firebase con los IDs de Google en lote
+        if google_ids:
+            update_errors = await async_firebase_service.update_events(google_ids)
+            changes = []
+            for firebase_event in firebase_events:
+                firebase_id = firebase_event.get('firebase_id')
+                if firebase_id not in google_ids:
+                    continue
+                if update_errors.get(firebase_id) is None:
+                    events_synced += 1
+                    changes.append(Change(UPDATED, firebase_id, {**firebase_event, **google_ids[firebase_id]}, firebase_event))
+                    print(f"Evento sincronizado a Google: {firebase_event.get('title')}")
+                else:
+                    error_msg = f"Error al guardar el ID de Google del evento {firebase_event.get('title', 'Sin título')}: {update_errors[firebase_id]}"
+                    errors.append(error_msg)
+                    print(error_msg)
+            record_changes(user_id, changes)
         
         return SyncResponse(
             success=True,
@@ -102,15 +338,29 @@ async def sync_firebase_to_google():
             errors=[str(e)]
         )
 
+@router.get("/quota")
+async def quota_metrics(user_id: str = Depends(get_user_id)):
+    """Presupuesto restante del usuario y del proyecto en el limitador de cuota de Google"""
+    return get_quota_limiter().metrics(user_id)
+
 @router.post("/full-sync", response_model=SyncResponse)
-async def full_synchronization():
+async def full_synchronization(
+    user_id: str = Depends(get_user_id),
+    async_calendar_service: AsyncGoogleCalendarService = Depends(get_user_async_calendar_service)
+):
     """Realiza una sincronización completa bidireccional"""
     try:
         # Primero importar de Google Calendar
-        import_result = await import_events_from_google()
+        import_result = await import_events_from_google(
+            calendar_ids=None,
+            async_calendar_service=async_calendar_service
+        )
         
         # Luego sincronizar a Google Calendar
-        sync_result = await sync_firebase_to_google()
+        sync_result = await sync_firebase_to_google(
+            user_id=user_id,
+            async_calendar_service=async_calendar_service
+        )
         
         total_synced = import_result.events_synced + sync_result.events_synced
         all_errors = import_result.errors + sync_result.errors
@@ -0,0 +1,528 @@
+"""
+Capa de E/S asíncrona para las rutas.
+
+Las llamadas a Google Calendar usan un cliente httpx compartido con pool de
+conexiones y Firestore usa su cliente asíncrono. Cualquier otro método de
+los servicios síncronos tiene una contraparte awaitable que se ejecuta en el
+threadpool, de modo que nunca se bloquea el event loop.
+"""
+import asyncio
+from typing import List, Dict, Any, Optional, AsyncIterator, Sequence, Tuple
+from urllib.parse import quote
+
+import httplib2
+import httpx
+from googleapiclient.errors import HttpError
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import settings
+from app.services.calendar_service import (
+    EventConflict,
+    SyncTokenExpired,
+    CALENDAR_LIST_FIELDS,
+    WRITE_RESPONSE_FIELDS,
+    event_fields
+)
+from app.services.firebase_sync import (
+    FIRESTORE_IN_QUERY_LIMIT,
+    build_events_query,
+    build_overlap_queries,
+    events_page,
+    normalize_dates,
+    overlapping_events
+)
+
+GOOGLE_CALENDAR_API_URL = "https://www.googleapis.com/calendar/v3"
+
+# Google solo comprime la respuesta si el User-Agent contiene "gzip"
+GOOGLE_API_HEADERS = {
+    'Accept-Encoding': 'gzip',
+    'User-Agent': 'google-calendar-backend/1.0 (gzip)',
+}
+
+# Marca de fin de un calendario en la lectura de varios calendarios
+_END_OF_CALENDAR = object()
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Retorna el cliente httpx compartido por el proceso"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=GOOGLE_CALENDAR_API_URL,
+            headers=GOOGLE_API_HEADERS,
+            timeout=settings.GOOGLE_ASYNC_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.GOOGLE_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GOOGLE_ASYNC_MAX_CONNECTIONS
+            )
+        )
+    return _http_client
+
+
+async def close_async_http_client():
+    """Cierra el cliente httpx compartido"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class AsyncServiceAdapter:
+    """Expone los métodos públicos de un servicio síncrono como corutinas
+
+    Los métodos sin implementación nativa se ejecutan en el threadpool.
+    """
+
+    def __init__(self, service):
+        self.sync = service
+
+    def __getattr__(self, name):
+        attribute = getattr(self.sync, name)
+        if name.startswith('_') or not callable(attribute):
+            return attribute
+
+        async def call_in_threadpool(*args, **kwargs):
+            return await run_in_threadpool(attribute, *args, **kwargs)
+
+        return call_in_threadpool
+
+
+class AsyncGoogleCalendarService(AsyncServiceAdapter):
+    """Contraparte asíncrona de GoogleCalendarService basada en httpx"""
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        # Leer/refrescar credenciales puede tocar disco y red
+        credentials, _ = await run_in_threadpool(self.sync.client.get_credentials)
+        return {'Authorization': f'Bearer {credentials.token}'}
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        async def send():
+            request_headers = await self._auth_headers()
+            if headers:
+                request_headers.update(headers)
+
+            response = await get_async_http_client().request(
+                method, path, params=params, json=json, headers=request_headers
+            )
+
+            if response.status_code >= 400:
+                # Mismo tipo de error que googleapiclient para un manejo uniforme
+                raise HttpError(
+                    httplib2.Response({'status': response.status_code, **response.headers}),
+                    response.content,
+                    uri=str(response.url)
+                )
+
+            if response.status_code == 204 or not response.content:
+                return {}
+            return response.json()
+
+        client = self.sync.client
+        return await client.limiter.call_async(send, user_id=client.user_id)
+
+    def _events_path(self, calendar_id: str = 'primary', event_id: Optional[str] = None) -> str:
+        path = f"/calendars/{quote(calendar_id, safe='')}/events"
+        if event_id:
+            path += f"/{quote(event_id, safe='')}"
+        return path
+
+    async def _iter_pages(
+        self,
+        params: Dict[str, Any],
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        calendar_id = params.pop('calendarId')
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+
+            if semaphore is None:
+                page = await self._request('GET', self._events_path(calendar_id), params=params)
+            else:
+                async with semaphore:
+                    page = await self._request('GET', self._events_path(calendar_id), params=params)
+            yield page
+
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+
+    async def list_calendars(self) -> List[Dict[str, Any]]:
+        """Lista los calendarios del usuario (calendarList)"""
+        params = {'fields': CALENDAR_LIST_FIELDS}
+        calendars = []
+        while True:
+            result = await self._request('GET', '/users/me/calendarList', params=params)
+            calendars.extend(result.get('items', []))
+
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+            params['pageToken'] = page_token
+
+        return calendars
+
+    async def iter_events(
+        self,
+        page_size: int = 250,
+        time_min=None,
+        time_max=None,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary',
+        semaphore: Optional[asyncio.Semaphore] = None,
+        single_events: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Itera los eventos de un calendario a medida que llegan las páginas"""
+        params = self.sync._events_list_params(
+            page_size, time_min, time_max, extra_fields, calendar_id, single_events
+        )
+        async for page in self._iter_pages(params, semaphore):
+            for google_event in page.get('items', []):
+                yield google_event
+
+    async def iter_calendars_events(
+        self,
+        calendar_ids: Sequence[str],
+        page_size: int = 250,
+        time_min=None,
+        time_max=None,
+        extra_fields: Sequence[str] = (),
+        max_concurrency: Optional[int] = None,
+        single_events: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Lee varios calendarios en paralelo en un solo flujo
+
+        Cada calendario se pagina en su propia tarea; como máximo
+        max_concurrency peticiones están en vuelo a la vez. Los eventos se
+        entregan como tuplas (calendar_id, evento) en el orden en que llegan
+        sus páginas, sin ordenar entre calendarios (con single_events=False
+        Google tampoco los ordena dentro de un calendario).
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or settings.CALENDAR_FANOUT_CONCURRENCY)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=page_size)
+
+        async def produce(calendar_id: str):
+            try:
+                async for google_event in self.iter_events(
+                    page_size=page_size,
+                    time_min=time_min,
+                    time_max=time_max,
+                    extra_fields=extra_fields,
+                    calendar_id=calendar_id,
+                    semaphore=semaphore,
+                    single_events=single_events
+                ):
+                    await queue.put((calendar_id, google_event))
+                await queue.put(_END_OF_CALENDAR)
+            except Exception as e:
+                await queue.put(e)
+
+        tasks = [asyncio.create_task(produce(calendar_id)) for calendar_id in dict.fromkeys(calendar_ids)]
+        try:
+            pending = len(tasks)
+            while pending:
+                item = await queue.get()
+                if item is _END_OF_CALENDAR:
+                    pending -= 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iter_event_pages(
+        self,
+        sync_token: Optional[str] = None,
+        calendar_id: str = 'primary',
+        page_size: int = 250,
+        extra_fields: Sequence[str] = ()
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Itera las páginas de cambios de un calendario (ver iter_event_pages síncrono)"""
+        params = self.sync._changes_list_params(sync_token, calendar_id, page_size, extra_fields)
+        try:
+            async for page in self._iter_pages(params):
+                yield page
+        except HttpError as error:
+            if error.resp.status == 410:
+                raise SyncTokenExpired(str(error))
+            raise
+
+    async def list_events(
+        self,
+        max_results: Optional[int] = None,
+        time_min=None,
+        time_max=None,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary'
+    ) -> List[Dict[str, Any]]:
+        """Obtiene los eventos de un calendario (todas las páginas)"""
+        events = []
+        try:
+            async for google_event in self.iter_events(
+                time_min=time_min,
+                time_max=time_max,
+                extra_fields=extra_fields,
+                calendar_id=calendar_id
+            ):
+                events.append(google_event)
+                if max_results is not None and len(events) >= max_results:
+                    break
+            return events
+
+        except HttpError as error:
+            print(f'Error al obtener eventos de Google Calendar: {error}')
+            return []
+
+    async def get_event(
+        self,
+        google_event_id: str,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary'
+    ) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento de Google Calendar con la proyección de campos por defecto"""
+        try:
+            return await self._request(
+                'GET',
+                self._events_path(calendar_id, google_event_id),
+                params={'fields': event_fields(extra_fields)}
+            )
+
+        except HttpError as error:
+            print(f'Error al obtener evento de Google Calendar: {error}')
+            return None
+
+    async def insert_event(self, event_data: Dict[str, Any], calendar_id: str = 'primary') -> Dict[str, Any]:
+        """Crea un evento en Google Calendar y retorna su 'id' y 'etag'"""
+        try:
+            event = await self._request(
+                'POST',
+                self._events_path(calendar_id),
+                params={'fields': WRITE_RESPONSE_FIELDS},
+                json=self.sync._convert_to_google_format(event_data)
+            )
+            return {'id': event.get('id'), 'etag': event.get('etag')}
+
+        except HttpError as error:
+            print(f'Error al crear evento en Google Calendar: {error}')
+            raise Exception(f'No se pudo crear el evento: {error}')
+
+    async def create_event(self, event_data: Dict[str, Any], calendar_id: str = 'primary') -> str:
+        """Crea un evento en Google Calendar"""
+        return (await self.insert_event(event_data, calendar_id))['id']
+
+    async def update_event(
+        self,
+        google_event_id: str,
+        event_data: Dict[str, Any],
+        calendar_id: str = 'primary'
+    ) -> bool:
+        """Reemplaza un evento completo en Google Calendar"""
+        try:
+            await self._request(
+                'PUT',
+                self._events_path(calendar_id, google_event_id),
+                params={'fields': WRITE_RESPONSE_FIELDS},
+                json=self.sync._convert_to_google_format(event_data)
+            )
+            return True
+
+        except HttpError as error:
+            print(f'Error al actualizar evento en Google Calendar: {error}')
+            return False
+
+    async def patch_event(
+        self,
+        google_event_id: str,
+        update_data: Dict[str, Any],
+        etag: Optional[str] = None,
+        calendar_id: str = 'primary'
+    ) -> Optional[str]:
+        """Actualiza solo los campos modificados usando If-Match con el etag almacenado"""
+        try:
+            event = await self._request(
+                'PATCH',
+                self._events_path(calendar_id, google_event_id),
+                params={'fields': WRITE_RESPONSE_FIELDS},
+                json=self.sync._convert_to_google_patch(update_data),
+                headers={'If-Match': etag} if etag else None
+            )
+            return event.get('etag')
+
+        except HttpError as error:
+            if error.resp.status == 412:
+                raise EventConflict(f'El evento {google_event_id} fue modificado en Google Calendar')
+            print(f'Error al actualizar evento en Google Calendar: {error}')
+            return None
+
+    async def delete_event(self, google_event_id: str, calendar_id: str = 'primary') -> bool:
+        """Elimina un evento de Google Calendar"""
+        try:
+            await self._request('DELETE', self._events_path(calendar_id, google_event_id))
+            return True
+
+        except HttpError as error:
+            print(f'Error al eliminar evento de Google Calendar: {error}')
+            return False
+
+
+class AsyncFirestoreService(AsyncServiceAdapter):
+    """Contraparte asíncrona de FirebaseService usando el cliente async de Firestore"""
+
+    def __init__(self, service):
+        super().__init__(service)
+        from firebase_admin import firestore_async
+        self.db = firestore_async.client()
+
+    async def get_all_events(self) -> List[Dict[str, Any]]:
+        """Obtiene todos los eventos de Firestore"""
+        try:
+            events = []
+            async for doc in self.db.collection('events').stream():
+                event_data = doc.to_dict()
+                event_data['firebase_id'] = doc.id
+                events.append(event_data)
+            return events
+
+        except Exception as e:
+            print(f"Error al obtener eventos de Firebase: {e}")
+            return []
+
+    async def query_events(
+        self,
+        user_id: Optional[str] = None,
+        date_from=None,
+        date_to=None,
+        event_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Eventos con date en [date_from, date_to) paginados con cursor"""
+        query = build_events_query(
+            self.db.collection('events'), user_id, date_from, date_to, event_type, limit, cursor
+        )
+        return events_page([doc async for doc in query.stream()], limit)
+
+    async def find_overlapping(self, window_start, window_end, user_id: str) -> List[Dict[str, Any]]:
+        """Eventos del usuario que solapan la ventana más sus series recurrentes (consultas concurrentes)"""
+        event_query, series_query = build_overlap_queries(self.db.collection('events'), user_id, window_start)
+
+        async def read(query):
+            return [doc async for doc in query.stream()]
+
+        event_docs, series_docs = await asyncio.gather(read(event_query), read(series_query))
+        return overlapping_events(event_docs, series_docs, window_end)
+
+    async def get_event(self, firebase_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento por su ID de documento"""
+        try:
+            doc = await self.db.collection('events').document(firebase_id).get()
+            if not doc.exists:
+                return None
+            event_data = doc.to_dict()
+            event_data['firebase_id'] = doc.id
+            return event_data
+
+        except Exception as e:
+            print(f"Error al obtener evento de Firebase: {e}")
+            return None
+
+    async def create_event(self, event_data: Dict[str, Any]) -> str:
+        """Crea un evento en Firestore"""
+        try:
+            _, doc_ref = await self.db.collection('events').add(normalize_dates(event_data))
+            return doc_ref.id
+
+        except Exception as e:
+            print(f"Error al crear evento en Firebase: {e}")
+            raise
+
+    async def update_event(self, firebase_id: str, event_data: Dict[str, Any]) -> bool:
+        """Actualiza un evento en Firestore"""
+        try:
+            await self.db.collection('events').document(firebase_id).update(normalize_dates(event_data))
+            return True
+
+        except Exception as e:
+            print(f"Error al actualizar evento en Firebase: {e}")
+            return False
+
+    async def delete_event(self, firebase_id: str) -> bool:
+        """Elimina un evento de Firestore"""
+        try:
+            await self.db.collection('events').document(firebase_id).delete()
+            return True
+
+        except Exception as e:
+            print(f"Error al eliminar evento de Firebase: {e}")
+            return False
+
+    async def find_event_by_google_id(self, google_event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Busca un evento del usuario por su ID de Google Calendar"""
+        try:
+            query = (
+                self.db.collection('events')
+                .where('user_id', '==', user_id)
+                .where('google_event_id', '==', google_event_id)
+                .limit(1)
+            )
+            async for doc in query.stream():
+                event_data = doc.to_dict()
+                event_data['firebase_id'] = doc.id
+                return event_data
+            return None
+
+        except Exception as e:
+            print(f"Error al buscar evento por Google ID: {e}")
+            return None
+
+    async def find_events_by_google_ids(self, google_event_ids: Sequence[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Busca varios eventos del usuario por su ID de Google Calendar con consultas 'in' concurrentes"""
+        unique_ids = list(dict.fromkeys(google_id for google_id in google_event_ids if google_id))
+
+        async def query_chunk(chunk):
+            try:
+                query = self.db.collection('events').where('user_id', '==', user_id).where('google_event_id', 'in', chunk)
+                return [doc async for doc in query.stream()]
+            except Exception as e:
+                print(f"Error al buscar eventos por Google ID: {e}")
+                return []
+
+        chunks = [
+            unique_ids[start:start + FIRESTORE_IN_QUERY_LIMIT]
+            for start in range(0, len(unique_ids), FIRESTORE_IN_QUERY_LIMIT)
+        ]
+        found = {}
+        for docs in await asyncio.gather(*(query_chunk(chunk) for chunk in chunks)):
+            for doc in docs:
+                event_data = doc.to_dict()
+                event_data['firebase_id'] = doc.id
+                found.setdefault(event_data['google_event_id'], event_data)
+        return found
+
+    async def add_google_id_to_event(self, firebase_id: str, google_event_id: str) -> bool:
+        """Agrega el ID de Google Calendar a un evento existente"""
+        return await self.update_event(firebase_id, {'google_event_id': google_event_id})
+
+
+def get_async_firebase_service(firebase_service):
+    """Retorna la contraparte asíncrona del servicio de eventos
+
+    Con Firestore real se usa su cliente asíncrono; los almacenes simulados
+    se ejecutan en el threadpool.
+    """
+    if getattr(firebase_service, 'db', None) is not None:
+        return AsyncFirestoreService(firebase_service)
+    return AsyncServiceAdapter(firebase_service)
@@ -1,79 +1,433 @@
+import time
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
 from googleapiclient.errors import HttpError
+from config.settings import settings
 from app.auth.google_oauth import GoogleAuthService
 from app.models.event_models import EventResponse
+from app.services.google_client import get_calendar_client
+from app.services.rate_limiter import is_retryable_error
+from app.services.recurrence import RECURRENCE_FIELDS
+
+# Máximo de operaciones por petición al endpoint batch de Calendar
+BATCH_SIZE = 50
+
+# Campos de un evento que usan los conversores y la sincronización
+EVENT_FIELDS = ('id', 'etag', 'status', 'summary', 'description', 'start', 'end', 'reminders')
+
+# Campos de la respuesta de las escrituras
+WRITE_RESPONSE_FIELDS = 'id,etag'
+
+# Campos de calendarList usados para elegir calendarios a sincronizar
+CALENDAR_LIST_FIELDS = 'nextPageToken,items(id,summary,primary,accessRole,timeZone)'
+
+def event_fields(extra_fields: Sequence[str] = ()) -> str:
+    """Máscara de campos de un evento: la proyección por defecto más extra_fields"""
+    fields = list(EVENT_FIELDS)
+    fields.extend(field for field in extra_fields if field not in fields)
+    return ','.join(fields)
+
+def event_list_fields(extra_fields: Sequence[str] = ()) -> str:
+    """Máscara de campos de una página de events.list"""
+    return f'nextPageToken,nextSyncToken,items({event_fields(extra_fields)})'
+
+class SyncTokenExpired(Exception):
+    """Google invalidó el syncToken (410 Gone); se requiere una resincronización completa"""
+    pass
+
+class EventConflict(Exception):
+    """El evento fue modificado en Google Calendar (412 Precondition Failed)"""
+    pass
 
 class GoogleCalendarService:
-    def __init__(self):
-        self.auth_service = GoogleAuthService()
+    def __init__(self, user_id: str = None):
+        self.user_id = user_id or settings.DEFAULT_USER_ID
+        self.auth_service = GoogleAuthService(self.user_id)
+        self.client = get_calendar_client(self.user_id)
         
     def get_service(self):
         """Obtiene el servicio de Google Calendar"""
-        return self.auth_service.get_calendar_service()
+        return self.client.get_service()
     
-    def list_events(self, max_results: int = 250) -> List[Dict[str, Any]]:
-        """Obtiene todos los eventos del calendario principal"""
-        try:
-            service = self.get_service()
+    def _default_time_min(self) -> datetime:
+        """Primer día del mes actual, usado como límite inferior por defecto"""
+        now = datetime.now(timezone.utc)
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    
+    def _events_list_params(
+        self,
+        page_size: int,
+        time_min: Optional[datetime],
+        time_max: Optional[datetime],
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary',
+        single_events: bool = True
+    ) -> Dict[str, Any]:
+        """Parámetros de events.list para leer una ventana de eventos
+        
+        Con single_events=False se reciben los maestros de las series y sus
+        excepciones (incluidas las canceladas) en lugar de cada instancia.
+        """
+        params = {
+            'calendarId': calendar_id,
+            'timeMin': (time_min or self._default_time_min()).isoformat(),
+            'maxResults': page_size,
+            'singleEvents': single_events,
+            'fields': event_list_fields(extra_fields),
+        }
+        if single_events:
+            params['orderBy'] = 'startTime'
+        else:
+            params['showDeleted'] = True
+        if time_max:
+            params['timeMax'] = time_max.isoformat()
+        return params
+    
+    def _changes_list_params(
+        self,
+        sync_token: Optional[str],
+        calendar_id: str,
+        page_size: int,
+        extra_fields: Sequence[str] = ()
+    ) -> Dict[str, Any]:
+        """Parámetros de events.list para la sincronización con syncToken
+        
+        Las series llegan como maestro + excepciones (singleEvents=False).
+        """
+        params = {
+            'calendarId': calendar_id,
+            'maxResults': page_size,
+            'singleEvents': False,
+            'showDeleted': True,
+            'fields': event_list_fields(tuple(RECURRENCE_FIELDS) + tuple(extra_fields)),
+        }
+        if sync_token:
+            params['syncToken'] = sync_token
+        else:
+            params['timeMin'] = self._default_time_min().isoformat()
+        return params
+    
+    def iter_events(
+        self,
+        page_size: int = 250,
+        time_min: Optional[datetime] = None,
+        time_max: Optional[datetime] = None,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary',
+        single_events: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera los eventos de un calendario siguiendo nextPageToken
+        
+        Los eventos se entregan a medida que llega cada página, sin
+        acumular el calendario completo en memoria. Solo se piden los
+        campos de EVENT_FIELDS más los indicados en extra_fields.
+        """
+        service = self.get_service()
+        params = self._events_list_params(
+            page_size, time_min, time_max, extra_fields, calendar_id, single_events
+        )
+        
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            
+            events_result = self.client.execute(service.events().list(**params))
+            
+            for google_event in events_result.get('items', []):
+                yield google_event
+            
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+    
+    def iter_event_pages(
+        self,
+        sync_token: Optional[str] = None,
+        calendar_id: str = 'primary',
+        page_size: int = 250,
+        extra_fields: Sequence[str] = ()
+    ) -> Iterator[Dict[str, Any]]:
+        """Itera las páginas de cambios de un calendario
+        
+        Sin sync_token realiza la carga completa inicial; con sync_token
+        Google devuelve solo lo modificado desde entonces, incluyendo los
+        eventos cancelados. La última página contiene 'nextSyncToken'.
+        """
+        service = self.get_service()
+        params = self._changes_list_params(sync_token, calendar_id, page_size, extra_fields)
+        
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
             
-            # Obtener eventos desde hace 30 días hasta 1 año en el futuro
-            now = datetime.now(timezone.utc)
-            time_min = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)  # Primer día del mes actual
+            try:
+                page = self.client.execute(service.events().list(**params))
+            except HttpError as error:
+                if error.resp.status == 410:
+                    raise SyncTokenExpired(str(error))
+                raise
             
-            events_result = service.events().list(
-                calendarId='primary',
-                timeMin=time_min.isoformat(),
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            yield page
             
-            events = events_result.get('items', [])
-            return events
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                break
+    
+    def list_events(
+        self,
+        max_results: Optional[int] = None,
+        time_min: Optional[datetime] = None,
+        time_max: Optional[datetime] = None,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary'
+    ) -> List[Dict[str, Any]]:
+        """Obtiene los eventos de un calendario (todas las páginas)"""
+        try:
+            events = self.iter_events(
+                time_min=time_min,
+                time_max=time_max,
+                extra_fields=extra_fields,
+                calendar_id=calendar_id
+            )
+            if max_results is not None:
+                events = islice(events, max_results)
+            return list(events)
             
         except HttpError as error:
             print(f'Error al obtener eventos de Google Calendar: {error}')
             return []
     
-    def create_event(self, event_data: Dict[str, Any]) -> str:
-        """Crea un evento en Google Calendar"""
+    def list_calendars(self) -> List[Dict[str, Any]]:
+        """Lista los calendarios del usuario (calendarList)"""
+        service = self.get_service()
+        
+        params = {'fields': CALENDAR_LIST_FIELDS}
+        calendars = []
+        while True:
+            result = self.client.execute(service.calendarList().list(**params))
+            calendars.extend(result.get('items', []))
+            
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+            params['pageToken'] = page_token
+        
+        return calendars
+    
+    def check_access(self):
+        """Valida las credenciales con la petición más barata (un calendario de calendarList)
+        
+        Lanza HttpError si Google las rechaza.
+        """
+        service = self.get_service()
+        self.client.execute(service.calendarList().list(maxResults=1, fields='items(id)'))
+    
+    def get_event(
+        self,
+        google_event_id: str,
+        extra_fields: Sequence[str] = (),
+        calendar_id: str = 'primary'
+    ) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento de Google Calendar con la proyección de campos por defecto"""
+        try:
+            service = self.get_service()
+            return self.client.execute(service.events().get(
+                calendarId=calendar_id,
+                eventId=google_event_id,
+                fields=event_fields(extra_fields)
+            ))
+            
+        except HttpError as error:
+            print(f'Error al obtener evento de Google Calendar: {error}')
+            return None
+    
+    def insert_event(self, event_data: Dict[str, Any], calendar_id: str = 'primary') -> Dict[str, Any]:
+        """Crea un evento en Google Calendar y retorna su 'id' y 'etag'"""
         try:
             service = self.get_service()
             
             # Convertir el formato del evento para Google Calendar
             google_event = self._convert_to_google_format(event_data)
             
-            event = service.events().insert(
-                calendarId='primary',
-                body=google_event
-            ).execute()
+            event = self.client.execute(service.events().insert(
+                calendarId=calendar_id,
+                body=google_event,
+                fields=WRITE_RESPONSE_FIELDS
+            ))
             
-            return event.get('id')
+            return {'id': event.get('id'), 'etag': event.get('etag')}
             
         except HttpError as error:
             print(f'Error al crear evento en Google Calendar: {error}')
             raise Exception(f'No se pudo crear el evento: {error}')
     
-    def update_event(self, google_event_id: str, event_data: Dict[str, Any]) -> bool:
-        """Actualiza un evento en Google Calendar"""
+    def create_event(self, event_data: Dict[str, Any], calendar_id: str = 'primary') -> str:
+        """Crea un evento en Google Calendar"""
+        return self.insert_event(event_data, calendar_id)['id']
+    
+    def _execute_batch(self, requests: List[Any]) -> List[Tuple[Any, Optional[Exception]]]:
+        """Ejecuta peticiones usando el endpoint batch de la API
+        
+        Agrupa hasta BATCH_SIZE operaciones por petición HTTP y retorna,
+        en el mismo orden de entrada, una tupla (respuesta, error) por
+        operación. Las operaciones rechazadas por cuota o por errores
+        transitorios se reintentan con backoff.
+        """
+        service = self.get_service()
+        results: List[Tuple[Any, Optional[Exception]]] = [(None, None)] * len(requests)
+        
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+        
+        pending = list(range(len(requests)))
+        attempt = 0
+        while pending:
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                batch = service.new_batch_http_request(callback=callback)
+                for index in chunk:
+                    batch.add(requests[index], request_id=str(index))
+                
+                try:
+                    self.client.execute(batch, cost=len(chunk))
+                except HttpError as error:
+                    # Falla de la petición batch completa: marcar sus operaciones
+                    for index in chunk:
+                        results[index] = (None, error)
+            
+            retry = [i for i in pending if is_retryable_error(results[i][1])]
+            if not retry:
+                break
+            
+            delay = self.client.limiter.backoff(results[retry[0]][1], self.client.user_id, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+            attempt += 1
+            pending = retry
+        
+        return results
+    
+    def create_events_batch(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea varios eventos en Google Calendar usando peticiones batch
+        
+        Retorna un resultado por evento, en el mismo orden, con
+        'google_event_id' si se creó o 'error' si falló. Cada evento se crea
+        en su 'calendar_id' (por defecto el calendario principal).
+        """
+        service = self.get_service()
+        
+        requests = []
+        results: List[Dict[str, Any]] = []
+        for event_data in events:
+            try:
+                google_event = self._convert_to_google_format(event_data)
+                requests.append(service.events().insert(
+                    calendarId=event_data.get('calendar_id') or 'primary',
+                    body=google_event,
+                    fields=WRITE_RESPONSE_FIELDS
+                ))
+                results.append({'google_event_id': None, 'google_etag': None, 'error': None})
+            except Exception as e:
+                # Error de conversión: no se envía a Google
+                requests.append(None)
+                results.append({'google_event_id': None, 'google_etag': None, 'error': str(e)})
+        
+        pending = [i for i, request in enumerate(requests) if request is not None]
+        batch_results = self._execute_batch([requests[i] for i in pending])
+        
+        for index, (response, error) in zip(pending, batch_results):
+            if error is not None:
+                print(f'Error al crear evento en Google Calendar: {error}')
+                results[index]['error'] = str(error)
+            else:
+                results[index]['google_event_id'] = response.get('id')
+                results[index]['google_etag'] = response.get('etag')
+        
+        return results
+    
+    def patch_events_batch(self, patches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Actualiza varios eventos en Google Calendar usando peticiones batch
+    
+        Cada elemento trae 'google_event_id', 'update_data' y opcionalmente
+        'etag' (enviado como If-Match) y 'calendar_id'. Retorna un resultado
+        por elemento, en el mismo orden, con el nuevo 'google_etag' o con
+        'error'; 'conflict' indica que el evento cambió en Google (412).
+        """
+        service = self.get_service()
+    
+        requests = []
+        results: List[Dict[str, Any]] = []
+        for patch in patches:
+            try:
+                request = service.events().patch(
+                    calendarId=patch.get('calendar_id') or 'primary',
+                    eventId=patch['google_event_id'],
+                    body=self._convert_to_google_patch(patch['update_data']),
+                    fields=WRITE_RESPONSE_FIELDS
+                )
+                if patch.get('etag'):
+                    request.headers['If-Match'] = patch['etag']
+                requests.append(request)
+                results.append({'google_etag': None, 'error': None, 'conflict': False})
+            except Exception as e:
+                requests.append(None)
+                results.append({'google_etag': None, 'error': str(e), 'conflict': False})
+    
+        pending = [i for i, request in enumerate(requests) if request is not None]
+        batch_results = self._execute_batch([requests[i] for i in pending])
+    
+        for index, (response, error) in zip(pending, batch_results):
+            if error is not None:
+                if isinstance(error, HttpError) and error.resp.status == 412:
+                    results[index]['conflict'] = True
+                    results[index]['error'] = f"El evento {patches[index]['google_event_id']} fue modificado en Google Calendar"
+                else:
+                    print(f'Error al actualizar evento en Google Calendar: {error}')
+                    results[index]['error'] = str(error)
+            else:
+                results[index]['google_etag'] = response.get('etag')
+    
+        return results
+    
+    def delete_events_batch(self, events: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """Elimina varios eventos (google_event_id, calendar_id) usando peticiones batch
+    
+        Retorna un error por evento, en el mismo orden (None si se eliminó o
+        ya no existía en Google Calendar).
+        """
+        service = self.get_service()
+    
+        requests = [
+            service.events().delete(calendarId=calendar_id or 'primary', eventId=google_event_id)
+            for google_event_id, calendar_id in events
+        ]
+    
+        errors: List[Optional[str]] = []
+        for response, error in self._execute_batch(requests):
+            if error is None or (isinstance(error, HttpError) and error.resp.status in (404, 410)):
+                errors.append(None)
+            else:
+                print(f'Error al eliminar evento de Google Calendar: {error}')
+                errors.append(str(error))
+        return errors
+    
+    def update_event(self, google_event_id: str, event_data: Dict[str, Any], calendar_id: str = 'primary') -> bool:
+        """Reemplaza un evento completo en Google Calendar"""
         try:
             service = self.get_service()
             
-            # Obtener el evento actual
-            event = service.events().get(
-                calendarId='primary',
-                eventId=google_event_id
-            ).execute()
-            
-            # Actualizar con los nuevos datos
             updated_event = self._convert_to_google_format(event_data)
             
-            service.events().update(
-                calendarId='primary',
+            self.client.execute(service.events().update(
+                calendarId=calendar_id,
                 eventId=google_event_id,
-                body=updated_event
-            ).execute()
+                body=updated_event,
+                fields=WRITE_RESPONSE_FIELDS
+            ))
             
             return True
             
@@ -81,15 +435,49 @@ class GoogleCalendarService:
             print(f'Error al actualizar evento en Google Calendar: {error}')
             return False
     
-    def delete_event(self, google_event_id: str) -> bool:
+    def patch_event(
+        self,
+        google_event_id: str,
+        update_data: Dict[str, Any],
+        etag: Optional[str] = None,
+        calendar_id: str = 'primary'
+    ) -> Optional[str]:
+        """Actualiza solo los campos modificados de un evento en Google Calendar
+        
+        Si se proporciona el etag almacenado se envía como If-Match, de modo
+        que la escritura falla con EventConflict si el evento cambió en
+        Google. Retorna el nuevo etag, o None si la actualización falló.
+        """
+        try:
+            service = self.get_service()
+            
+            request = service.events().patch(
+                calendarId=calendar_id,
+                eventId=google_event_id,
+                body=self._convert_to_google_patch(update_data),
+                fields=WRITE_RESPONSE_FIELDS
+            )
+            if etag:
+                request.headers['If-Match'] = etag
+            
+            event = self.client.execute(request)
+            return event.get('etag')
+            
+        except HttpError as error:
+            if error.resp.status == 412:
+                raise EventConflict(f'El evento {google_event_id} fue modificado en Google Calendar')
+            print(f'Error al actualizar evento en Google Calendar: {error}')
+            return None
+    
+    def delete_event(self, google_event_id: str, calendar_id: str = 'primary') -> bool:
         """Elimina un evento de Google Calendar"""
         try:
             service = self.get_service()
             
-            service.events().delete(
-                calendarId='primary',
+            self.client.execute(service.events().delete(
+                calendarId=calendar_id,
                 eventId=google_event_id
-            ).execute()
+            ))
             
             return True
             
@@ -97,6 +485,65 @@ class GoogleCalendarService:
             print(f'Error al eliminar evento de Google Calendar: {error}')
             return False
     
+    def watch_events(self, channel: Dict[str, Any], calendar_id: str = 'primary') -> Dict[str, Any]:
+        """Registra un canal de notificaciones (events.watch) para un calendario
+        
+        Retorna el recurso del canal con 'resourceId' y 'expiration'.
+        """
+        service = self.get_service()
+        return self.client.execute(service.events().watch(
+            calendarId=calendar_id,
+            body=channel
+        ))
+    
+    def stop_channel(self, channel_id: str, resource_id: str) -> bool:
+        """Detiene un canal de notificaciones"""
+        try:
+            service = self.get_service()
+            self.client.execute(service.channels().stop(
+                body={'id': channel_id, 'resourceId': resource_id}
+            ))
+            return True
+            
+        except HttpError as error:
+            print(f'Error al detener canal de notificaciones: {error}')
+            return False
+    
+    def _convert_to_google_patch(self, update_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Convierte solo los campos presentes en update_data al formato de Google Calendar"""
+        patch = {}
+        
+        if 'title' in update_data:
+            patch['summary'] = update_data['title'] or ''
+        if 'description' in update_data:
+            patch['description'] = update_data['description'] or ''
+        
+        for field, google_field in (('date', 'start'), ('end_time', 'end')):
+            value = update_data.get(field)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+            patch[google_field] = {
+                'dateTime': value.isoformat(),
+                'timeZone': 'America/Mexico_City',
+            }
+        
+        if update_data.get('reminder') is not None:
+            if update_data['reminder']:
+                patch['reminders'] = {
+                    'useDefault': False,
+                    'overrides': [
+                        {'method': 'popup', 'minutes': 30},
+                        {'method': 'email', 'minutes': 60},
+                    ],
+                }
+            else:
+                # En PATCH las listas se reemplazan: vaciar los recordatorios propios
+                patch['reminders'] = {'useDefault': True, 'overrides': []}
+        
+        return patch
+    
     def _convert_to_google_format(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Convierte el formato de evento interno al formato de Google Calendar"""
         
@@ -134,8 +581,16 @@ class GoogleCalendarService:
         
         return google_event
     
-    def _convert_from_google_format(self, google_event: Dict[str, Any]) -> Dict[str, Any]:
-        """Convierte el formato de Google Calendar al formato interno"""
+    def _convert_from_google_format(
+        self,
+        google_event: Dict[str, Any],
+        calendar_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Convierte el formato de Google Calendar al formato interno
+        
+        El evento queda etiquetado con el usuario dueño del servicio y, si se
+        indica calendar_id, con su calendario de origen.
+        """
         
         # Extraer fechas de inicio y fin
         start = google_event.get('start', {})
@@ -149,12 +604,24 @@ class GoogleCalendarService:
         if end_time:
             end_time = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
         
-        return {
+        event_data = {
             'title': google_event.get('summary', 'Sin título'),
             'description': google_event.get('description', ''),
             'date': start_time.isoformat() if start_time else None,
             'end_time': end_time.isoformat() if end_time else None,
             'type': 'importado',  # Marcar como importado de Google
             'reminder': bool(google_event.get('reminders', {}).get('overrides')),
-            'google_event_id': google_event.get('id')
+            'google_event_id': google_event.get('id'),
+            'google_etag': google_event.get('etag'),
+            'user_id': self.user_id
         }
+        if calendar_id:
+            event_data['calendar_id'] = calendar_id
+        
+        # Evento maestro de una serie: se guarda una vez con sus reglas
+        if google_event.get('recurrence'):
+            event_data['recurrence'] = google_event['recurrence']
+            event_data['time_zone'] = start.get('timeZone')
+            event_data['all_day'] = 'dateTime' not in start
+        
+        return event_data
@@ -0,0 +1,193 @@
+"""
+Difusión en vivo de los cambios de eventos a los clientes conectados (SSE).
+
+El registro de cambios notifica al broker cada escritura confirmada, desde
+el event loop o desde los hilos de sincronización, y el broker la reparte
+en el event loop a las suscripciones del usuario. Cada suscripción guarda
+sus cambios pendientes combinados por evento (el último estado gana), así
+que una ráfaga, como una importación grande, se envía como un solo bloque
+y un cliente lento no frena a los demás. Si un cliente acumula demasiados
+pendientes se le pide resincronizar con el feed de cambios.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from config.settings import settings
+from app.services.change_tracking import CREATED, DELETED, Change, get_change_tracker
+from app.services.event_stream import dumps, event_record
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def change_message(version: int, kind: str, firebase_id: str, event: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Mensaje de un cambio: el evento completo o un tombstone si se eliminó"""
+    return {
+        'id': firebase_id,
+        'kind': kind,
+        'version': version,
+        'event': event_record(event, firebase_id) if event is not None and kind != DELETED else None,
+    }
+
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Bloque de texto de un evento SSE"""
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(data)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscription:
+    """Conexión de un cliente: cambios pendientes combinados por evento"""
+
+    def __init__(self, user_id: str, max_pending: Optional[int] = None):
+        self.user_id = user_id
+        self.max_pending = max_pending or settings.SSE_MAX_PENDING
+        self.pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.overflowed = False
+        self.wakeup = asyncio.Event()
+
+    def push(self, message: Dict[str, Any]):
+        """Encola el cambio reemplazando el pendiente del mismo evento (en el event loop)"""
+        if self.overflowed:
+            return
+        previous = self.pending.pop(message['id'], None)
+        if previous is not None and previous['kind'] == CREATED and message['kind'] != DELETED:
+            # Para el cliente sigue siendo un alta, con el estado más reciente
+            message = {**message, 'kind': CREATED}
+        self.pending[message['id']] = message
+
+        if len(self.pending) > self.max_pending:
+            # Cliente demasiado lento: descartar y pedirle que use el feed
+            self.pending.clear()
+            self.overflowed = True
+        self.wakeup.set()
+
+    def drain(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Retorna los pendientes en orden de versión y si hubo desbordamiento"""
+        messages = list(self.pending.values())
+        overflowed = self.overflowed
+        self.pending.clear()
+        self.overflowed = False
+        self.wakeup.clear()
+        return messages, overflowed
+
+
+class ChangeBroker:
+    """Reparte los cambios registrados a las suscripciones de cada usuario"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Fija el event loop donde viven las suscripciones"""
+        self._loop = loop
+
+    def publish(self, user_id: str, first_version: int, changes: Sequence[Change]):
+        """Oyente del registro de cambios; puede llamarse desde cualquier hilo"""
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._subscriptions.get(user_id):
+            return
+        messages = [
+            change_message(version, change.kind, change.firebase_id, change.event)
+            for version, change in enumerate(changes, start=first_version)
+        ]
+        loop.call_soon_threadsafe(self._dispatch, user_id, messages)
+
+    def _dispatch(self, user_id: str, messages: List[Dict[str, Any]]):
+        for subscription in self._subscriptions.get(user_id, ()):
+            for message in messages:
+                subscription.push(message)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def connection_count(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    async def stream(
+        self,
+        subscription: Subscription,
+        replay: List[Dict[str, Any]],
+        is_disconnected,
+        resync: bool = False
+    ) -> AsyncIterator[str]:
+        """Eventos SSE de la suscripción: primero replay y luego los cambios en vivo
+
+        Cada cambio lleva como id el cursor del feed de cambios, de modo que
+        el cliente puede reanudar con Last-Event-ID. Con resync (cursor
+        vencido o desbordamiento) se envía un evento 'resync' y el cliente
+        debe volver a cargar con GET /changes.
+        """
+        tracker = get_change_tracker()
+        last_version = 0
+        try:
+            # Abrir la conexión de inmediato aunque no haya nada que reenviar
+            yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+            if resync:
+                yield sse_event({'reason': 'cursor'}, event='resync')
+            if replay:
+                last_version = replay[-1]['version']
+                yield ''.join(
+                    sse_event(message, event=message['kind'], event_id=tracker.encode_cursor(message['version']))
+                    for message in replay
+                )
+
+            while True:
+                try:
+                    await asyncio.wait_for(subscription.wakeup.wait(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+
+                # Esperar un poco para combinar las ráfagas en un solo envío
+                await asyncio.sleep(settings.SSE_COALESCE_SECONDS)
+                messages, overflowed = subscription.drain()
+                if overflowed:
+                    yield sse_event({'reason': 'overflow'}, event='resync')
+                    continue
+
+                chunk = []
+                for message in messages:
+                    # Los cambios ya enviados en el replay se omiten
+                    if message['version'] <= last_version:
+                        continue
+                    last_version = message['version']
+                    chunk.append(sse_event(message, event=message['kind'], event_id=tracker.encode_cursor(last_version)))
+                if chunk:
+                    yield ''.join(chunk)
+        finally:
+            self.unsubscribe(subscription)
+
+
+_broker: Optional[ChangeBroker] = None
+_broker_lock = threading.Lock()
+
+
+def get_change_broker() -> ChangeBroker:
+    """Retorna el broker compartido por el proceso, suscrito al registro de cambios"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker = ChangeBroker()
+                get_change_tracker().add_listener(broker.publish)
+                _broker = broker
+    return _broker
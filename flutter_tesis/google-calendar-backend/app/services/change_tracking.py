@@ -0,0 +1,344 @@
+"""
+Registro de cambios de los eventos.
+
+Toda escritura de eventos (rutas de calendario, importación, sincronización
+incremental y exportación a Google) registra aquí sus cambios. Cada cambio
+recibe una versión monótona creciente del proceso; la versión de un usuario,
+o de una ventana de fechas de un usuario, es la del último cambio que la
+tocó y sirve como ETag de los listados.
+
+El mismo historial es el log del feed de cambios: un cursor es una versión
+y el feed entrega el último cambio de cada evento posterior a ella (las
+eliminaciones como tombstones). El log se compacta periódicamente
+conservando solo el último cambio por evento y descartando los tombstones
+vencidos; un cursor anterior a lo descartado ya no es válido.
+
+El registro vive en la memoria de un solo proceso, así que el servidor debe
+ejecutarse con un solo worker: al arrancar toma un candado exclusivo
+(claim_single_process) y un segundo proceso sobre el mismo LOCAL_STORE_DIR
+no inicia. Un reinicio cambia el epoch, de modo que los ETag anteriores ya
+no coinciden y los cursores anteriores responden 410. Las escrituras que no
+pasan por esta API (la consola de Firebase, scripts u otra instancia) no se
+registran: ni los ETag ni el feed de cambios las reflejan.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import settings
+from app.services.event_index import to_utc
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin candado de proceso
+    fcntl = None
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+class Change(NamedTuple):
+    """Cambio de un evento: estado nuevo (o el eliminado) y estado anterior"""
+    kind: str
+    firebase_id: str
+    event: Optional[Dict[str, Any]] = None
+    previous: Optional[Dict[str, Any]] = None
+
+
+class ChangeCursorExpired(Exception):
+    """El cursor es anterior a los cambios conservados; se requiere una carga completa"""
+    pass
+
+
+class _Entry:
+    """Cambio registrado: versión y fechas de inicio que tocó (None = cualquiera)"""
+    __slots__ = ('version', 'kind', 'firebase_id', 'span', 'timestamp')
+
+    def __init__(
+        self,
+        version: int,
+        kind: str,
+        firebase_id: str,
+        span: Optional[Tuple[datetime, datetime]],
+        timestamp: float
+    ):
+        self.version = version
+        self.kind = kind
+        self.firebase_id = firebase_id
+        self.span = span
+        self.timestamp = timestamp
+
+
+def _span(change: Change) -> Optional[Tuple[datetime, datetime]]:
+    """Rango de fechas de inicio antes y después del cambio"""
+    dates = []
+    for event in (change.event, change.previous):
+        if event is None:
+            continue
+        try:
+            if event.get('date'):
+                dates.append(to_utc(event['date']))
+        except (TypeError, ValueError):
+            return None
+    if not dates:
+        return None
+    return min(dates), max(dates)
+
+
+def _union(
+    first: Optional[Tuple[datetime, datetime]],
+    second: Optional[Tuple[datetime, datetime]]
+) -> Optional[Tuple[datetime, datetime]]:
+    if first is None or second is None:
+        return None
+    return min(first[0], second[0]), max(first[1], second[1])
+
+
+def _touches(span: Optional[Tuple[datetime, datetime]], date_from: Optional[datetime], date_to: Optional[datetime]) -> bool:
+    if span is None:
+        return True
+    if date_from is not None and span[1] < date_from:
+        return False
+    if date_to is not None and span[0] >= date_to:
+        return False
+    return True
+
+
+class ChangeTracker:
+    """Versiones de los cambios por usuario, con un historial acotado en memoria"""
+
+    def __init__(self, history_size: Optional[int] = None):
+        self.history_size = history_size or settings.CHANGE_HISTORY_SIZE
+        # Las versiones reinician con el proceso: el epoch distingue los ETag
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._version = 0
+        self._history: Dict[str, Deque[_Entry]] = {}
+        # Versión del cambio más reciente que ya salió del historial
+        self._floor: Dict[str, int] = {}
+        # Reciben (user_id, versión del primer cambio, cambios) en orden de versión
+        self._listeners: List[Callable[[str, int, Sequence[Change]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, int, Sequence[Change]], None]):
+        """Registra un oyente de los cambios; debe retornar de inmediato sin bloquear"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def record(self, user_id: str, changes: Sequence[Change]) -> int:
+        """Registra los cambios de un usuario y retorna la última versión asignada"""
+        now = time.time()
+        with self._lock:
+            first_version = self._version + 1
+            history = self._history.setdefault(user_id, deque())
+            for change in changes:
+                self._version += 1
+                history.append(_Entry(self._version, change.kind, change.firebase_id, _span(change), now))
+            if len(history) > self.history_size:
+                self._compact_user(user_id, now)
+            while len(self._history[user_id]) > self.history_size:
+                self._drop_oldest(user_id)
+            # Dentro del lock para que los oyentes reciban las versiones en orden
+            for listener in self._listeners:
+                try:
+                    listener(user_id, first_version, changes)
+                except Exception as e:
+                    print(f"Error al notificar cambios: {e}")
+            return self._version
+
+    def _drop_oldest(self, user_id: str):
+        entry = self._history[user_id].popleft()
+        self._floor[user_id] = max(self._floor.get(user_id, 0), entry.version)
+
+    def _compact_user(self, user_id: str, now: float):
+        """Deja el último cambio de cada evento y descarta los tombstones vencidos"""
+        latest: Dict[str, _Entry] = {}
+        for entry in self._history[user_id]:
+            previous = latest.pop(entry.firebase_id, None)
+            if previous is not None:
+                # La entrada conservada cubre las fechas de las que reemplaza
+                entry = _Entry(
+                    entry.version,
+                    CREATED if previous.kind == CREATED and entry.kind != DELETED else entry.kind,
+                    entry.firebase_id,
+                    _union(previous.span, entry.span),
+                    entry.timestamp
+                )
+            latest[entry.firebase_id] = entry
+
+        compacted = deque()
+        expired_before = now - settings.CHANGE_TOMBSTONE_TTL
+        for entry in latest.values():
+            if entry.kind == DELETED and entry.timestamp < expired_before:
+                self._floor[user_id] = max(self._floor.get(user_id, 0), entry.version)
+            else:
+                compacted.append(entry)
+        self._history[user_id] = compacted
+
+    def compact(self) -> int:
+        """Compacta el log de todos los usuarios y retorna las entradas descartadas"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for user_id in list(self._history):
+                before = len(self._history[user_id])
+                self._compact_user(user_id, now)
+                removed += before - len(self._history[user_id])
+        return removed
+
+    def changes_since(
+        self,
+        user_id: str,
+        since: Optional[int],
+        limit: int
+    ) -> Tuple[List[Tuple[int, str, str]], int, bool]:
+        """Último cambio por evento posterior a la versión since
+
+        Retorna ([(versión, tipo, firebase_id)], versión del siguiente cursor,
+        hay_más). Sin since solo se obtiene el cursor actual.
+        """
+        with self._lock:
+            current = self._version
+            if since is None:
+                return [], current, False
+            if since < self._floor.get(user_id, 0):
+                raise ChangeCursorExpired("El cursor es demasiado antiguo")
+
+            latest: Dict[str, Tuple[int, str, str]] = {}
+            created = set()
+            for entry in self._history.get(user_id, ()):
+                if entry.version <= since:
+                    continue
+                if entry.kind == CREATED:
+                    created.add(entry.firebase_id)
+                latest.pop(entry.firebase_id, None)
+                latest[entry.firebase_id] = (entry.version, entry.kind, entry.firebase_id)
+
+        changes = [
+            (version, CREATED if firebase_id in created and kind != DELETED else kind, firebase_id)
+            for version, kind, firebase_id in latest.values()
+        ]
+        if len(changes) > limit:
+            changes = changes[:limit]
+            return changes, changes[-1][0], True
+        return changes, current, False
+
+    def encode_cursor(self, version: int) -> str:
+        """Cursor opaco del feed de cambios"""
+        payload = f"{self.epoch}:{version}".encode('utf-8')
+        return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor: str) -> int:
+        """Versión de un cursor; ValueError si es inválido y ChangeCursorExpired si es de otro proceso"""
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            epoch, version = base64.urlsafe_b64decode(cursor + padding).decode('utf-8').split(':')
+            version = int(version)
+        except Exception:
+            raise ValueError("Cursor inválido")
+        if epoch != self.epoch:
+            # Las versiones reiniciaron con el proceso
+            raise ChangeCursorExpired("El cursor pertenece a una ejecución anterior")
+        return version
+
+    def version(self, user_id: str, date_from=None, date_to=None) -> int:
+        """Versión del usuario, o de la ventana [date_from, date_to) de fechas de inicio"""
+        date_from, date_to = to_utc(date_from), to_utc(date_to)
+        with self._lock:
+            history = self._history.get(user_id, ())
+            for entry in reversed(history):
+                if _touches(entry.span, date_from, date_to):
+                    return entry.version
+            # Sin cambios conocidos en la ventana: cota por lo ya descartado
+            return self._floor.get(user_id, 0)
+
+    def etag(self, user_id: str, date_from=None, date_to=None, scope: Iterable[Any] = ()) -> str:
+        """ETag débil de un listado: versión de la ventana más los parámetros de la consulta"""
+        version = self.version(user_id, date_from, date_to)
+        key = repr((user_id, str(date_from), str(date_to), *scope)).encode('utf-8')
+        return f'W/"{self.epoch}-{version}-{hashlib.sha1(key).hexdigest()[:12]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica si la cabecera If-None-Match contiene el ETag (comparación débil)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    weak = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == weak:
+            return True
+    return False
+
+
+_tracker: Optional[ChangeTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_change_tracker() -> ChangeTracker:
+    """Retorna el registro de cambios compartido por el proceso"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = ChangeTracker()
+    return _tracker
+
+
+_process_lock = None
+
+
+def claim_single_process(lock_file: Optional[str] = None):
+    """Toma el candado que reserva el registro de cambios para este proceso
+
+    Con varios workers cada uno tendría sus propias versiones y un cliente
+    podría recibir un 304 o un cursor válido de un worker que no vio el
+    último cambio. RuntimeError si otro proceso ya tiene el candado.
+    """
+    global _process_lock
+    if _process_lock is not None or fcntl is None:
+        return
+    path = lock_file or settings.CHANGE_TRACKER_LOCK_FILE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handle = open(path, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise RuntimeError(
+            f"Otro proceso del servidor tiene {path}: el registro de cambios "
+            "vive en memoria y el servidor debe ejecutarse con un solo worker"
+        )
+    _process_lock = handle
+
+
+def record_changes(user_id: str, changes: List[Change]) -> Optional[int]:
+    """Registra los cambios ya confirmados en el almacén de eventos"""
+    if not changes:
+        return None
+    return get_change_tracker().record(user_id, changes)
+
+
+async def run_compaction_loop():
+    """Compacta periódicamente el log de cambios"""
+    while True:
+        await asyncio.sleep(settings.CHANGE_COMPACT_INTERVAL)
+        try:
+            removed = await run_in_threadpool(get_change_tracker().compact)
+            if removed:
+                print(f"🧹 Log de cambios compactado ({removed} entradas descartadas)")
+        except Exception as e:
+            print(f"Error al compactar el log de cambios: {e}")
@@ -0,0 +1,265 @@
+"""
+Sincronización incremental Google Calendar -> Firebase usando syncToken.
+
+Guarda el nextSyncToken de cada calendario de cada usuario y en las
+siguientes ejecuciones solo procesa los eventos modificados desde entonces.
+Las sincronizaciones de un mismo calendario (webhook, ruta /delta-sync) se
+ejecutan una tras otra: la segunda espera y continúa desde el token que
+dejó la primera.
+
+Una carga completa (la primera o tras un 410) no recibe las bajas hechas
+mientras no había token válido: al terminarla se eliminan los eventos
+locales del calendario vinculados a Google que ya no aparecieron.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+from config.settings import settings
+from app.auth.token_store import TokenStore, get_token_store
+from app.services.calendar_service import SyncTokenExpired
+from app.services.change_tracking import CREATED, UPDATED, DELETED, Change, record_changes
+from app.services.event_index import to_utc
+from app.services.recurrence import exception_from_google, is_series_exception, series_exception_updates
+
+
+# Fin abierto de la ventana al buscar los eventos que la carga completa debió traer
+_FAR_FUTURE = datetime(9999, 12, 31, tzinfo=timezone.utc)
+
+
+class _CalendarLocks:
+    """Un candado por calendario de usuario, presente solo mientras se usa"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # (user_id, calendar_id) -> [candado, hilos que lo usan o esperan]
+        self._locks: Dict[Tuple[str, str], list] = {}
+
+    @contextmanager
+    def hold(self, key: Tuple[str, str]):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+_calendar_locks = _CalendarLocks()
+
+
+class SyncStateStore:
+    """syncToken por calendario de un usuario, guardados en el almacén SQLite"""
+
+    def __init__(self, user_id: Optional[str] = None, token_store: Optional[TokenStore] = None):
+        self.user_id = user_id or settings.DEFAULT_USER_ID
+        self.token_store = token_store or get_token_store()
+
+    def get_token(self, calendar_id: str) -> Optional[str]:
+        return self.token_store.get_sync_token(self.user_id, calendar_id)
+
+    def set_token(self, calendar_id: str, sync_token: Optional[str]):
+        self.token_store.set_sync_token(self.user_id, calendar_id, sync_token)
+
+
+class DeltaSyncEngine:
+    """Aplica en Firebase los cambios de Google Calendar desde el último syncToken"""
+
+    def __init__(self, calendar_service, firebase_service, state_store: Optional[SyncStateStore] = None):
+        self.calendar_service = calendar_service
+        self.firebase_service = firebase_service
+        # Los tokens son propios del usuario dueño del servicio de Calendar
+        self.state_store = state_store or SyncStateStore(calendar_service.user_id)
+
+    def run(self, calendar_id: str = 'primary') -> Dict[str, Any]:
+        """Ejecuta una sincronización incremental (o completa si no hay token)
+
+        Si el calendario ya se está sincronizando, espera a que termine y
+        continúa desde su token en lugar de repetir los mismos cambios.
+        """
+        with _calendar_locks.hold((self.calendar_service.user_id, calendar_id)):
+            return self._run(calendar_id)
+
+    def _run(self, calendar_id: str) -> Dict[str, Any]:
+        sync_token = self.state_store.get_token(calendar_id)
+        full_resync = sync_token is None
+
+        try:
+            result = self._apply_changes(calendar_id, sync_token)
+        except SyncTokenExpired:
+            # 410 Gone: el token ya no es válido, descartar y cargar todo
+            print(f"⚠️  syncToken expirado para {calendar_id}, resincronización completa")
+            self.state_store.set_token(calendar_id, None)
+            full_resync = True
+            result = self._apply_changes(calendar_id, None)
+
+        result['full_resync'] = full_resync
+        return result
+
+    def run_many(self, calendar_ids: Sequence[str]) -> Dict[str, Any]:
+        """Sincroniza varios calendarios en paralelo y combina los resultados"""
+        with ThreadPoolExecutor(max_workers=settings.CALENDAR_FANOUT_CONCURRENCY) as executor:
+            futures = {calendar_id: executor.submit(self.run, calendar_id) for calendar_id in calendar_ids}
+
+        combined = {'created': 0, 'updated': 0, 'deleted': 0, 'errors': [], 'full_resync': False, 'calendars': {}}
+        for calendar_id, future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'created': 0, 'updated': 0, 'deleted': 0, 'errors': [f"{calendar_id}: {e}"], 'full_resync': False}
+
+            combined['calendars'][calendar_id] = result
+            for key in ('created', 'updated', 'deleted'):
+                combined[key] += result[key]
+            combined['errors'].extend(result['errors'])
+            combined['full_resync'] = combined['full_resync'] or result['full_resync']
+
+        return combined
+
+    def _apply_changes(self, calendar_id: str, sync_token: Optional[str]) -> Dict[str, Any]:
+        result = {'created': 0, 'updated': 0, 'deleted': 0, 'errors': []}
+        next_sync_token = None
+        # En la carga completa: desde dónde lista Google y qué IDs siguen vivos
+        time_min = self.calendar_service._default_time_min() if sync_token is None else None
+        seen_google_ids = set()
+        # Excepciones cuya serie todavía no se ha procesado
+        pending_exceptions: Dict[str, Dict[str, Any]] = {}
+
+        for page in self.calendar_service.iter_event_pages(
+            sync_token=sync_token,
+            calendar_id=calendar_id
+        ):
+            items = page.get('items', [])
+            # Conciliar la página completa con una sola búsqueda
+            existing_events = self.firebase_service.find_events_by_google_ids([
+                google_event.get('id') for google_event in items
+                if not is_series_exception(google_event)
+            ], self.calendar_service.user_id)
+            # Altas y cambios de la página, aplicados con escrituras en lote
+            # (con el estado anterior de los actualizados)
+            writes = {'create': [], 'update': {}, 'previous': {}, 'delete': {}}
+
+            for google_event in items:
+                if sync_token is None and google_event.get('status') != 'cancelled' \
+                        and not is_series_exception(google_event):
+                    seen_google_ids.add(google_event.get('id'))
+                try:
+                    if is_series_exception(google_event):
+                        key, override = exception_from_google(self.calendar_service, google_event)
+                        pending_exceptions.setdefault(google_event['recurringEventId'], {})[key] = override
+                    else:
+                        self._apply_event(
+                            google_event,
+                            existing_events.get(google_event.get('id')),
+                            calendar_id,
+                            result,
+                            writes,
+                            incremental=sync_token is not None
+                        )
+                except Exception as e:
+                    error_msg = f"Error al procesar evento {google_event.get('summary', google_event.get('id'))}: {str(e)}"
+                    result['errors'].append(error_msg)
+                    print(error_msg)
+
+            self._flush_writes(writes, result)
+            next_sync_token = page.get('nextSyncToken') or next_sync_token
+
+        # Guardar las excepciones dentro de sus series
+        series_events = self.firebase_service.find_events_by_google_ids(
+            list(pending_exceptions), self.calendar_service.user_id
+        )
+        self._flush_writes({
+            'create': [],
+            'update': series_exception_updates(series_events, pending_exceptions),
+            'previous': {series['firebase_id']: series for series in series_events.values()},
+            'delete': {}
+        }, result)
+
+        # Guardar el token solo cuando se recorrieron todas las páginas
+        if next_sync_token:
+            if time_min is not None:
+                self._flush_writes({
+                    'create': [], 'update': {}, 'previous': {},
+                    'delete': self._missing_events(calendar_id, seen_google_ids, time_min)
+                }, result)
+            self.state_store.set_token(calendar_id, next_sync_token)
+
+        return result
+
+    def _missing_events(self, calendar_id: str, seen_google_ids: set, time_min: datetime) -> Dict[str, Dict[str, Any]]:
+        """Eventos locales del calendario vinculados a Google que la carga completa no trajo
+
+        Google solo lista lo que termina desde time_min, así que los eventos
+        (o series) que terminaron antes se conservan.
+        """
+        user_id = self.calendar_service.user_id
+        return {
+            event['firebase_id']: event
+            for event in self.firebase_service.find_overlapping(time_min, _FAR_FUTURE, user_id)
+            if event.get('google_event_id') and event['google_event_id'] not in seen_google_ids
+            and (event.get('calendar_id') or 'primary') == calendar_id
+            and event.get('date') and to_utc(event.get('end_time') or event['date']) >= time_min
+        }
+
+    def _apply_event(
+        self,
+        google_event: Dict[str, Any],
+        existing_event: Optional[Dict[str, Any]],
+        calendar_id: str,
+        result: Dict[str, Any],
+        writes: Dict[str, Any],
+        incremental: bool
+    ):
+        """Encola en writes la baja del evento cancelado o su alta o actualización"""
+        if google_event.get('status') == 'cancelled':
+            # En la carga completa las bajas se resuelven al final (_missing_events)
+            if incremental and existing_event:
+                writes['delete'][existing_event['firebase_id']] = existing_event
+            return
+
+        event_data = self.calendar_service._convert_from_google_format(google_event, calendar_id)
+
+        if existing_event:
+            # Conservar la clasificación local del evento
+            event_data.pop('type', None)
+            writes['update'][existing_event['firebase_id']] = event_data
+            writes['previous'][existing_event['firebase_id']] = existing_event
+        else:
+            writes['create'].append(event_data)
+
+    def _flush_writes(self, writes: Dict[str, Any], result: Dict[str, Any]):
+        """Aplica las altas, actualizaciones y bajas encoladas y registra los errores por evento"""
+        changes = []
+        if writes['create']:
+            for event_data, created in zip(writes['create'], self.firebase_service.create_events(writes['create'])):
+                if created['error']:
+                    result['errors'].append(f"Error al crear evento {event_data.get('title')}: {created['error']}")
+                else:
+                    result['created'] += 1
+                    changes.append(Change(CREATED, created['firebase_id'], event_data))
+
+        if writes['update']:
+            for firebase_id, error in self.firebase_service.update_events(writes['update']).items():
+                if error:
+                    result['errors'].append(f"Error al actualizar evento {firebase_id}: {error}")
+                else:
+                    result['updated'] += 1
+                    previous = writes['previous'].get(firebase_id)
+                    changes.append(Change(UPDATED, firebase_id, {**(previous or {}), **writes['update'][firebase_id]}, previous))
+
+        if writes['delete']:
+            for firebase_id, error in self.firebase_service.delete_events(list(writes['delete'])).items():
+                if error:
+                    result['errors'].append(f"Error al eliminar evento {firebase_id}: {error}")
+                else:
+                    result['deleted'] += 1
+                    changes.append(Change(DELETED, firebase_id, writes['delete'][firebase_id]))
+
+        record_changes(self.calendar_service.user_id, changes)
@@ -0,0 +1,197 @@
+"""
+Consultas por rango de fechas y paginación con cursor.
+
+Define el cursor opaco compartido por todos los almacenes de eventos y un
+índice ordenado por (date, firebase_id) para los almacenes en memoria, de
+modo que una consulta recorre solo la ventana pedida. IntervalEventIndex
+agrega el fin de cada evento para buscar los que solapan una ventana.
+"""
+import base64
+import json
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Callable, Union
+
+from config.settings import settings
+
+# Límite superior de eventos por página
+MAX_PAGE_SIZE = 1000
+
+
+def to_utc(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """Normaliza una fecha (ISO o datetime) a datetime UTC con zona horaria"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def jsonable_event(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del evento con las fechas como texto ISO (para los almacenes en JSON)"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in event_data.items()
+    }
+
+
+def encode_cursor(event: Dict[str, Any]) -> str:
+    """Cursor opaco que apunta justo después del evento dado"""
+    payload = json.dumps([to_utc(event['date']).isoformat(), event['firebase_id']])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Recupera (date, firebase_id) de un cursor; ValueError si es inválido"""
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        date, firebase_id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        return to_utc(date), firebase_id
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def event_owner(event: Dict[str, Any]) -> str:
+    """Dueño del evento (los eventos sin dueño son del usuario por defecto)"""
+    return event.get('user_id', settings.DEFAULT_USER_ID)
+
+
+def owns_event(event: Dict[str, Any], user_id: str) -> bool:
+    """Indica si el evento pertenece al usuario"""
+    return event_owner(event) == user_id
+
+
+class SortedEventIndex:
+    """Índice ordenado (date, firebase_id) con búsquedas por rango en O(log n + k)"""
+
+    def __init__(self):
+        self._keys: List[Tuple[datetime, str]] = []
+        self._key_by_id: Dict[str, Tuple[datetime, str]] = {}
+
+    def add(self, event: Dict[str, Any]):
+        """Indexa o reindexa el evento según su fecha actual"""
+        firebase_id = event['firebase_id']
+        self.remove(firebase_id)
+        if not event.get('date'):
+            return
+        key = (to_utc(event['date']), firebase_id)
+        insort(self._keys, key)
+        self._key_by_id[firebase_id] = key
+
+    def rebuild(self, events: List[Dict[str, Any]]):
+        """Reconstruye el índice completo con un solo ordenamiento"""
+        self._key_by_id = {
+            event['firebase_id']: (to_utc(event['date']), event['firebase_id'])
+            for event in events if event.get('date')
+        }
+        self._keys = sorted(self._key_by_id.values())
+
+    def remove(self, firebase_id: str):
+        key = self._key_by_id.pop(firebase_id, None)
+        if key is not None:
+            position = bisect_left(self._keys, key)
+            del self._keys[position]
+
+    def scan(
+        self,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None
+    ) -> Iterator[str]:
+        """IDs con date en [date_from, date_to), en orden, posteriores a after"""
+        start = (date_from, '') if date_from is not None else None
+        if after is not None:
+            # Saltar el último evento entregado y todo lo anterior
+            after_key = (after[0], after[1] + '\0')
+            start = after_key if start is None else max(start, after_key)
+
+        position = bisect_left(self._keys, start) if start is not None else 0
+        for index in range(position, len(self._keys)):
+            date, firebase_id = self._keys[index]
+            if date_to is not None and date >= date_to:
+                break
+            yield firebase_id
+
+
+class IntervalEventIndex(SortedEventIndex):
+    """Índice ordenado que además guarda el fin de cada evento para consultas de solapamiento"""
+
+    def __init__(self):
+        super().__init__()
+        self._ends: Dict[str, datetime] = {}
+        # Cota de la duración más larga; no se reduce al eliminar eventos
+        self._max_duration = timedelta(0)
+
+    def _set_end(self, event: Dict[str, Any]):
+        key = self._key_by_id.get(event['firebase_id'])
+        if key is None:
+            return
+        end = max(to_utc(event.get('end_time') or key[0]), key[0])
+        self._ends[event['firebase_id']] = end
+        self._max_duration = max(self._max_duration, end - key[0])
+
+    def add(self, event: Dict[str, Any]):
+        super().add(event)
+        self._set_end(event)
+
+    def rebuild(self, events: List[Dict[str, Any]]):
+        super().rebuild(events)
+        self._ends = {}
+        self._max_duration = timedelta(0)
+        for event in events:
+            self._set_end(event)
+
+    def remove(self, firebase_id: str):
+        super().remove(firebase_id)
+        self._ends.pop(firebase_id, None)
+
+    def overlapping(self, window_start: datetime, window_end: datetime) -> Iterator[str]:
+        """IDs cuyo intervalo [date, end_time] toca [window_start, window_end]
+
+        Ningún evento dura más que la duración máxima, así que basta recorrer
+        los que empiezan desde window_start menos esa duración: O(log n + k).
+        """
+        window_start, window_end = to_utc(window_start), to_utc(window_end)
+        position = bisect_left(self._keys, (window_start - self._max_duration, ''))
+        for index in range(position, len(self._keys)):
+            date, firebase_id = self._keys[index]
+            if date > window_end:
+                break
+            if self._ends[firebase_id] >= window_start:
+                yield firebase_id
+
+
+def query_index(
+    index: SortedEventIndex,
+    get_event: Callable[[str], Optional[Dict[str, Any]]],
+    user_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Página de eventos de un índice ordenado, con el cursor de la siguiente página"""
+    date_from, date_to = to_utc(date_from), to_utc(date_to)
+    after = decode_cursor(cursor) if cursor else None
+
+    events = []
+    for firebase_id in index.scan(date_from, date_to, after):
+        event = get_event(firebase_id)
+        if event is None:
+            continue
+        if user_id is not None and not owns_event(event, user_id):
+            continue
+        if event_type is not None and event.get('type') != event_type:
+            continue
+        events.append(event)
+        if limit is not None and len(events) > limit:
+            break
+
+    # Se leyó un evento de más para saber si hay otra página
+    if limit is not None and len(events) > limit:
+        events = events[:limit]
+        return events, encode_cursor(events[-1])
+    return events, None
@@ -0,0 +1,77 @@
+"""
+Respuestas NDJSON (un evento JSON por línea) para listados grandes.
+
+Los eventos se leen del almacén página por página siguiendo su cursor y
+cada página se envía como un solo bloque, de modo que la memoria y el
+tiempo hasta el primer byte no dependen del tamaño de la colección. Cada
+evento se serializa directamente con los campos de EventResponse, sin
+construir el modelo de pydantic.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.models.event_models import EventResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Campos de la respuesta, en el orden de EventResponse (pydantic 2 o la
+# versión 1 que instala requirements-render.txt)
+RESPONSE_FIELDS = tuple(getattr(EventResponse, 'model_fields', None) or EventResponse.__fields__)
+
+
+def wants_ndjson(accept: Optional[str]) -> bool:
+    """Indica si la cabecera Accept pide NDJSON"""
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def event_record(event: Dict[str, Any], firebase_id: Optional[str] = None) -> Dict[str, Any]:
+    """Campos de EventResponse del evento, sin validarlos con pydantic"""
+    record = {field: event.get(field) for field in RESPONSE_FIELDS}
+    record['id'] = firebase_id or event.get('firebase_id', '')
+    if firebase_id:
+        record['firebase_id'] = firebase_id
+    return record
+
+
+def dumps(value: Any) -> str:
+    """JSON compacto que serializa las fechas como texto ISO"""
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def event_to_ndjson(event: Dict[str, Any]) -> str:
+    """Línea NDJSON con los campos de EventResponse del evento"""
+    return dumps(event_record(event)) + '\n'
+
+
+async def stream_events(
+    fetch_page: Callable[[int, Optional[str]], Awaitable[Tuple[List[Dict[str, Any]], Optional[str]]]],
+    page_size: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> AsyncIterator[bytes]:
+    """Bloques NDJSON de las páginas de fetch_page(page_size, cursor)
+
+    Se detiene al agotar el cursor o al enviar limit eventos. Un error a
+    mitad del envío ya no puede cambiar el código de estado: se reporta en
+    una última línea {"error": ...}.
+    """
+    sent = 0
+    try:
+        while True:
+            size = page_size if limit is None else min(page_size, limit - sent)
+            events, cursor = await fetch_page(size, cursor)
+            if events:
+                sent += len(events)
+                yield ''.join(event_to_ndjson(event) for event in events).encode('utf-8')
+            if not cursor or (limit is not None and sent >= limit):
+                break
+    except Exception as e:
+        print(f"Error al enviar eventos en NDJSON: {e}")
+        yield (json.dumps({'error': str(e)}, ensure_ascii=False) + '\n').encode('utf-8')
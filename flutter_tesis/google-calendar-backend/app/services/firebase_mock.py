@@ -2,55 +2,187 @@
 Versión simplificada del servicio Firebase para pruebas
 Este archivo simula Firebase cuando no tienes las credenciales configuradas
 """
+import threading
+import uuid
+
+from app.services.event_index import IntervalEventIndex, event_owner, query_index, owns_event
 
 class FirebaseService:
     def __init__(self):
-        self.events = []  # Lista en memoria para pruebas
+        # Las rutas llaman al servicio desde el threadpool: un solo candado
+        # protege el almacén y sus índices
+        self._lock = threading.RLock()
+        self._by_id = {}  # firebase_id -> evento (almacenamiento principal)
+        self._by_google_id = {}  # (user_id, google_event_id) -> firebase_id
+        self._date_index = IntervalEventIndex()  # Índice por (date, end_time)
+        self._series_ids = set()  # Series recurrentes (se expanden aparte)
         print("⚠️  Firebase simulado - usando almacenamiento en memoria")
     
+    def _index(self, event):
+        """Registra el evento en los índices (también al cambiar sus campos)"""
+        firebase_id = event['firebase_id']
+        google_event_id = event.get('google_event_id')
+        if google_event_id:
+            self._by_google_id.setdefault((event_owner(event), google_event_id), firebase_id)
+        if event.get('recurrence'):
+            self._series_ids.add(firebase_id)
+        else:
+            self._series_ids.discard(firebase_id)
+        self._date_index.add(event)
+    
+    def _unindex_google_id(self, event):
+        key = (event_owner(event), event.get('google_event_id'))
+        if self._by_google_id.get(key) == event['firebase_id']:
+            del self._by_google_id[key]
+    
+    def _insert(self, firebase_id, event_data):
+        # Copia para que los cambios del llamador no alteren el almacén
+        event = {**event_data, 'firebase_id': firebase_id}
+        self._by_id[firebase_id] = event
+        self._index(event)
+    
+    def _merge(self, event, event_data):
+        if 'google_event_id' in event_data or 'user_id' in event_data:
+            self._unindex_google_id(event)
+        event.update(event_data)
+        self._index(event)
+    
     def get_all_events(self):
         """Obtiene todos los eventos (simulado)"""
-        return self.events
+        with self._lock:
+            # Copias para que los cambios del llamador no alteren el almacén
+            return [dict(event) for event in self._by_id.values()]
+    
+    def query_events(self, user_id=None, date_from=None, date_to=None, event_type=None, limit=None, cursor=None):
+        """Eventos por rango de fechas paginados con cursor (simulado)"""
+        with self._lock:
+            return query_index(self._date_index, self.get_event, user_id, date_from, date_to, event_type, limit, cursor)
+    
+    def find_overlapping(self, window_start, window_end, user_id):
+        """Eventos que solapan la ventana más las series recurrentes, listos para expand_events (simulado)"""
+        with self._lock:
+            firebase_ids = list(self._date_index.overlapping(window_start, window_end))
+            firebase_ids.extend(self._series_ids.difference(firebase_ids))
+            events = [self._by_id[firebase_id] for firebase_id in firebase_ids]
+            return [dict(event) for event in events if owns_event(event, user_id)]
+    
+    def get_event(self, firebase_id):
+        """Obtiene un evento por su ID (simulado)"""
+        with self._lock:
+            event = self._by_id.get(firebase_id)
+            return dict(event) if event is not None else None
     
     def create_event(self, event_data):
         """Crea un evento (simulado)"""
-        import uuid
-        event_id = str(uuid.uuid4())
-        event_data['firebase_id'] = event_id
-        self.events.append(event_data)
-        print(f"✅ Evento simulado creado: {event_data.get('title')}")
-        return event_id
+        with self._lock:
+            event_id = str(uuid.uuid4())
+            self._insert(event_id, event_data)
+            print(f"✅ Evento simulado creado: {event_data.get('title')}")
+            return event_id
     
     def update_event(self, firebase_id, event_data):
         """Actualiza un evento (simulado)"""
-        for i, event in enumerate(self.events):
-            if event.get('firebase_id') == firebase_id:
-                self.events[i].update(event_data)
-                print(f"✅ Evento simulado actualizado: {event_data.get('title', 'Sin título')}")
-                return True
-        return False
+        with self._lock:
+            event = self._by_id.get(firebase_id)
+            if event is None:
+                return False
+            self._merge(event, event_data)
+            print(f"✅ Evento simulado actualizado: {event_data.get('title', 'Sin título')}")
+            return True
+    
+    def _remove(self, firebase_id):
+        event = self._by_id.pop(firebase_id, None)
+        if event is not None:
+            self._unindex_google_id(event)
+            self._series_ids.discard(firebase_id)
+            self._date_index.remove(firebase_id)
+        return event
     
     def delete_event(self, firebase_id):
         """Elimina un evento (simulado)"""
-        original_count = len(self.events)
-        self.events = [e for e in self.events if e.get('firebase_id') != firebase_id]
-        success = len(self.events) < original_count
-        if success:
+        with self._lock:
+            if self._remove(firebase_id) is None:
+                return False
             print(f"✅ Evento simulado eliminado")
-        return success
+            return True
+    
+    def delete_events(self, firebase_ids):
+        """Elimina varios eventos (simulado)"""
+        with self._lock:
+            return {
+                firebase_id: None if self._remove(firebase_id) is not None else "Evento no encontrado"
+                for firebase_id in firebase_ids
+            }
     
-    def find_event_by_google_id(self, google_event_id):
-        """Busca un evento por Google ID (simulado)"""
-        for event in self.events:
-            if event.get('google_event_id') == google_event_id:
-                return event
-        return None
+    def find_event_by_google_id(self, google_event_id, user_id):
+        """Busca un evento del usuario por Google ID (simulado)"""
+        with self._lock:
+            firebase_id = self._by_google_id.get((user_id, google_event_id))
+            return self.get_event(firebase_id) if firebase_id else None
+    
+    def find_events_by_google_ids(self, google_event_ids, user_id):
+        """Busca varios eventos del usuario por Google ID (simulado)"""
+        with self._lock:
+            found = {}
+            for google_event_id in google_event_ids:
+                event = self.find_event_by_google_id(google_event_id, user_id)
+                if event is not None:
+                    found[google_event_id] = event
+            return found
     
     def add_google_id_to_event(self, firebase_id, google_event_id):
         """Agrega Google ID a un evento (simulado)"""
-        for event in self.events:
-            if event.get('firebase_id') == firebase_id:
-                event['google_event_id'] = google_event_id
-                print(f"✅ Google ID agregado al evento simulado")
-                return True
-        return False
+        with self._lock:
+            event = self._by_id.get(firebase_id)
+            if event is None:
+                return False
+            self._merge(event, {'google_event_id': google_event_id})
+            print(f"✅ Google ID agregado al evento simulado")
+            return True
+    
+    def create_events(self, events):
+        """Crea varios eventos (simulado)"""
+        with self._lock:
+            results = []
+            for event_data in events:
+                event_id = str(uuid.uuid4())
+                self._insert(event_id, event_data)
+                results.append({'firebase_id': event_id, 'error': None})
+            print(f"✅ {len(results)} eventos simulados creados")
+            return results
+    
+    def update_events(self, updates):
+        """Actualiza varios eventos (simulado)"""
+        with self._lock:
+            results = {}
+            for firebase_id, event_data in updates.items():
+                event = self._by_id.get(firebase_id)
+                if event is None:
+                    results[firebase_id] = "Evento no encontrado"
+                else:
+                    self._merge(event, event_data)
+                    results[firebase_id] = None
+            return results
+    
+    def upsert_events(self, events):
+        """Crea o combina varios eventos por firebase_id (simulado)"""
+        with self._lock:
+            for firebase_id, event_data in events.items():
+                event = self._by_id.get(firebase_id)
+                if event is not None:
+                    self._merge(event, event_data)
+                else:
+                    self._insert(firebase_id, event_data)
+            return {firebase_id: None for firebase_id in events}
+    
+    def add_google_ids_to_events(self, google_ids):
+        """Agrega Google IDs a varios eventos (simulado)"""
+        with self._lock:
+            results = {}
+            for firebase_id, google_event_id in google_ids.items():
+                event = self._by_id.get(firebase_id)
+                if event is not None:
+                    self._merge(event, {'google_event_id': google_event_id})
+                results[firebase_id] = event is not None
+            print(f"✅ {sum(results.values())} Google IDs agregados a eventos simulados")
+            return results
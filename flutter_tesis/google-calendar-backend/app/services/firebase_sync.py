@@ -1,13 +1,132 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 try:
     import firebase_admin
     from firebase_admin import credentials, firestore
+    # FieldPath no se reexporta en todas las versiones de google-cloud-firestore
+    from google.cloud.firestore_v1.field_path import FieldPath
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from config.settings import settings
+from app.services.event_index import to_utc, decode_cursor, encode_cursor
+
+# Máximo de operaciones por escritura en lote de Firestore
+FIRESTORE_BATCH_LIMIT = 500
+# Máximo de valores en una consulta 'in' de Firestore
+FIRESTORE_IN_QUERY_LIMIT = 30
+
+def normalize_dates(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Guarda date y end_time como Timestamp para que las consultas por rango los comparen
+    
+    También marca las series recurrentes con recurring, que Firestore sí
+    puede filtrar (no puede consultar si un campo existe).
+    """
+    normalized = dict(event_data)
+    for field in ('date', 'end_time'):
+        if normalized.get(field) is not None:
+            normalized[field] = to_utc(normalized[field])
+    if 'recurrence' in normalized:
+        normalized['recurring'] = bool(normalized['recurrence'])
+    return normalized
+
+def legacy_event_fixes(event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos a escribir en un documento anterior a las consultas por usuario y fecha
+    
+    Los eventos sin user_id pasan al usuario por defecto (su dueño hasta
+    ahora), las fechas de texto se convierten a Timestamp, los eventos sin
+    end_time terminan en su inicio y las series se marcan con recurring.
+    Retorna {} si el documento ya está al día; ValueError si una fecha no
+    se puede leer. Lo usa migrate_firestore.py.
+    """
+    fixes = {}
+    if not event_data.get('user_id'):
+        fixes['user_id'] = settings.DEFAULT_USER_ID
+    for field in ('date', 'end_time'):
+        if isinstance(event_data.get(field), str):
+            fixes[field] = to_utc(event_data[field])
+    if event_data.get('end_time') is None and event_data.get('date') is not None:
+        fixes['end_time'] = fixes.get('date', event_data['date'])
+    if event_data.get('recurrence') and event_data.get('recurring') is not True:
+        fixes['recurring'] = True
+    return fixes
+
+def build_events_query(
+    events_ref,
+    user_id: Optional[str] = None,
+    date_from=None,
+    date_to=None,
+    event_type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+):
+    """Consulta de eventos por rango de fechas ordenada por (date, id de documento)
+    
+    Sirve para el cliente síncrono y el asíncrono de Firestore. Requiere los
+    índices compuestos de firestore.indexes.json y documentos con user_id y
+    fechas Timestamp (ver migrate_firestore.py). Se pide un evento de más
+    para saber si existe otra página.
+    """
+    query = events_ref
+    if user_id is not None:
+        query = query.where('user_id', '==', user_id)
+    if event_type is not None:
+        query = query.where('type', '==', event_type)
+    if date_from is not None:
+        query = query.where('date', '>=', to_utc(date_from))
+    if date_to is not None:
+        query = query.where('date', '<', to_utc(date_to))
+    
+    query = query.order_by('date').order_by(FieldPath.document_id())
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.start_after([cursor_date, events_ref.document(cursor_id)])
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+def build_overlap_queries(events_ref, user_id: str, window_start):
+    """Consultas de find_overlapping: eventos del usuario que terminan desde window_start y sus series
+    
+    Firestore admite una sola desigualdad por consulta: la del fin usa el
+    índice (user_id, end_time) de firestore.indexes.json y la del inicio se
+    filtra en overlapping_events.
+    """
+    return (
+        events_ref.where('user_id', '==', user_id).where('end_time', '>=', to_utc(window_start)),
+        events_ref.where('user_id', '==', user_id).where('recurring', '==', True),
+    )
+
+def overlapping_events(event_docs, series_docs, window_end) -> List[Dict[str, Any]]:
+    """Combina los resultados de build_overlap_queries descartando los que empiezan después de la ventana"""
+    window_end = to_utc(window_end)
+    events = {}
+    for doc in event_docs:
+        event_data = doc.to_dict()
+        if event_data.get('recurrence') or not event_data.get('date') or to_utc(event_data['date']) > window_end:
+            continue
+        event_data['firebase_id'] = doc.id
+        events[doc.id] = event_data
+    for doc in series_docs:
+        event_data = doc.to_dict()
+        event_data['firebase_id'] = doc.id
+        events[doc.id] = event_data
+    return list(events.values())
+
+def events_page(docs, limit: Optional[int]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Convierte los documentos de build_events_query en (eventos, cursor siguiente)"""
+    events = []
+    for doc in docs:
+        event_data = doc.to_dict()
+        event_data['firebase_id'] = doc.id
+        events.append(event_data)
+    
+    if limit is not None and len(events) > limit:
+        events = events[:limit]
+        return events, encode_cursor(events[-1])
+    return events, None
 
 class FirebaseService:
     def __init__(self):
@@ -16,11 +135,14 @@ class FirebaseService:
             self._initialize_firebase()
         else:
             print("⚠️  Firebase no disponible, usando modo simulado")
-            from .firebase_mock import FirebaseService as MockFirebaseService
-            mock_service = MockFirebaseService()
+            from .mock_firebase import get_local_event_store
+            mock_service = get_local_event_store()
             # Copiar métodos del mock
-            for method_name in ['get_all_events', 'create_event', 'update_event', 
-                              'delete_event', 'find_event_by_google_id', 'add_google_id_to_event']:
+            for method_name in ['get_all_events', 'get_event', 'create_event', 'update_event', 
+                              'delete_event', 'find_event_by_google_id', 'find_events_by_google_ids',
+                              'add_google_id_to_event', 'add_google_ids_to_events',
+                              'create_events', 'update_events', 'upsert_events', 'delete_events',
+                              'query_events', 'find_overlapping']:
                 setattr(self, method_name, getattr(mock_service, method_name))
     
     def _initialize_firebase(self):
@@ -58,11 +180,50 @@ class FirebaseService:
             print(f"Error al obtener eventos de Firebase: {e}")
             return []
     
+    def query_events(
+        self,
+        user_id: Optional[str] = None,
+        date_from=None,
+        date_to=None,
+        event_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Eventos con date en [date_from, date_to) paginados con cursor
+        
+        Retorna los eventos de la página y el cursor de la siguiente (None si
+        no hay más).
+        """
+        query = build_events_query(
+            self.db.collection('events'), user_id, date_from, date_to, event_type, limit, cursor
+        )
+        return events_page(query.stream(), limit)
+    
+    def find_overlapping(self, window_start, window_end, user_id: str) -> List[Dict[str, Any]]:
+        """Eventos del usuario que solapan la ventana más sus series recurrentes, listos para expand_events"""
+        event_query, series_query = build_overlap_queries(self.db.collection('events'), user_id, window_start)
+        return overlapping_events(event_query.stream(), series_query.stream(), window_end)
+    
+    def get_event(self, firebase_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento por su ID de documento (una sola lectura)"""
+        try:
+            doc = self.db.collection('events').document(firebase_id).get()
+            if not doc.exists:
+                return None
+            
+            event_data = doc.to_dict()
+            event_data['firebase_id'] = doc.id
+            return event_data
+            
+        except Exception as e:
+            print(f"Error al obtener evento de Firebase: {e}")
+            return None
+    
     def create_event(self, event_data: Dict[str, Any]) -> str:
         """Crea un evento en Firestore"""
         try:
             events_ref = self.db.collection('events')
-            doc_ref = events_ref.add(event_data)
+            doc_ref = events_ref.add(normalize_dates(event_data))
             return doc_ref[1].id  # Retorna el ID del documento
             
         except Exception as e:
@@ -73,7 +234,7 @@ class FirebaseService:
         """Actualiza un evento en Firestore"""
         try:
             doc_ref = self.db.collection('events').document(firebase_id)
-            doc_ref.update(event_data)
+            doc_ref.update(normalize_dates(event_data))
             return True
             
         except Exception as e:
@@ -91,12 +252,12 @@ class FirebaseService:
             print(f"Error al eliminar evento de Firebase: {e}")
             return False
     
-    def find_event_by_google_id(self, google_event_id: str) -> Dict[str, Any]:
-        """Busca un evento por su ID de Google Calendar"""
+    def find_event_by_google_id(self, google_event_id: str, user_id: str) -> Dict[str, Any]:
+        """Busca un evento del usuario por su ID de Google Calendar"""
         try:
             events_ref = self.db.collection('events')
-            query = events_ref.where('google_event_id', '==', google_event_id)
-            docs = list(query.stream())
+            query = events_ref.where('user_id', '==', user_id).where('google_event_id', '==', google_event_id)
+            docs = list(query.limit(1).stream())
             
             if docs:
                 doc = docs[0]
@@ -110,6 +271,29 @@ class FirebaseService:
             print(f"Error al buscar evento por Google ID: {e}")
             return None
     
+    def find_events_by_google_ids(self, google_event_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Busca varios eventos del usuario por su ID de Google Calendar
+        
+        Usa consultas 'in' de hasta FIRESTORE_IN_QUERY_LIMIT IDs y retorna un
+        diccionario google_event_id -> evento con los que ya existen. Dos
+        usuarios que comparten un evento de Google tienen documentos distintos.
+        """
+        found = {}
+        unique_ids = list(dict.fromkeys(google_id for google_id in google_event_ids if google_id))
+        
+        for start in range(0, len(unique_ids), FIRESTORE_IN_QUERY_LIMIT):
+            chunk = unique_ids[start:start + FIRESTORE_IN_QUERY_LIMIT]
+            try:
+                query = self.db.collection('events').where('user_id', '==', user_id).where('google_event_id', 'in', chunk)
+                for doc in query.stream():
+                    event_data = doc.to_dict()
+                    event_data['firebase_id'] = doc.id
+                    found.setdefault(event_data['google_event_id'], event_data)
+            except Exception as e:
+                print(f"Error al buscar eventos por Google ID: {e}")
+        
+        return found
+    
     def add_google_id_to_event(self, firebase_id: str, google_event_id: str) -> bool:
         """Agrega el ID de Google Calendar a un evento existente"""
         try:
@@ -120,3 +304,106 @@ class FirebaseService:
         except Exception as e:
             print(f"Error al agregar Google ID al evento: {e}")
             return False
+    
+    def add_google_ids_to_events(self, google_ids: Dict[str, str]) -> Dict[str, bool]:
+        """Agrega IDs de Google Calendar a varios eventos con escrituras en lote
+        
+        Recibe un diccionario firebase_id -> google_event_id y retorna el
+        resultado de cada evento.
+        """
+        errors = self.update_events({
+            firebase_id: {'google_event_id': google_event_id}
+            for firebase_id, google_event_id in google_ids.items()
+        })
+        return {firebase_id: error is None for firebase_id, error in errors.items()}
+    
+    def _write_in_batches(self, operations: List[Tuple[str, Callable]]) -> Dict[str, Optional[str]]:
+        """Aplica operaciones (clave, escritura) en lotes de hasta FIRESTORE_BATCH_LIMIT
+        
+        Los lotes se confirman en paralelo. Un lote es atómico: si falla, sus
+        operaciones se reintentan una por una para aislar las que fallan.
+        Retorna clave -> mensaje de error (None si la escritura se aplicó).
+        """
+        def commit_chunk(chunk):
+            batch = self.db.batch()
+            for _, write in chunk:
+                write(batch)
+            try:
+                batch.commit()
+                return {key: None for key, _ in chunk}
+            except Exception as e:
+                print(f"Error en escritura en lote ({len(chunk)} operaciones), reintentando individualmente: {e}")
+            
+            results = {}
+            for key, write in chunk:
+                single = self.db.batch()
+                write(single)
+                try:
+                    single.commit()
+                    results[key] = None
+                except Exception as e:
+                    results[key] = str(e)
+            return results
+        
+        chunks = [
+            operations[start:start + FIRESTORE_BATCH_LIMIT]
+            for start in range(0, len(operations), FIRESTORE_BATCH_LIMIT)
+        ]
+        results = {}
+        if not chunks:
+            return results
+        with ThreadPoolExecutor(max_workers=min(settings.FIRESTORE_COMMIT_CONCURRENCY, len(chunks))) as executor:
+            for chunk_results in executor.map(commit_chunk, chunks):
+                results.update(chunk_results)
+        return results
+    
+    def create_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea varios eventos con escrituras en lote
+        
+        Retorna, en el mismo orden, {'firebase_id', 'error'} por evento.
+        """
+        events_ref = self.db.collection('events')
+        doc_refs = [events_ref.document() for _ in events]
+        errors = self._write_in_batches([
+            (doc_ref.id, lambda batch, doc_ref=doc_ref, event_data=event_data: batch.create(doc_ref, normalize_dates(event_data)))
+            for doc_ref, event_data in zip(doc_refs, events)
+        ])
+        return [
+            {
+                'firebase_id': None if errors[doc_ref.id] else doc_ref.id,
+                'error': errors[doc_ref.id]
+            }
+            for doc_ref in doc_refs
+        ]
+    
+    def update_events(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Actualiza varios eventos existentes con escrituras en lote
+        
+        Recibe firebase_id -> campos y retorna firebase_id -> error (None si se aplicó).
+        """
+        events_ref = self.db.collection('events')
+        return self._write_in_batches([
+            (firebase_id, lambda batch, firebase_id=firebase_id, event_data=event_data:
+                batch.update(events_ref.document(firebase_id), normalize_dates(event_data)))
+            for firebase_id, event_data in updates.items()
+        ])
+    
+    def delete_events(self, firebase_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Elimina varios eventos con escrituras en lote
+        
+        Retorna firebase_id -> error (None si se eliminó o no existía).
+        """
+        events_ref = self.db.collection('events')
+        return self._write_in_batches([
+            (firebase_id, lambda batch, firebase_id=firebase_id: batch.delete(events_ref.document(firebase_id)))
+            for firebase_id in firebase_ids
+        ])
+    
+    def upsert_events(self, events: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Crea o combina varios eventos por firebase_id con escrituras en lote"""
+        events_ref = self.db.collection('events')
+        return self._write_in_batches([
+            (firebase_id, lambda batch, firebase_id=firebase_id, event_data=event_data:
+                batch.set(events_ref.document(firebase_id), normalize_dates(event_data), merge=True))
+            for firebase_id, event_data in events.items()
+        ])
@@ -0,0 +1,149 @@
+"""
+Cliente de larga duración para Google Calendar.
+
+Construye el servicio de la API una sola vez (compartido por todos los
+usuarios) y mantiene por usuario un pool de transportes HTTP autorizados
+para poder ejecutar peticiones desde varios hilos (httplib2 no es
+thread-safe).
+"""
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+from config.settings import settings
+from app.services.rate_limiter import get_quota_limiter
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_shared_service():
+    """Retorna el servicio de Calendar, construyéndolo solo la primera vez"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                # El documento de descubrimiento estático evita una
+                # petición de red; las credenciales se aplican por
+                # transporte en cada ejecución
+                _service = build(
+                    'calendar', 'v3',
+                    http=httplib2.Http(),
+                    static_discovery=True
+                )
+    return _service
+
+
+class GoogleCalendarClient:
+    """Servicio de Calendar compartido + pool de transportes autorizados de un usuario"""
+
+    def __init__(self, auth_service, pool_size: int = None, user_id: str = 'default'):
+        self.auth_service = auth_service
+        self.user_id = user_id
+        self.limiter = get_quota_limiter()
+        self.pool_size = pool_size or settings.GOOGLE_HTTP_POOL_SIZE
+        self._lock = threading.Lock()
+        self._pool = queue.LifoQueue(maxsize=self.pool_size)
+        self._credentials = None
+        # Se incrementa cada vez que cambian las credenciales
+        self._generation = 0
+
+    def get_service(self):
+        """Retorna el servicio de Calendar compartido"""
+        return get_shared_service()
+
+    def get_credentials(self):
+        """Obtiene las credenciales vigentes y detecta si fueron refrescadas"""
+        credentials = self.auth_service.get_stored_credentials()
+        if not credentials:
+            raise Exception("No hay credenciales válidas. El usuario debe autenticarse primero.")
+
+        with self._lock:
+            if (self._credentials is not credentials
+                    or getattr(self._credentials, 'token', None) != credentials.token):
+                self._credentials = credentials
+                self._generation += 1
+            return self._credentials, self._generation
+
+    @contextmanager
+    def http(self):
+        """Toma prestado un transporte autorizado del pool"""
+        credentials, generation = self.get_credentials()
+
+        try:
+            transport = self._pool.get_nowait()
+        except queue.Empty:
+            transport = AuthorizedHttp(credentials, http=httplib2.Http())
+            transport.generation = generation
+
+        # Cambiar las credenciales sin reconstruir el transporte
+        if transport.generation != generation:
+            transport.credentials = credentials
+            transport.generation = generation
+
+        try:
+            yield transport
+        finally:
+            try:
+                self._pool.put_nowait(transport)
+            except queue.Full:
+                transport.close()
+
+    def execute(self, request, cost: int = 1):
+        """Ejecuta una petición de la API usando un transporte del pool
+        
+        La petición pasa por el limitador de cuota, que la pausa si no hay
+        presupuesto y la reintenta ante errores de cuota o transitorios.
+        cost indica cuántas operaciones consume (por ejemplo en un batch).
+        """
+        def run():
+            with self.http() as transport:
+                return request.execute(http=transport)
+        
+        return self.limiter.call(run, user_id=self.user_id, cost=cost)
+
+    def reset(self):
+        """Descarta credenciales y transportes (por ejemplo tras revocar)"""
+        with self._lock:
+            self._credentials = None
+            self._generation += 1
+            while True:
+                try:
+                    self._pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+
+_clients: "OrderedDict[str, GoogleCalendarClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def get_calendar_client(user_id: str = None):
+    """Retorna el cliente de Google Calendar del usuario
+
+    Solo los usuarios usados más recientemente conservan su pool de
+    transportes; los demás se recrean al volver a usarse.
+    """
+    from app.auth.google_oauth import GoogleAuthService
+    user_id = user_id or settings.DEFAULT_USER_ID
+
+    evicted = []
+    with _clients_lock:
+        client = _clients.get(user_id)
+        if client is None:
+            client = GoogleCalendarClient(GoogleAuthService(user_id), user_id=user_id)
+            _clients[user_id] = client
+            while len(_clients) > settings.CREDENTIAL_CACHE_SIZE:
+                evicted.append(_clients.popitem(last=False)[1])
+        else:
+            _clients.move_to_end(user_id)
+
+    for old_client in evicted:
+        old_client.reset()
+    return client
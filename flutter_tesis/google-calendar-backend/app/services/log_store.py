@@ -0,0 +1,404 @@
+"""
+Almacén local de eventos basado en un log de solo escritura al final.
+
+Los eventos viven en memoria con índices por firebase_id, google_event_id e
+intervalo de fechas. Cada escritura agrega una línea al write-ahead log (O(1) por
+operación); un hilo en segundo plano agrupa los fsync y compacta el log en
+un snapshot cuando crece. Al iniciar se carga el snapshot y se reaplica el
+log. Pensado para un solo proceso (staging, CI y desarrollo sin Firebase).
+
+Durabilidad: con LOCAL_STORE_SYNC_WRITES (por defecto) cada escritura
+retorna solo cuando el fsync que la incluye terminó (group commit: las
+escrituras que llegan durante un fsync comparten el siguiente). Sin él las
+escrituras retornan de inmediato y una caída del sistema puede perder las
+de los últimos LOCAL_STORE_FSYNC_INTERVAL segundos.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from config.settings import settings
+from app.services.event_index import IntervalEventIndex, event_owner, jsonable_event, owns_event, query_index
+
+
+class LogEventStore:
+    """Almacén de eventos en memoria respaldado por snapshot + write-ahead log"""
+
+    def __init__(self, data_dir: Optional[str] = None):
+        self.data_dir = data_dir or settings.LOCAL_STORE_DIR
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.snapshot_file = os.path.join(self.data_dir, "events.snapshot.json")
+        self.log_file = os.path.join(self.data_dir, "events.wal")
+        # Log en proceso de compactación (se conserva hasta escribir el snapshot)
+        self.compacting_file = f"{self.log_file}.compacting"
+
+        self._lock = threading.RLock()
+        self._events: Dict[str, Dict[str, Any]] = {}
+        # (user_id, google_event_id) -> firebase_id: dos usuarios pueden
+        # compartir un evento de Google con documentos distintos
+        self._by_google_id: Dict[Tuple[str, str], str] = {}
+        self._date_index = IntervalEventIndex()
+        # Series recurrentes (se expanden aparte)
+        self._series_ids = set()
+
+        self._recover()
+        if os.path.exists(self.compacting_file):
+            # Compactación interrumpida: completarla antes de aceptar escrituras
+            self._write_snapshot(json.dumps(list(self._events.values()), separators=(',', ':')))
+            os.remove(self.compacting_file)
+        self._log = open(self.log_file, 'a', encoding='utf-8')
+        self._log_size = self._log.tell()
+        # Escrituras agregadas al log y escrituras ya en disco (group commit)
+        self._written = 0
+        self._synced = 0
+        # Se toma antes que _lock; impide cerrar el log durante un fsync
+        self._fsync_lock = threading.Lock()
+        self._durable = threading.Condition()
+        self._compactor: Optional[threading.Thread] = None
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="log-store-fsync", daemon=True)
+        self._flusher.start()
+        print(f"🗂️  Almacén local de eventos en {self.data_dir} ({len(self._events)} eventos)")
+
+    # -- Recuperación -----------------------------------------------------
+
+    def _recover(self):
+        """Carga el snapshot y reaplica los logs; el índice de fechas se arma al final
+
+        Indexar las fechas evento por evento (insort) haría la recuperación
+        O(n²); se reconstruye con un solo ordenamiento.
+        """
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                for event in json.load(f):
+                    self._index(event, index_dates=False)
+
+        # Reaplicar los logs en orden; las operaciones son idempotentes
+        for log_file in (self.compacting_file, self.log_file):
+            if not os.path.exists(log_file):
+                continue
+            valid_size = 0
+            with open(log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._apply(record, index_dates=False)
+                    valid_size += len(line)
+            if valid_size < os.path.getsize(log_file):
+                # Última línea incompleta tras una caída: descartarla para
+                # que las escrituras nuevas no queden pegadas a ella
+                os.truncate(log_file, valid_size)
+
+        self._date_index.rebuild(list(self._events.values()))
+
+    def _apply(self, record: Dict[str, Any], index_dates: bool = True):
+        operation, firebase_id = record['op'], record['id']
+        if operation == 'put':
+            self._index({**record['data'], 'firebase_id': firebase_id}, index_dates)
+        elif operation == 'patch':
+            event = self._events.get(firebase_id)
+            if event is not None:
+                self._index({**event, **record['data']}, index_dates)
+        elif operation == 'del':
+            self._unindex(firebase_id, index_dates)
+
+    def _index(self, event: Dict[str, Any], index_dates: bool = True):
+        firebase_id = event['firebase_id']
+        previous = self._events.get(firebase_id)
+        if previous is not None:
+            previous_key = (event_owner(previous), previous.get('google_event_id'))
+            if previous_key != (event_owner(event), event.get('google_event_id')) \
+                    and self._by_google_id.get(previous_key) == firebase_id:
+                del self._by_google_id[previous_key]
+
+        self._events[firebase_id] = event
+        if event.get('google_event_id'):
+            self._by_google_id.setdefault((event_owner(event), event['google_event_id']), firebase_id)
+        if event.get('recurrence'):
+            self._series_ids.add(firebase_id)
+        else:
+            self._series_ids.discard(firebase_id)
+        if index_dates:
+            self._date_index.add(event)
+
+    def _unindex(self, firebase_id: str, index_dates: bool = True) -> Optional[Dict[str, Any]]:
+        event = self._events.pop(firebase_id, None)
+        if event is not None:
+            key = (event_owner(event), event.get('google_event_id'))
+            if self._by_google_id.get(key) == firebase_id:
+                del self._by_google_id[key]
+            self._series_ids.discard(firebase_id)
+            if index_dates:
+                self._date_index.remove(firebase_id)
+        return event
+
+    # -- Log --------------------------------------------------------------
+
+    def _append(self, records: List[Dict[str, Any]]) -> int:
+        """Escribe los registros al log y los aplica en memoria (con el lock tomado)
+
+        Retorna el número de la escritura, que se pasa a _wait_durable
+        después de soltar el lock.
+        """
+        lines = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records)
+        self._log.write(lines)
+        self._log.flush()
+        # Bytes en disco, no caracteres: los títulos pueden no ser ASCII
+        self._log_size += len(lines.encode('utf-8'))
+        with self._durable:
+            self._written += 1
+            ticket = self._written
+            self._durable.notify_all()
+        for record in records:
+            self._apply(record)
+
+        compacting = self._compactor is not None and self._compactor.is_alive()
+        if self._log_size >= settings.LOCAL_STORE_COMPACT_BYTES and not compacting:
+            self._compactor = threading.Thread(target=self.compact, name="log-store-compact", daemon=True)
+            self._compactor.start()
+        return ticket
+
+    def _wait_durable(self, ticket: int):
+        """Espera a que la escritura esté en disco (sin el lock tomado)"""
+        if not settings.LOCAL_STORE_SYNC_WRITES:
+            return
+        with self._durable:
+            while self._synced < ticket and not self._closed.is_set():
+                self._durable.wait()
+
+    def _flush_loop(self):
+        while True:
+            with self._durable:
+                while self._synced >= self._written and not self._closed.is_set():
+                    self._durable.wait()
+            if self._closed.is_set():
+                return
+            if not settings.LOCAL_STORE_SYNC_WRITES:
+                # Nadie espera: un fsync por intervalo cubre lo acumulado
+                time.sleep(settings.LOCAL_STORE_FSYNC_INTERVAL)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error al sincronizar el log de eventos: {e}")
+                time.sleep(settings.LOCAL_STORE_FSYNC_INTERVAL)
+
+    def _mark_synced(self, ticket: int):
+        with self._durable:
+            self._synced = max(self._synced, ticket)
+            self._durable.notify_all()
+
+    def _sync_locked(self):
+        """fsync del log con _fsync_lock y _lock tomados (antes de cerrarlo)"""
+        ticket = self._written
+        if ticket > self._synced:
+            os.fsync(self._log.fileno())
+            self._mark_synced(ticket)
+
+    def sync(self):
+        """Fuerza a disco las escrituras ya agregadas al log
+
+        El fsync se hace fuera de _lock para no frenar a los lectores ni a
+        las escrituras que formarán el siguiente grupo.
+        """
+        with self._fsync_lock:
+            with self._lock:
+                ticket = self._written
+                if ticket <= self._synced:
+                    return
+                fileno = self._log.fileno()
+            os.fsync(fileno)
+            self._mark_synced(ticket)
+
+    def compact(self):
+        """Escribe un snapshot del estado actual y descarta el log ya incluido"""
+        try:
+            with self._fsync_lock, self._lock:
+                self._sync_locked()
+                snapshot = json.dumps(list(self._events.values()), separators=(',', ':'))
+                self._log.close()
+                if os.path.exists(self.compacting_file):
+                    # Quedó un log de una compactación fallida: compactar
+                    # todo sin soltar el lock para no sobrescribirlo
+                    self._write_snapshot(snapshot)
+                    os.remove(self.compacting_file)
+                    self._log = open(self.log_file, 'w', encoding='utf-8')
+                    self._log_size = 0
+                    return
+                # Las escrituras siguientes van a un log nuevo
+                os.replace(self.log_file, self.compacting_file)
+                self._log = open(self.log_file, 'a', encoding='utf-8')
+                self._log_size = 0
+
+            self._write_snapshot(snapshot)
+            os.remove(self.compacting_file)
+            print(f"🗂️  Log de eventos compactado ({len(snapshot)} bytes)")
+        except Exception as e:
+            print(f"Error al compactar el log de eventos: {e}")
+
+    def _write_snapshot(self, snapshot: str):
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.snapshot_file)
+
+    def close(self):
+        """Detiene los hilos en segundo plano y cierra el log"""
+        self._closed.set()
+        with self._durable:
+            self._durable.notify_all()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._fsync_lock, self._lock:
+            self._sync_locked()
+            self._log.close()
+
+    # -- Lecturas ---------------------------------------------------------
+
+    def get_all_events(self) -> List[Dict[str, Any]]:
+        """Obtiene todos los eventos"""
+        with self._lock:
+            return [dict(event) for event in self._events.values()]
+
+    def get_event(self, firebase_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento por su ID"""
+        with self._lock:
+            event = self._events.get(firebase_id)
+            return dict(event) if event is not None else None
+
+    def query_events(
+        self,
+        user_id: Optional[str] = None,
+        date_from=None,
+        date_to=None,
+        event_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Eventos por rango de fechas paginados con cursor usando el índice ordenado"""
+        with self._lock:
+            events, next_cursor = query_index(
+                self._date_index, self._events.get, user_id, date_from, date_to, event_type, limit, cursor
+            )
+            return [dict(event) for event in events], next_cursor
+
+    def find_overlapping(self, window_start, window_end, user_id: str) -> List[Dict[str, Any]]:
+        """Eventos del usuario que solapan la ventana más sus series recurrentes, listos para expand_events"""
+        with self._lock:
+            firebase_ids = list(self._date_index.overlapping(window_start, window_end))
+            firebase_ids.extend(self._series_ids.difference(firebase_ids))
+            return [
+                dict(self._events[firebase_id]) for firebase_id in firebase_ids
+                if owns_event(self._events[firebase_id], user_id)
+            ]
+
+    def find_event_by_google_id(self, google_event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Busca un evento del usuario por su ID de Google Calendar"""
+        with self._lock:
+            firebase_id = self._by_google_id.get((user_id, google_event_id))
+            return self.get_event(firebase_id) if firebase_id else None
+
+    def find_events_by_google_ids(self, google_event_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Busca varios eventos del usuario por su ID de Google Calendar"""
+        with self._lock:
+            found = {}
+            for google_event_id in google_event_ids:
+                firebase_id = self._by_google_id.get((user_id, google_event_id))
+                if firebase_id:
+                    found[google_event_id] = dict(self._events[firebase_id])
+            return found
+
+    # -- Escrituras -------------------------------------------------------
+
+    def create_event(self, event_data: Dict[str, Any]) -> str:
+        """Crea un evento"""
+        return self.create_events([event_data])[0]['firebase_id']
+
+    def create_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea varios eventos con una sola escritura al log"""
+        now = datetime.now().isoformat()
+        records = []
+        for event_data in events:
+            firebase_id = str(uuid.uuid4())
+            event_data['firebase_id'] = firebase_id
+            records.append({'op': 'put', 'id': firebase_id, 'data': {**jsonable_event(event_data), 'created_at': now}})
+
+        with self._lock:
+            ticket = self._append(records)
+        self._wait_durable(ticket)
+        return [{'firebase_id': record['id'], 'error': None} for record in records]
+
+    def update_event(self, firebase_id: str, event_data: Dict[str, Any]) -> bool:
+        """Actualiza un evento"""
+        return self.update_events({firebase_id: event_data})[firebase_id] is None
+
+    def update_events(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Actualiza varios eventos existentes con una sola escritura al log"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            results = {}
+            records = []
+            for firebase_id, event_data in updates.items():
+                if firebase_id not in self._events:
+                    results[firebase_id] = "Evento no encontrado"
+                    continue
+                records.append({'op': 'patch', 'id': firebase_id, 'data': {**jsonable_event(event_data), 'updated_at': now}})
+                results[firebase_id] = None
+            ticket = self._append(records) if records else 0
+        self._wait_durable(ticket)
+        return results
+
+    def upsert_events(self, events: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Crea o combina varios eventos por firebase_id con una sola escritura al log"""
+        now = datetime.now().isoformat()
+        with self._lock:
+            records = [
+                {'op': 'patch', 'id': firebase_id, 'data': {**jsonable_event(event_data), 'updated_at': now}}
+                if firebase_id in self._events else
+                {'op': 'put', 'id': firebase_id, 'data': {**jsonable_event(event_data), 'created_at': now}}
+                for firebase_id, event_data in events.items()
+            ]
+            ticket = self._append(records)
+        self._wait_durable(ticket)
+        return {firebase_id: None for firebase_id in events}
+
+    def delete_event(self, firebase_id: str) -> bool:
+        """Elimina un evento"""
+        with self._lock:
+            if firebase_id not in self._events:
+                return False
+            ticket = self._append([{'op': 'del', 'id': firebase_id}])
+        self._wait_durable(ticket)
+        return True
+
+    def delete_events(self, firebase_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Elimina varios eventos con una sola escritura al log"""
+        with self._lock:
+            results = {
+                firebase_id: None if firebase_id in self._events else "Evento no encontrado"
+                for firebase_id in firebase_ids
+            }
+            records = [{'op': 'del', 'id': firebase_id} for firebase_id, error in results.items() if error is None]
+            ticket = self._append(records) if records else 0
+        self._wait_durable(ticket)
+        return results
+
+    def add_google_id_to_event(self, firebase_id: str, google_event_id: str) -> bool:
+        """Agrega el ID de Google Calendar a un evento existente"""
+        return self.update_event(firebase_id, {'google_event_id': google_event_id})
+
+    def add_google_ids_to_events(self, google_ids: Dict[str, str]) -> Dict[str, bool]:
+        """Agrega IDs de Google Calendar a varios eventos"""
+        errors = self.update_events({
+            firebase_id: {'google_event_id': google_event_id}
+            for firebase_id, google_event_id in google_ids.items()
+        })
+        return {firebase_id: error is None for firebase_id, error in errors.items()}
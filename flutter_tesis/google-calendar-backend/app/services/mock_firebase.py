@@ -2,10 +2,13 @@
 Servicio temporal de Firebase que funciona sin conexión real
 para pruebas de Google Calendar
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import json
 import os
+import threading
+from config.settings import settings
+from app.services.event_index import IntervalEventIndex, event_owner, owns_event, query_index
 
 class MockFirebaseService:
     """Servicio de Firebase simulado para pruebas"""
@@ -13,6 +16,14 @@ class MockFirebaseService:
     def __init__(self):
         # Usar archivo temporal para simular base de datos
         self.data_file = "temp_events.json"
+        # Datos parseados e índice firebase_id -> evento, válidos mientras
+        # el archivo no cambie
+        self._cache = None
+        self._cache_signature = None
+        self._index = {}
+        # (user_id, google_event_id) -> firebase_id
+        self._by_google_id = {}
+        self._date_index = IntervalEventIndex()
         self._ensure_data_file()
         print("🔥 Usando Firebase simulado para pruebas")
     
@@ -22,11 +33,32 @@ class MockFirebaseService:
             with open(self.data_file, 'w') as f:
                 json.dump({"events": []}, f)
     
+    def _file_signature(self):
+        stat = os.stat(self.data_file)
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _set_cache(self, data, signature):
+        # Agregar firebase_id a cada evento e indexarlos
+        for i, event in enumerate(data.get("events", [])):
+            if 'firebase_id' not in event:
+                event['firebase_id'] = f"temp_id_{i}"
+        self._cache = data
+        self._cache_signature = signature
+        self._index = {event['firebase_id']: event for event in data.get("events", [])}
+        self._by_google_id = {}
+        for event in data.get("events", []):
+            if event.get('google_event_id'):
+                self._by_google_id.setdefault((event_owner(event), event['google_event_id']), event['firebase_id'])
+        self._date_index.rebuild(data.get("events", []))
+    
     def _load_data(self):
-        """Carga datos del archivo temporal"""
+        """Carga datos del archivo temporal (solo se vuelve a leer si cambió)"""
         try:
-            with open(self.data_file, 'r') as f:
-                return json.load(f)
+            signature = self._file_signature()
+            if self._cache is None or signature != self._cache_signature:
+                with open(self.data_file, 'r') as f:
+                    self._set_cache(json.load(f), signature)
+            return self._cache
         except:
             return {"events": []}
     
@@ -34,23 +66,49 @@ class MockFirebaseService:
         """Guarda datos al archivo temporal"""
         with open(self.data_file, 'w') as f:
             json.dump(data, f, indent=2)
+        self._set_cache(data, self._file_signature())
     
     def get_all_events(self) -> List[Dict[str, Any]]:
         """Obtiene todos los eventos"""
         try:
             data = self._load_data()
-            events = data.get("events", [])
-            
-            # Agregar firebase_id a cada evento
-            for i, event in enumerate(events):
-                if 'firebase_id' not in event:
-                    event['firebase_id'] = f"temp_id_{i}"
-            
-            return events
+            # Copias para que los cambios del llamador no alteren la caché
+            return [dict(event) for event in data.get("events", [])]
         except Exception as e:
             print(f"Error cargando eventos: {e}")
             return []
     
+    def query_events(
+        self,
+        user_id: Optional[str] = None,
+        date_from=None,
+        date_to=None,
+        event_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Eventos por rango de fechas paginados con cursor usando el índice ordenado"""
+        self._load_data()
+        events, next_cursor = query_index(
+            self._date_index, self._index.get, user_id, date_from, date_to, event_type, limit, cursor
+        )
+        return [dict(event) for event in events], next_cursor
+    
+    def find_overlapping(self, window_start, window_end, user_id: str) -> List[Dict[str, Any]]:
+        """Eventos del usuario que solapan la ventana más sus series recurrentes, listos para expand_events"""
+        data = self._load_data()
+        firebase_ids = set(self._date_index.overlapping(window_start, window_end))
+        return [
+            dict(event) for event in data.get("events", [])
+            if (event['firebase_id'] in firebase_ids or event.get('recurrence')) and owns_event(event, user_id)
+        ]
+    
+    def get_event(self, firebase_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento por su ID usando el índice en memoria"""
+        self._load_data()
+        event = self._index.get(firebase_id)
+        return dict(event) if event is not None else None
+    
     def create_event(self, event_data: Dict[str, Any]) -> str:
         """Crea un evento"""
         try:
@@ -75,16 +133,15 @@ class MockFirebaseService:
         """Actualiza un evento"""
         try:
             data = self._load_data()
-            events = data.get("events", [])
+            event = self._index.get(firebase_id)
             
-            for i, event in enumerate(events):
-                if event.get('firebase_id') == firebase_id:
-                    # Actualizar evento
-                    events[i].update(event_data)
-                    events[i]['updated_at'] = datetime.now().isoformat()
-                    self._save_data(data)
-                    print(f"✅ Evento actualizado (simulado): {firebase_id}")
-                    return True
+            if event is not None:
+                # Actualizar evento
+                event.update(event_data)
+                event['updated_at'] = datetime.now().isoformat()
+                self._save_data(data)
+                print(f"✅ Evento actualizado (simulado): {firebase_id}")
+                return True
             
             print(f"❌ Evento no encontrado: {firebase_id}")
             return False
@@ -115,21 +172,32 @@ class MockFirebaseService:
             print(f"Error eliminando evento: {e}")
             return False
     
-    def find_event_by_google_id(self, google_event_id: str) -> Dict[str, Any]:
-        """Busca un evento por su ID de Google Calendar"""
+    def find_event_by_google_id(self, google_event_id: str, user_id: str) -> Dict[str, Any]:
+        """Busca un evento del usuario por su ID de Google Calendar"""
         try:
-            events = self.get_all_events()
-            
-            for event in events:
-                if event.get('google_event_id') == google_event_id:
-                    return event
-            
-            return None
+            self._load_data()
+            firebase_id = self._by_google_id.get((user_id, google_event_id))
+            return self.get_event(firebase_id) if firebase_id else None
             
         except Exception as e:
             print(f"Error buscando evento por Google ID: {e}")
             return None
     
+    def find_events_by_google_ids(self, google_event_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Busca varios eventos del usuario por su ID de Google Calendar con el índice en memoria"""
+        try:
+            self._load_data()
+            found = {}
+            for google_event_id in google_event_ids:
+                firebase_id = self._by_google_id.get((user_id, google_event_id))
+                if firebase_id:
+                    found[google_event_id] = dict(self._index[firebase_id])
+            return found
+            
+        except Exception as e:
+            print(f"Error buscando eventos por Google ID: {e}")
+            return {}
+    
     def add_google_id_to_event(self, firebase_id: str, google_event_id: str) -> bool:
         """Agrega el ID de Google Calendar a un evento existente"""
         try:
@@ -137,6 +205,137 @@ class MockFirebaseService:
         except Exception as e:
             print(f"Error agregando Google ID: {e}")
             return False
+    
+    def add_google_ids_to_events(self, google_ids: Dict[str, str]) -> Dict[str, bool]:
+        """Agrega IDs de Google Calendar a varios eventos con una sola escritura"""
+        results = {firebase_id: False for firebase_id in google_ids}
+        try:
+            data = self._load_data()
+            now = datetime.now().isoformat()
+            
+            for event in data.get("events", []):
+                firebase_id = event.get('firebase_id')
+                if firebase_id in google_ids:
+                    event['google_event_id'] = google_ids[firebase_id]
+                    event['updated_at'] = now
+                    results[firebase_id] = True
+            
+            self._save_data(data)
+            print(f"✅ {sum(results.values())} Google IDs agregados (simulado)")
+            return results
+            
+        except Exception as e:
+            print(f"Error agregando Google IDs: {e}")
+            return {firebase_id: False for firebase_id in google_ids}
+
+    def create_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea varios eventos con una sola escritura"""
+        try:
+            data = self._load_data()
+            now = datetime.now()
+            
+            results = []
+            for i, event_data in enumerate(events):
+                event_id = f"temp_id_{now.timestamp()}_{i}"
+                event_data['firebase_id'] = event_id
+                event_data['created_at'] = now.isoformat()
+                data["events"].append(event_data)
+                results.append({'firebase_id': event_id, 'error': None})
+            
+            self._save_data(data)
+            print(f"✅ {len(results)} eventos creados (simulado)")
+            return results
+            
+        except Exception as e:
+            print(f"Error creando eventos: {e}")
+            return [{'firebase_id': None, 'error': str(e)} for _ in events]
+    
+    def update_events(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Actualiza varios eventos con una sola escritura"""
+        try:
+            data = self._load_data()
+            now = datetime.now().isoformat()
+            
+            results = {firebase_id: "Evento no encontrado" for firebase_id in updates}
+            for event in data.get("events", []):
+                firebase_id = event.get('firebase_id')
+                if firebase_id in updates:
+                    event.update(updates[firebase_id])
+                    event['updated_at'] = now
+                    results[firebase_id] = None
+            
+            self._save_data(data)
+            return results
+            
+        except Exception as e:
+            print(f"Error actualizando eventos: {e}")
+            return {firebase_id: str(e) for firebase_id in updates}
+    
+    def delete_events(self, firebase_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Elimina varios eventos con una sola escritura"""
+        try:
+            data = self._load_data()
+            events = data.get("events", [])
+            
+            wanted = set(firebase_ids)
+            existing = {e.get('firebase_id') for e in events}
+            data["events"] = [e for e in events if e.get('firebase_id') not in wanted]
+            
+            self._save_data(data)
+            return {
+                firebase_id: None if firebase_id in existing else "Evento no encontrado"
+                for firebase_id in firebase_ids
+            }
+            
+        except Exception as e:
+            print(f"Error eliminando eventos: {e}")
+            return {firebase_id: str(e) for firebase_id in firebase_ids}
+    
+    def upsert_events(self, events: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Crea o combina varios eventos por firebase_id con una sola escritura"""
+        try:
+            data = self._load_data()
+            now = datetime.now().isoformat()
+            
+            pending = dict(events)
+            for event in data.get("events", []):
+                firebase_id = event.get('firebase_id')
+                if firebase_id in pending:
+                    event.update(pending.pop(firebase_id))
+                    event['updated_at'] = now
+            for firebase_id, event_data in pending.items():
+                data["events"].append({**event_data, 'firebase_id': firebase_id, 'created_at': now})
+            
+            self._save_data(data)
+            return {firebase_id: None for firebase_id in events}
+            
+        except Exception as e:
+            print(f"Error guardando eventos: {e}")
+            return {firebase_id: str(e) for firebase_id in events}
+
+_local_store = None
+_local_store_lock = threading.Lock()
+
+
+def get_local_event_store():
+    """Almacén local compartido por el proceso según LOCAL_EVENT_STORE"""
+    global _local_store
+    if _local_store is None:
+        with _local_store_lock:
+            if _local_store is None:
+                backend = settings.LOCAL_EVENT_STORE
+                if backend == "sqlite":
+                    from app.services.sqlite_store import SqliteEventStore
+                    _local_store = SqliteEventStore()
+                elif backend == "json":
+                    _local_store = MockFirebaseService()
+                elif backend == "memory":
+                    from app.services.firebase_mock import FirebaseService as MemoryEventStore
+                    _local_store = MemoryEventStore()
+                else:
+                    from app.services.log_store import LogEventStore
+                    _local_store = LogEventStore()
+    return _local_store
 
 # Función para obtener el servicio correcto
 def get_firebase_service():
@@ -148,4 +347,4 @@ def get_firebase_service():
     except Exception as e:
         # Si falla, usar versión simulada
         print(f"⚠️  Firebase no disponible, usando modo simulado")
-        return MockFirebaseService()
+        return get_local_event_store()
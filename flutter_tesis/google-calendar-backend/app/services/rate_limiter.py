@@ -0,0 +1,242 @@
+"""
+Limitador de cuota para las llamadas a Google Calendar.
+
+Combina un token bucket por proyecto y uno por usuario delante de todas las
+peticiones, y reintenta con backoff exponencial y jitter los errores de
+cuota (403 rateLimitExceeded / 429) y los errores transitorios del servidor,
+respetando Retry-After cuando Google lo envía.
+
+Los buckets de usuario se guardan en un LRU: se descartan los que llevan
+más de GOOGLE_QUOTA_USER_IDLE_SECONDS sin uso o exceden
+GOOGLE_QUOTA_USER_BUCKETS (un bucket inactivo ya estaba lleno, así que
+recrearlo no regala cuota).
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+from googleapiclient.errors import HttpError
+
+from config.settings import settings
+
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket thread-safe con tasa adaptable"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, cost: float = 1) -> float:
+        """Reserva tokens y retorna cuántos segundos esperar antes de usarlos"""
+        with self._lock:
+            self._refill()
+            self.tokens -= cost
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def penalize(self):
+        """Reduce la tasa a la mitad tras un error de cuota"""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def recover(self):
+        """Recupera gradualmente la tasa configurada tras una petición exitosa"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            self._refill()
+            return {
+                'tokens': round(max(self.tokens, 0), 2),
+                'capacity': self.capacity,
+                'rate': round(self.rate, 2),
+                'max_rate': self.max_rate,
+            }
+
+
+def _error_reasons(error: HttpError):
+    try:
+        content = json.loads(error.content.decode('utf-8'))
+        return {item.get('reason') for item in content.get('error', {}).get('errors', [])}
+    except (ValueError, AttributeError):
+        return set()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Indica si el error corresponde a cuota agotada"""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status == 429 or (status == 403 and bool(_error_reasons(error) & RATE_LIMIT_REASONS))
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Indica si el error es de cuota o transitorio y vale la pena reintentar"""
+    return isinstance(error, HttpError) and (
+        is_rate_limit_error(error) or error.resp.status in RETRYABLE_STATUS
+    )
+
+
+class QuotaLimiter:
+    """Presupuesto de peticiones por proyecto y por usuario con reintentos"""
+
+    def __init__(self):
+        self.project_bucket = TokenBucket(
+            settings.GOOGLE_QUOTA_PROJECT_QPS,
+            settings.GOOGLE_QUOTA_PROJECT_QPS * settings.GOOGLE_QUOTA_BURST_SECONDS
+        )
+        self.user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'retries': 0, 'failures': 0, 'waited_seconds': 0.0}
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.user_buckets.get(user_id)
+            if bucket is not None:
+                self.user_buckets.move_to_end(user_id)
+                return bucket
+
+            self._evict_idle_buckets()
+            bucket = self.user_buckets[user_id] = TokenBucket(
+                settings.GOOGLE_QUOTA_USER_QPS,
+                settings.GOOGLE_QUOTA_USER_QPS * settings.GOOGLE_QUOTA_BURST_SECONDS
+            )
+        return bucket
+
+    def _evict_idle_buckets(self):
+        """Hace lugar para un bucket nuevo descartando los inactivos o menos usados (con _lock)"""
+        idle_since = time.monotonic() - settings.GOOGLE_QUOTA_USER_IDLE_SECONDS
+        while self.user_buckets:
+            oldest = next(iter(self.user_buckets.values()))
+            if len(self.user_buckets) < settings.GOOGLE_QUOTA_USER_BUCKETS and oldest.updated_at > idle_since:
+                break
+            self.user_buckets.popitem(last=False)
+
+    def _reserve(self, user_id: str, cost: float) -> float:
+        delay = max(self.project_bucket.reserve(cost), self._user_bucket(user_id).reserve(cost))
+        self.stats['requests'] += 1
+        self.stats['waited_seconds'] += delay
+        return delay
+
+    def _backoff_delay(self, error: HttpError, attempt: int) -> float:
+        retry_after = error.resp.get('retry-after')
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Full jitter sobre un backoff exponencial acotado
+        return random.uniform(0, min(settings.GOOGLE_BACKOFF_MAX, settings.GOOGLE_BACKOFF_BASE * (2 ** attempt)))
+
+    def _on_error(self, error: Exception, user_id: str, attempt: int) -> Optional[float]:
+        """Registra el error y retorna la espera antes de reintentar, o None si no se reintenta"""
+        if is_rate_limit_error(error):
+            self.stats['throttled'] += 1
+            self.project_bucket.penalize()
+            self._user_bucket(user_id).penalize()
+        if not is_retryable_error(error) or attempt >= settings.GOOGLE_MAX_RETRIES:
+            self.stats['failures'] += 1
+            return None
+        self.stats['retries'] += 1
+        return self._backoff_delay(error, attempt)
+
+    def _on_success(self, user_id: str):
+        self.project_bucket.recover()
+        self._user_bucket(user_id).recover()
+
+    def call(self, func: Callable[[], Any], user_id: str = 'default', cost: float = 1) -> Any:
+        """Ejecuta func respetando la cuota y reintentando errores recuperables"""
+        attempt = 0
+        while True:
+            delay = self._reserve(user_id, cost)
+            if delay:
+                time.sleep(delay)
+            try:
+                result = func()
+                self._on_success(user_id)
+                return result
+            except HttpError as error:
+                retry_delay = self._on_error(error, user_id, attempt)
+                if retry_delay is None:
+                    raise
+                time.sleep(retry_delay)
+                attempt += 1
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]], user_id: str = 'default', cost: float = 1) -> Any:
+        """Contraparte asíncrona de call"""
+        attempt = 0
+        while True:
+            delay = self._reserve(user_id, cost)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                result = await func()
+                self._on_success(user_id)
+                return result
+            except HttpError as error:
+                retry_delay = self._on_error(error, user_id, attempt)
+                if retry_delay is None:
+                    raise
+                await asyncio.sleep(retry_delay)
+                attempt += 1
+
+    def backoff(self, error: Exception, user_id: str, attempt: int) -> Optional[float]:
+        """Espera a aplicar antes de reintentar una operación individual de un batch"""
+        return self._on_error(error, user_id, attempt)
+
+    def metrics(self, user_id: str) -> Dict[str, Any]:
+        """Presupuesto restante del usuario y del proyecto, y contadores de uso
+
+        No expone los buckets ni los ids de los demás usuarios, solo cuántos hay.
+        """
+        with self._lock:
+            bucket = self.user_buckets.get(user_id)
+            active_users = len(self.user_buckets)
+        if bucket is None:
+            # Sin peticiones recientes: el bucket estaría lleno
+            bucket = TokenBucket(
+                settings.GOOGLE_QUOTA_USER_QPS,
+                settings.GOOGLE_QUOTA_USER_QPS * settings.GOOGLE_QUOTA_BURST_SECONDS
+            )
+        return {
+            'project': self.project_bucket.snapshot(),
+            'user': bucket.snapshot(),
+            'active_users': active_users,
+            'stats': {**self.stats, 'waited_seconds': round(self.stats['waited_seconds'], 2)},
+        }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_quota_limiter() -> QuotaLimiter:
+    """Retorna el limitador compartido por el proceso"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = QuotaLimiter()
+    return _limiter
@@ -0,0 +1,242 @@
+"""
+Motor de recurrencias.
+
+Las series de Google Calendar se guardan una sola vez (evento maestro con
+sus reglas RRULE/EXDATE/RDATE y sus excepciones) y las ocurrencias se
+expanden bajo demanda para la ventana de fechas solicitada.
+"""
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, Union
+from zoneinfo import ZoneInfo
+
+from dateutil.rrule import rrulestr
+
+from config.settings import settings
+
+# Campos adicionales necesarios para reconstruir series y excepciones
+RECURRENCE_FIELDS = ('recurrence', 'recurringEventId', 'originalStartTime')
+
+
+def _parse(value: Union[str, datetime]) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def occurrence_key(original_start: Dict[str, Any]) -> str:
+    """Clave estable de una ocurrencia a partir de su originalStartTime de Google"""
+    value = original_start.get('dateTime') or original_start.get('date')
+    start = _parse(value)
+    if start.tzinfo is None:
+        return start.date().isoformat()
+    return start.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _start_key(start: datetime, all_day: bool) -> str:
+    if all_day:
+        return start.date().isoformat()
+    return start.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def is_series_master(google_event: Dict[str, Any]) -> bool:
+    return bool(google_event.get('recurrence'))
+
+
+def is_series_exception(google_event: Dict[str, Any]) -> bool:
+    return bool(google_event.get('recurringEventId'))
+
+
+def exception_from_google(calendar_service, google_event: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Convierte una instancia modificada o cancelada en (clave, excepción)"""
+    key = occurrence_key(google_event.get('originalStartTime', {}))
+    if google_event.get('status') == 'cancelled':
+        return key, {'cancelled': True}
+
+    event_data = calendar_service._convert_from_google_format(google_event)
+    override = {
+        field: event_data[field]
+        for field in ('title', 'description', 'date', 'end_time', 'reminder')
+        if event_data.get(field) is not None
+    }
+    return key, override
+
+
+def series_exception_updates(
+    series_events: Dict[str, Dict[str, Any]],
+    pending_exceptions: Dict[str, Dict[str, Any]]
+) -> Dict[str, Dict[str, Any]]:
+    """Escrituras {firebase_id: {'exceptions': ...}} que agregan a cada serie sus excepciones pendientes
+
+    series_events son las series encontradas por Google ID. La importación y
+    la sincronización incremental aplican estas mismas escrituras y las
+    registran como cambios de la serie, de modo que el ETag de /occurrences
+    cambia con cada excepción.
+    """
+    return {
+        series['firebase_id']: {'exceptions': {**series.get('exceptions', {}), **pending_exceptions[series_google_id]}}
+        for series_google_id, series in series_events.items()
+    }
+
+
+@lru_cache(maxsize=settings.RECURRENCE_CACHE_SIZE)
+def _expand_starts(
+    rules: Tuple[str, ...],
+    dtstart_iso: str,
+    time_zone: str,
+    all_day: bool,
+    window_start_iso: str,
+    window_end_iso: str
+) -> Tuple[datetime, ...]:
+    """Inicios de las ocurrencias dentro de la ventana (resultado memoizado)"""
+    tz = ZoneInfo(time_zone)
+    dtstart = datetime.fromisoformat(dtstart_iso)
+    window_start = datetime.fromisoformat(window_start_iso)
+    window_end = datetime.fromisoformat(window_end_iso)
+
+    if all_day:
+        # Reglas de día completo en hora local sin zona (UNTIL es una fecha)
+        dtstart = dtstart.replace(tzinfo=None)
+        window_start = window_start.astimezone(tz).replace(tzinfo=None)
+        window_end = window_end.astimezone(tz).replace(tzinfo=None)
+    else:
+        # Expandir en hora local de la serie para respetar los cambios de horario
+        dtstart = dtstart.astimezone(tz)
+
+    rule_set = rrulestr('\n'.join(rules), dtstart=dtstart, forceset=True)
+    return tuple(rule_set.between(window_start, window_end, inc=True))
+
+
+def _apply_override(occurrence: Dict[str, Any], override: Dict[str, Any], duration) -> Dict[str, Any]:
+    """Aplica la excepción; si solo mueve el inicio, el fin conserva la duración de la serie"""
+    occurrence = {**occurrence, **override}
+    if override.get('date') and not override.get('end_time'):
+        occurrence['end_time'] = (_parse(override['date']) + duration).isoformat()
+    return occurrence
+
+
+def _overlaps(event: Dict[str, Any], tz: ZoneInfo, window_start: datetime, window_end: datetime) -> bool:
+    """Indica si el evento (inicio y fin, sin zona en tz) solapa la ventana"""
+    start = _parse(event['date'])
+    end = _parse(event.get('end_time') or event['date'])
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=tz)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=tz)
+    return start <= window_end and end >= window_start
+
+
+def expand_occurrences(series: Dict[str, Any], window_start: datetime, window_end: datetime) -> List[Dict[str, Any]]:
+    """Expande una serie almacenada en sus ocurrencias dentro de [window_start, window_end]
+
+    Las fechas sin zona horaria se interpretan como UTC. Cada ocurrencia
+    conserva los datos de la serie, aplica su excepción si existe e incluye
+    'series_id' y 'original_start'.
+    """
+    if window_start.tzinfo is None:
+        window_start = window_start.replace(tzinfo=timezone.utc)
+    if window_end.tzinfo is None:
+        window_end = window_end.replace(tzinfo=timezone.utc)
+
+    time_zone = series.get('time_zone') or settings.DEFAULT_TIME_ZONE
+    all_day = bool(series.get('all_day'))
+    tz = ZoneInfo(time_zone)
+
+    start = _parse(series['date'])
+    end = _parse(series['end_time']) if series.get('end_time') else start
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=tz)
+        end = end.replace(tzinfo=tz)
+    duration = end - start
+
+    # Incluir las ocurrencias que empezaron antes de la ventana pero la solapan
+    starts = _expand_starts(
+        tuple(series.get('recurrence', [])),
+        start.isoformat(),
+        time_zone,
+        all_day,
+        (window_start - duration).isoformat(),
+        window_end.isoformat()
+    )
+
+    exceptions = series.get('exceptions', {})
+    base = {
+        key: value for key, value in series.items()
+        if key not in ('recurrence', 'exceptions', 'time_zone', 'all_day')
+    }
+    series_id = series.get('firebase_id')
+
+    occurrences = []
+    emitted = set()
+    for occurrence_start in starts:
+        if all_day:
+            occurrence_start = occurrence_start.replace(tzinfo=tz)
+        key = _start_key(occurrence_start, all_day)
+        emitted.add(key)
+
+        override = exceptions.get(key, {})
+        if override.get('cancelled'):
+            continue
+
+        occurrence = _apply_override({
+            **base,
+            'date': occurrence_start.isoformat(),
+            'end_time': (occurrence_start + duration).isoformat(),
+            'series_id': series_id,
+            'original_start': key,
+        }, override, duration)
+        # Una excepción puede haber sacado la instancia de la ventana
+        if override and not _overlaps(occurrence, tz, window_start, window_end):
+            continue
+        occurrences.append(occurrence)
+
+    # Instancias movidas a la ventana desde una fecha original fuera de ella
+    for key, override in exceptions.items():
+        if key in emitted or override.get('cancelled') or not override.get('date'):
+            continue
+        occurrence = _apply_override({**base, 'series_id': series_id, 'original_start': key}, override, duration)
+        if _overlaps(occurrence, tz, window_start, window_end):
+            occurrences.append(occurrence)
+
+    occurrences.sort(key=lambda occurrence: _sort_key(occurrence['date']))
+    return occurrences
+
+
+def expand_events(
+    events: List[Dict[str, Any]],
+    window_start: datetime,
+    window_end: datetime
+) -> List[Dict[str, Any]]:
+    """Expande las series y filtra los eventos simples que solapan la ventana"""
+    if window_start.tzinfo is None:
+        window_start = window_start.replace(tzinfo=timezone.utc)
+    if window_end.tzinfo is None:
+        window_end = window_end.replace(tzinfo=timezone.utc)
+
+    expanded = []
+    for event in events:
+        if event.get('recurrence'):
+            expanded.extend(expand_occurrences(event, window_start, window_end))
+            continue
+
+        if not event.get('date'):
+            continue
+        start = _parse(event['date'])
+        end = _parse(event.get('end_time') or start)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+
+        if start <= window_end and end >= window_start:
+            expanded.append(event)
+
+    expanded.sort(key=lambda event: _sort_key(event['date']))
+    return expanded
+
+
+def _sort_key(value: Union[str, datetime]) -> datetime:
+    start = _parse(value)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start
@@ -0,0 +1,312 @@
+"""
+Almacén local de eventos en SQLite.
+
+Cada evento se guarda como JSON junto con columnas indexadas (inicio y fin
+en UTC, google_event_id, tipo, dueño y si es una serie recurrente), de modo
+que las consultas por rango, las de solapamiento, las búsquedas por ID de
+Google y las escrituras masivas se resuelven con SQL indexado. El modo WAL
+permite que varios procesos lean y escriban la misma base sin bloquear las
+lecturas.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+
+from config.settings import settings
+from app.services.event_index import to_utc, encode_cursor, decode_cursor, jsonable_event
+
+# Parámetros por sentencia (el límite por defecto de SQLite es 999)
+SQLITE_VARIABLE_LIMIT = 500
+
+_TABLES = """
+CREATE TABLE IF NOT EXISTS events (
+    firebase_id TEXT PRIMARY KEY,
+    google_event_id TEXT,
+    date TEXT,
+    end_date TEXT,
+    recurring INTEGER NOT NULL DEFAULT 0,
+    type TEXT,
+    user_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+_INDEXES = """
+DROP INDEX IF EXISTS idx_events_google_event_id;
+CREATE INDEX IF NOT EXISTS idx_events_user_google ON events (user_id, google_event_id);
+CREATE INDEX IF NOT EXISTS idx_events_date ON events (date, firebase_id);
+CREATE INDEX IF NOT EXISTS idx_events_type ON events (type);
+CREATE INDEX IF NOT EXISTS idx_events_user_date ON events (user_id, date, firebase_id);
+CREATE INDEX IF NOT EXISTS idx_events_user_end ON events (user_id, end_date);
+CREATE INDEX IF NOT EXISTS idx_events_user_recurring ON events (user_id, recurring);
+"""
+
+
+def _date_key(value) -> Optional[str]:
+    """Fecha en UTC con ancho fijo para que el orden de texto sea cronológico"""
+    if not value:
+        return None
+    try:
+        return to_utc(value).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    except (TypeError, ValueError):
+        return None
+
+
+def _chunks(items: List[Any], size: int = SQLITE_VARIABLE_LIMIT) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SqliteEventStore:
+    """Eventos en una base SQLite local con índices secundarios"""
+
+    def __init__(self, db_file: Optional[str] = None):
+        self.db_file = db_file or os.path.join(settings.LOCAL_STORE_DIR, "events.db")
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_file)), exist_ok=True)
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(_TABLES)
+        self._migrate(conn)
+        conn.executescript(_INDEXES)
+        print(f"🗂️  Almacén SQLite de eventos en {self.db_file}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Sin transacciones implícitas: se abren con BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        """Agrega las columnas de fin y serie a una base creada por una versión anterior"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        if 'end_date' in columns:
+            return
+        with self._transaction() as conn:
+            conn.execute("ALTER TABLE events ADD COLUMN end_date TEXT")
+            conn.execute("ALTER TABLE events ADD COLUMN recurring INTEGER NOT NULL DEFAULT 0")
+            rows = [self._row(firebase_id, json.loads(data)) for firebase_id, data in conn.execute(
+                "SELECT firebase_id, data FROM events"
+            )]
+            self._write_rows(conn, rows)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transacción de escritura que toma el lock al inicio (lee y escribe sin carreras)"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # -- Filas ------------------------------------------------------------
+
+    @staticmethod
+    def _row(firebase_id: str, event: Dict[str, Any]) -> Tuple:
+        return (
+            firebase_id,
+            event.get('google_event_id'),
+            _date_key(event.get('date')),
+            _date_key(event.get('end_time') or event.get('date')),
+            1 if event.get('recurrence') else 0,
+            event.get('type'),
+            event.get('user_id') or settings.DEFAULT_USER_ID,
+            json.dumps(event, separators=(',', ':')),
+        )
+
+    def _write_rows(self, conn: sqlite3.Connection, rows: List[Tuple]):
+        conn.executemany(
+            "INSERT OR REPLACE INTO events (firebase_id, google_event_id, date, end_date, recurring, type, user_id, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+    def _load_many(
+        self,
+        conn: sqlite3.Connection,
+        column: str,
+        values: List[str],
+        user_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        events = []
+        for chunk in _chunks(values):
+            sql = f"SELECT data FROM events WHERE {column} IN ({','.join('?' * len(chunk))})"
+            params = list(chunk)
+            if user_id is not None:
+                sql += " AND user_id = ?"
+                params.append(user_id)
+            events.extend(json.loads(data) for (data,) in conn.execute(sql, params))
+        return events
+
+    # -- Lecturas ---------------------------------------------------------
+
+    def get_all_events(self) -> List[Dict[str, Any]]:
+        """Obtiene todos los eventos"""
+        return [json.loads(data) for (data,) in self._connection().execute("SELECT data FROM events")]
+
+    def get_event(self, firebase_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un evento por su ID"""
+        row = self._connection().execute(
+            "SELECT data FROM events WHERE firebase_id = ?", (firebase_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query_events(
+        self,
+        user_id: Optional[str] = None,
+        date_from=None,
+        date_to=None,
+        event_type: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Eventos por rango de fechas paginados con cursor usando el índice de fecha"""
+        conditions, params = ["date IS NOT NULL"], []
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if date_from is not None:
+            conditions.append("date >= ?")
+            params.append(_date_key(date_from))
+        if date_to is not None:
+            conditions.append("date < ?")
+            params.append(_date_key(date_to))
+        if event_type is not None:
+            conditions.append("type = ?")
+            params.append(event_type)
+        if cursor:
+            after_date, after_id = decode_cursor(cursor)
+            conditions.append("(date, firebase_id) > (?, ?)")
+            params.extend([_date_key(after_date), after_id])
+
+        sql = f"SELECT data FROM events WHERE {' AND '.join(conditions)} ORDER BY date, firebase_id"
+        if limit is not None:
+            # Un evento de más para saber si hay otra página
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        events = [json.loads(data) for (data,) in self._connection().execute(sql, params)]
+        if limit is not None and len(events) > limit:
+            events = events[:limit]
+            return events, encode_cursor(events[-1])
+        return events, None
+
+    def find_overlapping(self, window_start, window_end, user_id: str) -> List[Dict[str, Any]]:
+        """Eventos del usuario que solapan la ventana más sus series recurrentes, listos para expand_events"""
+        rows = self._connection().execute(
+            "SELECT data FROM events WHERE user_id = ? AND recurring = 0 AND end_date >= ? AND date <= ? "
+            "UNION ALL SELECT data FROM events WHERE user_id = ? AND recurring = 1",
+            (user_id, _date_key(window_start), _date_key(window_end), user_id)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def find_event_by_google_id(self, google_event_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Busca un evento del usuario por su ID de Google Calendar"""
+        row = self._connection().execute(
+            "SELECT data FROM events WHERE user_id = ? AND google_event_id = ? LIMIT 1",
+            (user_id, google_event_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_events_by_google_ids(self, google_event_ids: List[str], user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Busca varios eventos del usuario por su ID de Google Calendar"""
+        found = {}
+        unique_ids = list(set(google_event_ids))
+        for event in self._load_many(self._connection(), 'google_event_id', unique_ids, user_id):
+            found.setdefault(event['google_event_id'], event)
+        return found
+
+    # -- Escrituras -------------------------------------------------------
+
+    def create_event(self, event_data: Dict[str, Any]) -> str:
+        """Crea un evento"""
+        return self.create_events([event_data])[0]['firebase_id']
+
+    def create_events(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Crea varios eventos en una sola transacción"""
+        now = datetime.now().isoformat()
+        rows = []
+        for event_data in events:
+            firebase_id = str(uuid.uuid4())
+            event_data['firebase_id'] = firebase_id
+            rows.append(self._row(firebase_id, {**jsonable_event(event_data), 'created_at': now}))
+
+        with self._transaction() as conn:
+            self._write_rows(conn, rows)
+        return [{'firebase_id': row[0], 'error': None} for row in rows]
+
+    def update_event(self, firebase_id: str, event_data: Dict[str, Any]) -> bool:
+        """Actualiza un evento"""
+        return self.update_events({firebase_id: event_data})[firebase_id] is None
+
+    def update_events(self, updates: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Actualiza varios eventos existentes en una sola transacción"""
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            existing = {event['firebase_id']: event for event in self._load_many(conn, 'firebase_id', list(updates))}
+            results, rows = {}, []
+            for firebase_id, event_data in updates.items():
+                event = existing.get(firebase_id)
+                if event is None:
+                    results[firebase_id] = "Evento no encontrado"
+                    continue
+                rows.append(self._row(firebase_id, {**event, **jsonable_event(event_data), 'updated_at': now}))
+                results[firebase_id] = None
+            self._write_rows(conn, rows)
+        return results
+
+    def upsert_events(self, events: Dict[str, Dict[str, Any]]) -> Dict[str, Optional[str]]:
+        """Crea o combina varios eventos por firebase_id en una sola transacción"""
+        now = datetime.now().isoformat()
+        with self._transaction() as conn:
+            existing = {event['firebase_id']: event for event in self._load_many(conn, 'firebase_id', list(events))}
+            rows = []
+            for firebase_id, event_data in events.items():
+                event = existing.get(firebase_id)
+                if event is not None:
+                    merged = {**event, **jsonable_event(event_data), 'updated_at': now}
+                else:
+                    merged = {**jsonable_event(event_data), 'firebase_id': firebase_id, 'created_at': now}
+                rows.append(self._row(firebase_id, merged))
+            self._write_rows(conn, rows)
+        return {firebase_id: None for firebase_id in events}
+
+    def delete_event(self, firebase_id: str) -> bool:
+        """Elimina un evento"""
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM events WHERE firebase_id = ?", (firebase_id,)).rowcount > 0
+
+    def delete_events(self, firebase_ids: List[str]) -> Dict[str, Optional[str]]:
+        """Elimina varios eventos en una sola transacción"""
+        with self._transaction() as conn:
+            existing = {event['firebase_id'] for event in self._load_many(conn, 'firebase_id', list(firebase_ids))}
+            for chunk in _chunks(list(existing)):
+                conn.execute(f"DELETE FROM events WHERE firebase_id IN ({','.join('?' * len(chunk))})", chunk)
+        return {
+            firebase_id: None if firebase_id in existing else "Evento no encontrado"
+            for firebase_id in firebase_ids
+        }
+
+    def add_google_id_to_event(self, firebase_id: str, google_event_id: str) -> bool:
+        """Agrega el ID de Google Calendar a un evento existente"""
+        return self.update_event(firebase_id, {'google_event_id': google_event_id})
+
+    def add_google_ids_to_events(self, google_ids: Dict[str, str]) -> Dict[str, bool]:
+        """Agrega IDs de Google Calendar a varios eventos"""
+        errors = self.update_events({
+            firebase_id: {'google_event_id': google_event_id}
+            for firebase_id, google_event_id in google_ids.items()
+        })
+        return {firebase_id: error is None for firebase_id, error in errors.items()}
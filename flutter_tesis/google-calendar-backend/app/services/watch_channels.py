@@ -0,0 +1,196 @@
+"""
+Canales de notificaciones push de Google Calendar (events.watch).
+
+Registra y renueva los canales, y convierte los avisos recibidos en el
+webhook en sincronizaciones incrementales del calendario afectado,
+agrupando las ráfagas de avisos.
+"""
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional, Set, Tuple, Callable
+
+from starlette.concurrency import run_in_threadpool
+
+from config.settings import settings
+
+
+class WatchChannelManager:
+    """Administra los canales events.watch y el procesamiento de sus avisos"""
+
+    def __init__(self, delta_sync_factory: Callable[[str], Any], state_file: Optional[str] = None):
+        # Construye el DeltaSyncEngine (y su servicio de Calendar) de un usuario
+        self.delta_sync_factory = delta_sync_factory
+        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.state_file = state_file or os.path.join(base_dir, "tokens", "watch_channels.json")
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        self._lock = threading.Lock()
+        # channel_id -> canal; el archivo solo se lee al arrancar y se
+        # reescribe en cada alta o baja
+        self._channels: Dict[str, Dict[str, Any]] = self._load()
+
+        # Calendarios (usuario, calendario) con una sincronización programada o en curso
+        self._scheduled: Dict[Tuple[str, str], asyncio.Task] = {}
+        # Calendarios que recibieron avisos mientras se sincronizaban
+        self._dirty: Set[Tuple[str, str]] = set()
+
+    # -- Persistencia -----------------------------------------------------
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, channels: Dict[str, Dict[str, Any]]):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(channels, f)
+        os.replace(tmp_file, self.state_file)
+
+    def list_channels(self, user_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Retorna los canales activos indexados por channel id, opcionalmente de un usuario"""
+        with self._lock:
+            channels = dict(self._channels)
+        if user_id is None:
+            return channels
+        return {
+            channel_id: channel for channel_id, channel in channels.items()
+            if channel.get('user_id', settings.DEFAULT_USER_ID) == user_id
+        }
+
+    # -- Registro y renovación -------------------------------------------
+
+    def register(self, calendar_id: str = 'primary', user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Registra un nuevo canal para el calendario del usuario y lo persiste"""
+        user_id = user_id or settings.DEFAULT_USER_ID
+        channel_id = str(uuid.uuid4())
+        token = settings.GOOGLE_WEBHOOK_TOKEN or secrets.token_urlsafe(24)
+
+        calendar_service = self.delta_sync_factory(user_id).calendar_service
+        response = calendar_service.watch_events({
+            'id': channel_id,
+            'type': 'web_hook',
+            'address': settings.GOOGLE_WEBHOOK_URL,
+            'token': token,
+            'params': {'ttl': str(settings.WATCH_CHANNEL_TTL)},
+        }, calendar_id=calendar_id)
+
+        channel = {
+            'user_id': user_id,
+            'calendar_id': calendar_id,
+            'resource_id': response.get('resourceId'),
+            'expiration': int(response.get('expiration', 0)),
+            'token': token,
+        }
+        with self._lock:
+            self._channels[channel_id] = channel
+            self._save(self._channels)
+
+        print(f"🔔 Canal {channel_id} registrado para {calendar_id} ({user_id})")
+        return {'id': channel_id, **channel}
+
+    def stop(self, channel_id: str, user_id: Optional[str] = None) -> bool:
+        """Detiene un canal y lo elimina del registro
+
+        Si se indica user_id, solo se detiene si el canal pertenece al usuario.
+        """
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            owner = channel.get('user_id', settings.DEFAULT_USER_ID) if channel else None
+            if not channel or (user_id is not None and owner != user_id):
+                return False
+            self._channels.pop(channel_id)
+            self._save(self._channels)
+
+        calendar_service = self.delta_sync_factory(owner).calendar_service
+        return calendar_service.stop_channel(channel_id, channel['resource_id'])
+
+    def renew_expiring(self) -> int:
+        """Reemplaza los canales que expiran dentro del margen configurado"""
+        renew_before_ms = (time.time() + settings.WATCH_RENEW_MARGIN) * 1000
+        renewed = 0
+
+        for channel_id, channel in self.list_channels().items():
+            if channel['expiration'] > renew_before_ms:
+                continue
+            try:
+                # Registrar primero el nuevo canal para no perder avisos
+                self.register(channel['calendar_id'], channel.get('user_id'))
+                self.stop(channel_id)
+                renewed += 1
+            except Exception as e:
+                print(f"Error al renovar canal {channel_id}: {e}")
+
+        return renewed
+
+    async def run_renewal_loop(self):
+        """Revisa periódicamente los canales y renueva los próximos a expirar"""
+        while True:
+            try:
+                renewed = await run_in_threadpool(self.renew_expiring)
+                if renewed:
+                    print(f"🔔 {renewed} canales de notificaciones renovados")
+            except Exception as e:
+                print(f"Error en la renovación de canales: {e}")
+            await asyncio.sleep(settings.WATCH_RENEW_INTERVAL)
+
+    # -- Avisos del webhook ----------------------------------------------
+
+    def handle_notification(self, channel_id: str, resource_state: str, token: Optional[str]) -> bool:
+        """Procesa un aviso del webhook (en el event loop, sin E/S)
+
+        El canal se busca en el registro en memoria. Retorna False si es
+        desconocido o el token no coincide.
+        """
+        channel = self._channels.get(channel_id)
+        if not channel or not secrets.compare_digest(channel['token'], token or ''):
+            return False
+
+        # 'sync' solo confirma la creación del canal
+        if resource_state != 'sync':
+            self.schedule_sync(channel['calendar_id'], channel.get('user_id'))
+        return True
+
+    def schedule_sync(self, calendar_id: str, user_id: Optional[str] = None):
+        """Programa una sincronización incremental agrupando avisos consecutivos
+
+        Con una sincronización del calendario programada o en curso el aviso
+        solo la marca para repetirse al terminar (nunca corren dos a la vez).
+        """
+        key = (user_id or settings.DEFAULT_USER_ID, calendar_id)
+        task = self._scheduled.get(key)
+        if task and not task.done():
+            self._dirty.add(key)
+            return
+        self._scheduled[key] = asyncio.get_running_loop().create_task(
+            self._debounced_sync(key)
+        )
+
+    async def _debounced_sync(self, key: Tuple[str, str]):
+        user_id, calendar_id = key
+        try:
+            while True:
+                await asyncio.sleep(settings.WEBHOOK_DEBOUNCE_SECONDS)
+                self._dirty.discard(key)
+
+                try:
+                    engine = self.delta_sync_factory(user_id)
+                    result = await run_in_threadpool(engine.run, calendar_id)
+                    print(
+                        f"🔔 Cambios aplicados de {calendar_id}: {result['created']} creados, "
+                        f"{result['updated']} actualizados, {result['deleted']} eliminados"
+                    )
+                except Exception as e:
+                    print(f"Error en la sincronización por aviso de {calendar_id}: {e}")
+
+                # Repetir si llegaron avisos durante la sincronización
+                if key not in self._dirty:
+                    break
+        finally:
+            self._scheduled.pop(key, None)
@@ -17,13 +17,93 @@ class Settings:
         "https://www.googleapis.com/auth/calendar.events"
     ]
     
+    # Usuarios: dueño de los eventos antiguos sin user_id, base SQLite de
+    # credenciales y número de usuarios residentes en memoria
+    DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "default")
+    TOKEN_DB_PATH = os.getenv("TOKEN_DB_PATH")
+    CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", 1000))
+    # Identidad: Authorization: Bearer con un ID token de Firebase o un token
+    # de sesión firmado con SESSION_SECRET (vigencia en segundos), y vigencia
+    # del parámetro state del flujo OAuth
+    SESSION_SECRET = os.getenv("SESSION_SECRET")
+    SESSION_TOKEN_TTL = int(os.getenv("SESSION_TOKEN_TTL", 24 * 3600))
+    OAUTH_STATE_TTL = int(os.getenv("OAUTH_STATE_TTL", 600))
+    
+    # Renovación anticipada del token de Google (segundos antes de expirar)
+    # e intervalo máximo entre revisiones
+    CREDENTIAL_REFRESH_MARGIN = int(os.getenv("CREDENTIAL_REFRESH_MARGIN", 300))
+    CREDENTIAL_REFRESH_INTERVAL = int(os.getenv("CREDENTIAL_REFRESH_INTERVAL", 60))
+    
+    # Google API client
+    GOOGLE_HTTP_POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", 8))
+    GOOGLE_ASYNC_MAX_CONNECTIONS = int(os.getenv("GOOGLE_ASYNC_MAX_CONNECTIONS", 20))
+    GOOGLE_ASYNC_TIMEOUT = float(os.getenv("GOOGLE_ASYNC_TIMEOUT", 30))
+    
+    # Google API quota (peticiones por segundo) y reintentos
+    GOOGLE_QUOTA_PROJECT_QPS = float(os.getenv("GOOGLE_QUOTA_PROJECT_QPS", 100))
+    GOOGLE_QUOTA_USER_QPS = float(os.getenv("GOOGLE_QUOTA_USER_QPS", 10))
+    GOOGLE_QUOTA_BURST_SECONDS = float(os.getenv("GOOGLE_QUOTA_BURST_SECONDS", 2))
+    GOOGLE_QUOTA_USER_BUCKETS = int(os.getenv("GOOGLE_QUOTA_USER_BUCKETS", 1000))
+    GOOGLE_QUOTA_USER_IDLE_SECONDS = float(os.getenv("GOOGLE_QUOTA_USER_IDLE_SECONDS", 600))
+    GOOGLE_MAX_RETRIES = int(os.getenv("GOOGLE_MAX_RETRIES", 5))
+    GOOGLE_BACKOFF_BASE = float(os.getenv("GOOGLE_BACKOFF_BASE", 1))
+    GOOGLE_BACKOFF_MAX = float(os.getenv("GOOGLE_BACKOFF_MAX", 32))
+    
+    # Calendarios a sincronizar (separados por coma) y lecturas simultáneas
+    SYNC_CALENDAR_IDS = [c.strip() for c in os.getenv("SYNC_CALENDAR_IDS", "primary").split(",") if c.strip()]
+    CALENDAR_FANOUT_CONCURRENCY = int(os.getenv("CALENDAR_FANOUT_CONCURRENCY", 4))
+    
+    # Expansión local de eventos recurrentes
+    DEFAULT_TIME_ZONE = os.getenv("DEFAULT_TIME_ZONE", "America/Mexico_City")
+    RECURRENCE_CACHE_SIZE = int(os.getenv("RECURRENCE_CACHE_SIZE", 1024))
+    
+    # Google Calendar push notifications (events.watch)
+    GOOGLE_WEBHOOK_URL = os.getenv("GOOGLE_WEBHOOK_URL", f"{BASE_URL}/api/sync/webhook")
+    GOOGLE_WEBHOOK_TOKEN = os.getenv("GOOGLE_WEBHOOK_TOKEN")
+    WATCH_CHANNEL_TTL = int(os.getenv("WATCH_CHANNEL_TTL", 7 * 24 * 3600))
+    WATCH_RENEW_MARGIN = int(os.getenv("WATCH_RENEW_MARGIN", 6 * 3600))
+    WATCH_RENEW_INTERVAL = int(os.getenv("WATCH_RENEW_INTERVAL", 3600))
+    WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", 2))
+    
     # Firebase Settings
     FIREBASE_SERVICE_ACCOUNT_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "./config/firebase-service-account.json")
+    # Lotes de escritura de Firestore confirmados en paralelo
+    FIRESTORE_COMMIT_CONCURRENCY = int(os.getenv("FIRESTORE_COMMIT_CONCURRENCY", 4))
+    
+    # Almacén local cuando Firebase no está disponible: log (snapshot + WAL),
+    # sqlite (base indexada, apta para varios procesos), json (archivo
+    # temp_events.json) o memory (sin persistencia)
+    LOCAL_EVENT_STORE = os.getenv("LOCAL_EVENT_STORE", "log").lower()
+    LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "./local_store")
+    # log: con SYNC_WRITES cada escritura espera su fsync (agrupado con las
+    # concurrentes); sin él se hace un fsync cada FSYNC_INTERVAL segundos y
+    # una caída puede perder las escrituras de ese intervalo
+    LOCAL_STORE_SYNC_WRITES = os.getenv("LOCAL_STORE_SYNC_WRITES", "True").lower() == "true"
+    LOCAL_STORE_FSYNC_INTERVAL = float(os.getenv("LOCAL_STORE_FSYNC_INTERVAL", 0.05))
+    LOCAL_STORE_COMPACT_BYTES = int(os.getenv("LOCAL_STORE_COMPACT_BYTES", 4 * 1024 * 1024))
     
     # API Settings
     API_HOST = os.getenv("API_HOST", "localhost")
     API_PORT = int(os.getenv("API_PORT", 8001))
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
+    # Máximo de eventos por petición a los endpoints batch
+    MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", 500))
+    # Eventos leídos del almacén por cada bloque de una respuesta NDJSON
+    STREAM_PAGE_SIZE = int(os.getenv("STREAM_PAGE_SIZE", 500))
+    # Log de cambios: entradas por usuario (ETag por ventana y feed de
+    # cambios), vigencia de los tombstones (segundos) e intervalo de compactación
+    CHANGE_HISTORY_SIZE = int(os.getenv("CHANGE_HISTORY_SIZE", 10000))
+    CHANGE_TOMBSTONE_TTL = int(os.getenv("CHANGE_TOMBSTONE_TTL", 7 * 24 * 3600))
+    CHANGE_COMPACT_INTERVAL = int(os.getenv("CHANGE_COMPACT_INTERVAL", 300))
+    # El log de cambios vive en memoria: este candado impide arrancar un
+    # segundo worker (el servidor debe ejecutarse en un solo proceso)
+    CHANGE_TRACKER_LOCK_FILE = os.getenv("CHANGE_TRACKER_LOCK_FILE", os.path.join(LOCAL_STORE_DIR, "server.lock"))
+    # Cambios en vivo por SSE: keepalive y espera para combinar ráfagas
+    # (segundos), pendientes por conexión antes de un 'resync' y reconexión (ms)
+    SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", 15))
+    SSE_COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_SECONDS", 0.25))
+    SSE_MAX_PENDING = int(os.getenv("SSE_MAX_PENDING", 1000))
+    SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", 3000))
     
     # CORS Settings
     ALLOWED_ORIGINS = [
@@ -0,0 +1,77 @@
+"""
+Migra los documentos antiguos de la colección 'events' de Firestore.
+
+Las consultas de la API filtran por user_id y comparan date/end_time como
+Timestamp, así que los documentos escritos antes (fechas como texto, sin
+user_id o sin end_time, series sin 'recurring') no aparecen en
+/api/calendar/events ni en /api/calendar/occurrences hasta migrarlos. Los
+eventos sin dueño quedan asignados a DEFAULT_USER_ID.
+
+Uso:
+    python migrate_firestore.py            # aplica los cambios
+    python migrate_firestore.py --dry-run  # solo cuenta lo que cambiaría
+
+Los índices compuestos de esas consultas están en firestore.indexes.json
+(firebase deploy --only firestore:indexes).
+"""
+import argparse
+import os
+import sys
+
+# Agregar el directorio actual al PYTHONPATH
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.firebase_sync import FIRESTORE_BATCH_LIMIT, FieldPath, FirebaseService, legacy_event_fixes
+
+
+def migrate_events(db, dry_run: bool = False, page_size: int = FIRESTORE_BATCH_LIMIT) -> dict:
+    """Recorre la colección por id de documento y actualiza los eventos antiguos en lotes"""
+    events_ref = db.collection('events')
+    counts = {'reviewed': 0, 'migrated': 0, 'errors': 0}
+    last_doc = None
+
+    while True:
+        query = events_ref.order_by(FieldPath.document_id()).limit(page_size)
+        if last_doc is not None:
+            query = query.start_after(last_doc)
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            counts['reviewed'] += 1
+            try:
+                fixes = legacy_event_fixes(doc.to_dict())
+            except (TypeError, ValueError) as e:
+                counts['errors'] += 1
+                print(f"⚠️  Evento {doc.id} con fecha inválida: {e}")
+                continue
+            if fixes:
+                counts['migrated'] += 1
+                if not dry_run:
+                    batch.update(doc.reference, fixes)
+                    pending += 1
+
+        if pending:
+            batch.commit()
+        last_doc = docs[-1]
+        print(f"🔄 {counts['reviewed']} eventos revisados, {counts['migrated']} por migrar")
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra los eventos antiguos de Firestore")
+    parser.add_argument('--dry-run', action='store_true', help="Solo contar los eventos que cambiarían")
+    args = parser.parse_args()
+
+    service = FirebaseService()
+    if service.db is None:
+        print("❌ Firebase no está configurado (FIREBASE_SERVICE_ACCOUNT_PATH)")
+        sys.exit(1)
+
+    counts = migrate_events(service.db, dry_run=args.dry_run)
+    action = "necesitan migración" if args.dry_run else "migrados"
+    print(f"✅ {counts['reviewed']} eventos revisados, {counts['migrated']} {action}, {counts['errors']} con errores")
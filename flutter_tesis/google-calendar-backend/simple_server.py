@@ -5,70 +5,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 import uvicorn
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 
-# Crear la aplicación FastAPI
-app = FastAPI(
-    title="Google Calendar Integration API",
-    description="API para sincronización entre Flutter/Firebase y Google Calendar",
-    version="1.0.0"
-)
+from app.main import create_app
 
-# Configurar CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-@app.get("/")
-async def root():
-    """Endpoint raíz de la API"""
-    return {
-        "message": "Google Calendar Integration API",
-        "version": "1.0.0",
-        "status": "funcionando",
-        "endpoints": {
-            "auth": "/api/auth",
-            "calendar": "/api/calendar", 
-            "sync": "/api/sync",
-            "docs": "/docs",
-            "redoc": "/redoc"
-        }
-    }
-
-@app.get("/health")
-async def health_check():
-    """Endpoint de verificación de salud"""
-    return {
-        "status": "healthy",
-        "message": "API funcionando correctamente"
-    }
-
-# Importar y registrar rutas solo si no hay errores
-try:
-    from app.routes.auth_routes import router as auth_router
-    app.include_router(auth_router, prefix="/api")
-    print("✅ Rutas de autenticación cargadas")
-except Exception as e:
-    print(f"⚠️  Error cargando rutas de autenticación: {e}")
-
-try:
-    from app.routes.calendar_routes import router as calendar_router
-    app.include_router(calendar_router, prefix="/api")
-    print("✅ Rutas de calendario cargadas")
-except Exception as e:
-    print(f"⚠️  Error cargando rutas de calendario: {e}")
-
-try:
-    from app.routes.sync_routes import router as sync_router
-    app.include_router(sync_router, prefix="/api")
-    print("✅ Rutas de sincronización cargadas")
-except Exception as e:
-    print(f"⚠️  Error cargando rutas de sincronización: {e}")
+# Misma aplicación que app.main (rutas, tareas de arranque, CORS con
+# X-Next-Cursor y ETag expuestos), abierta a cualquier origen
+app = create_app(allowed_origins=["*"])
 
 if __name__ == "__main__":
     import os
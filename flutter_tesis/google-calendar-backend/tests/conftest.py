@@ -0,0 +1,311 @@
+"""
+Configuración común de las pruebas.
+
+Las pruebas usan almacenes locales en un directorio temporal y un Google
+Calendar simulado en memoria (FakeGoogleCalendar) en lugar de la API real.
+Las variables de entorno se fijan antes de importar la aplicación porque
+config.settings las lee al importarse.
+"""
+import os
+import sys
+import tempfile
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+from urllib.parse import unquote
+
+_TEST_DIR = tempfile.mkdtemp(prefix="calendar-backend-tests-")
+os.environ.update({
+    'LOCAL_EVENT_STORE': 'memory',
+    'LOCAL_STORE_DIR': os.path.join(_TEST_DIR, 'local_store'),
+    'TOKEN_DB_PATH': os.path.join(_TEST_DIR, 'tokens.db'),
+    'FIREBASE_SERVICE_ACCOUNT_PATH': os.path.join(_TEST_DIR, 'sin-credenciales.json'),
+    'SESSION_SECRET': 'secreto-de-pruebas',
+    'SSE_COALESCE_SECONDS': '0.05',
+})
+
+# Directorio del backend en el path, como en simple_server.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httplib2
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from googleapiclient.errors import HttpError
+
+from app.auth.dependencies import get_user_async_calendar_service, get_user_calendar_service, get_user_id
+from app.auth.identity import create_session_token
+from app.auth.token_store import TokenStore
+from app.services.async_io import AsyncGoogleCalendarService
+from app.services.calendar_service import GoogleCalendarService
+from app.services.delta_sync import DeltaSyncEngine, SyncStateStore
+from app.services.rate_limiter import get_quota_limiter
+
+
+def http_error(status: int) -> HttpError:
+    """Error de la API de Google con el código de estado indicado"""
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+class FakeGoogleCalendar:
+    """Google Calendar en memoria: events.list (con syncToken), insert, patch y delete
+
+    Cada escritura recibe una secuencia creciente; un syncToken es la
+    secuencia de la última lista completa y la lista incremental entrega
+    los eventos modificados después de ella, incluidos los cancelados.
+    """
+
+    def __init__(self):
+        self.events: Dict[tuple, Dict[str, Any]] = {}
+        self.sequence = 0
+        # Títulos cuyo insert responde 400 y syncToken que responden 410
+        self.failing_titles = set()
+        self.expired_tokens = set()
+        # Con credenciales rechazadas calendarList responde 401
+        self.rejects_credentials = False
+        self.list_requests = []
+
+    def _touch(self, calendar_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+        self.sequence += 1
+        event['etag'] = f'"{self.sequence}"'
+        self.events[(calendar_id, event['id'])] = {**event, '_sequence': self.sequence}
+        return event
+
+    def put(self, calendar_id: str = 'primary', **event) -> Dict[str, Any]:
+        """Crea o reemplaza un evento como si se hubiera editado en Google"""
+        event.setdefault('id', uuid.uuid4().hex)
+        event.setdefault('status', 'confirmed')
+        return self._touch(calendar_id, event)
+
+    def list(self, calendar_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self.list_requests.append({'calendarId': calendar_id, **params})
+        sync_token = params.get('syncToken')
+        if sync_token in self.expired_tokens:
+            raise http_error(410)
+        since = int(sync_token.split('-')[1]) if sync_token else 0
+
+        items = sorted(
+            (event for (event_calendar, _), event in self.events.items()
+             if event_calendar == calendar_id and event['_sequence'] > since),
+            key=lambda event: event['_sequence']
+        )
+        if not params.get('showDeleted'):
+            items = [event for event in items if event['status'] != 'cancelled']
+
+        offset = int(params.get('pageToken') or 0)
+        size = int(params.get('maxResults') or 250)
+        page = {'items': [
+            {key: value for key, value in event.items() if key != '_sequence'}
+            for event in items[offset:offset + size]
+        ]}
+        if offset + size < len(items):
+            page['nextPageToken'] = str(offset + size)
+        else:
+            page['nextSyncToken'] = f"sync-{self.sequence}"
+        return page
+
+    def insert(self, calendar_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        if body.get('summary') in self.failing_titles:
+            raise http_error(400)
+        event = self.put(calendar_id, **body)
+        return {'id': event['id'], 'etag': event['etag']}
+
+    def patch(self, calendar_id: str, event_id: str, body: Dict[str, Any], if_match: Optional[str] = None):
+        event = self.events.get((calendar_id, event_id))
+        if event is None:
+            raise http_error(404)
+        if if_match and if_match != event['etag']:
+            raise http_error(412)
+        updated = self._touch(calendar_id, {
+            **{key: value for key, value in event.items() if key != '_sequence'},
+            **body
+        })
+        return {'id': event_id, 'etag': updated['etag']}
+
+    def delete(self, calendar_id: str, event_id: str):
+        event = self.events.get((calendar_id, event_id))
+        if event is None or event['status'] == 'cancelled':
+            raise http_error(404)
+        self._touch(calendar_id, {
+            **{key: value for key, value in event.items() if key != '_sequence'},
+            'status': 'cancelled'
+        })
+        return {}
+
+
+class _FakeRequest:
+    """Petición de googleapiclient: se ejecuta al llamar execute()"""
+
+    def __init__(self, call):
+        self.call = call
+        self.headers = {}
+
+    def execute(self, http=None):
+        return self.call(self.headers)
+
+
+class _FakeEventsResource:
+    def __init__(self, google: FakeGoogleCalendar):
+        self.google = google
+
+    def list(self, calendarId, **params):
+        return _FakeRequest(lambda headers: self.google.list(calendarId, params))
+
+    def insert(self, calendarId, body, fields=None):
+        return _FakeRequest(lambda headers: self.google.insert(calendarId, body))
+
+    def patch(self, calendarId, eventId, body, fields=None):
+        return _FakeRequest(lambda headers: self.google.patch(calendarId, eventId, body, headers.get('If-Match')))
+
+    def delete(self, calendarId, eventId):
+        return _FakeRequest(lambda headers: self.google.delete(calendarId, eventId))
+
+
+class _FakeCalendarListResource:
+    def __init__(self, google: FakeGoogleCalendar):
+        self.google = google
+
+    def list(self, **params):
+        def call(headers):
+            if self.google.rejects_credentials:
+                raise http_error(401)
+            return {'items': [{'id': 'primary'}][:params.get('maxResults')]}
+        return _FakeRequest(call)
+
+
+class _FakeBatch:
+    """BatchHttpRequest: ejecuta cada petición y reporta su resultado al callback"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self, http=None):
+        for request_id, request in self.requests:
+            try:
+                response = request.execute()
+            except HttpError as error:
+                self.callback(request_id, None, error)
+            else:
+                self.callback(request_id, response, None)
+
+
+class _FakeApi:
+    def __init__(self, google: FakeGoogleCalendar):
+        self.google = google
+
+    def events(self):
+        return _FakeEventsResource(self.google)
+
+    def calendarList(self):
+        return _FakeCalendarListResource(self.google)
+
+    def new_batch_http_request(self, callback):
+        return _FakeBatch(callback)
+
+
+class FakeGoogleClient:
+    """GoogleCalendarClient sin credenciales ni red"""
+
+    def __init__(self, google: FakeGoogleCalendar, user_id: str):
+        self.google = google
+        self.user_id = user_id
+        self.limiter = get_quota_limiter()
+        self._api = _FakeApi(google)
+
+    def get_service(self):
+        return self._api
+
+    def get_credentials(self):
+        return SimpleNamespace(token='token-de-pruebas'), 1
+
+    def execute(self, request, cost: int = 1):
+        return request.execute()
+
+
+class FakeCalendarService(GoogleCalendarService):
+    """GoogleCalendarService del usuario sobre el Google Calendar simulado"""
+
+    def __init__(self, google: FakeGoogleCalendar, user_id: str):
+        self.user_id = user_id
+        self.auth_service = None
+        self.client = FakeGoogleClient(google, user_id)
+
+
+class FakeAsyncCalendarService(AsyncGoogleCalendarService):
+    """Contraparte asíncrona: las peticiones REST se resuelven contra el simulado"""
+
+    async def _request(self, method, path, params=None, json=None, headers=None):
+        google = self.sync.client.google
+        # /calendars/{calendar_id}/events[/{event_id}]
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        calendar_id = parts[1]
+        event_id = parts[3] if len(parts) > 3 else None
+
+        if method == 'GET' and event_id is None:
+            return google.list(calendar_id, dict(params or {}))
+        if method == 'POST':
+            return google.insert(calendar_id, json)
+        if method in ('PATCH', 'PUT'):
+            return google.patch(calendar_id, event_id, json, (headers or {}).get('If-Match'))
+        if method == 'DELETE':
+            return google.delete(calendar_id, event_id)
+        raise AssertionError(f"Petición no simulada: {method} {path}")
+
+
+@pytest.fixture
+def google():
+    return FakeGoogleCalendar()
+
+
+@pytest.fixture
+def user_id():
+    # Un usuario nuevo por prueba: los almacenes y el registro de cambios son del proceso
+    return f"user-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def auth_headers(user_id):
+    return {'Authorization': f"Bearer {create_session_token(user_id)}"}
+
+
+@pytest.fixture
+def token_store(tmp_path):
+    return TokenStore(str(tmp_path / 'tokens.db'))
+
+
+@pytest.fixture
+def app(google):
+    from app.main import app as application
+
+    def calendar_service(user_id: str = Depends(get_user_id)):
+        return FakeCalendarService(google, user_id)
+
+    def async_calendar_service(service: GoogleCalendarService = Depends(get_user_calendar_service)):
+        return FakeAsyncCalendarService(service)
+
+    application.dependency_overrides[get_user_calendar_service] = calendar_service
+    application.dependency_overrides[get_user_async_calendar_service] = async_calendar_service
+    yield application
+    application.dependency_overrides.clear()
+
+
+@pytest.fixture
+def client(app, auth_headers):
+    with TestClient(app) as test_client:
+        test_client.headers.update(auth_headers)
+        yield test_client
+
+
+@pytest.fixture
+def delta_engine(google, user_id, token_store):
+    """Motor de sincronización incremental del usuario sobre el almacén de las rutas"""
+    from app.routes.sync_routes import firebase_service
+    return DeltaSyncEngine(
+        FakeCalendarService(google, user_id),
+        firebase_service,
+        SyncStateStore(user_id, token_store)
+    )
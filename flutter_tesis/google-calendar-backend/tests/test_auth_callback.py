@@ -0,0 +1,33 @@
+"""
+Callback de OAuth: las credenciales nuevas se validan con una petición real.
+"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth.google_oauth import GoogleAuthService
+from app.routes import auth_routes
+
+from conftest import FakeCalendarService
+
+
+@pytest.fixture
+def callback_client(app, google, user_id, monkeypatch):
+    monkeypatch.setattr(auth_routes, 'consume_state', lambda state: user_id if state == 'estado' else None)
+    monkeypatch.setattr(GoogleAuthService, 'get_credentials_from_code', lambda self, code: SimpleNamespace(token='nuevo'))
+    monkeypatch.setattr(auth_routes, 'GoogleCalendarService', lambda owner: FakeCalendarService(google, owner))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_callback_accepts_working_credentials(callback_client):
+    response = callback_client.get('/api/auth/callback', params={'code': 'codigo', 'state': 'estado'})
+    assert response.status_code == 200
+    assert response.json()['access_token'] == 'nuevo'
+
+
+def test_callback_rejects_credentials_google_refuses(callback_client, google):
+    google.rejects_credentials = True
+    response = callback_client.get('/api/auth/callback', params={'code': 'codigo', 'state': 'estado'})
+    assert response.status_code == 400
@@ -0,0 +1,45 @@
+"""
+Endpoints batch: un resultado por elemento aunque fallen algunos.
+"""
+
+
+def event_body(title, day):
+    return {
+        'title': title,
+        'description': '',
+        'date': f'2025-10-{day:02d}T09:00:00+00:00',
+        'end_time': f'2025-10-{day:02d}T10:00:00+00:00',
+    }
+
+
+def test_batch_endpoints_report_partial_failures(client, google):
+    google.failing_titles.add('Rechazado')
+    response = client.post('/api/calendar/events:batch', json={'events': [
+        event_body('Clase', 1), event_body('Rechazado', 2), event_body('Examen', 3)
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['success'] is False
+    assert [(item['index'], item['status']) for item in body['results']] == [(0, 201), (1, 502), (2, 201)]
+    clase, examen = body['results'][0]['event'], body['results'][2]['event']
+    assert clase['google_event_id'] and examen['google_event_id']
+
+    # Examen cambió en Google después de crearse: su ETag ya no coincide
+    google.put(**{**google.events[('primary', examen['google_event_id'])], 'summary': 'Examen (Google)'})
+    response = client.post('/api/calendar/events:batchUpdate', json={'events': [
+        {'id': clase['id'], 'title': 'Clase movida'},
+        {'id': 'no-existe', 'title': 'Nada'},
+        {'id': examen['id'], 'title': 'Examen local'},
+    ]})
+    results = response.json()['results']
+    assert [item['status'] for item in results] == [200, 404, 409]
+    assert results[0]['event']['title'] == 'Clase movida'
+    assert google.events[('primary', clase['google_event_id'])]['summary'] == 'Clase movida'
+
+    listed = {event['id']: event for event in client.get('/api/calendar/events').json()}
+    assert listed[examen['id']]['title'] == 'Examen'
+
+    response = client.post('/api/calendar/events:batchDelete', json={'ids': [clase['id'], 'no-existe']})
+    assert [item['status'] for item in response.json()['results']] == [200, 404]
+    assert google.events[('primary', clase['google_event_id'])]['status'] == 'cancelled'
+    assert set(event['id'] for event in client.get('/api/calendar/events').json()) == {examen['id']}
@@ -0,0 +1,69 @@
+"""
+Difusión SSE: las ráfagas de cambios se combinan por evento en un solo envío.
+"""
+import asyncio
+import json
+import threading
+
+from app.services.change_broker import ChangeBroker, Subscription
+from app.services.change_tracking import CREATED, DELETED, UPDATED, Change
+
+
+def event(title):
+    return {'title': title, 'date': '2025-12-01T09:00:00+00:00', 'end_time': '2025-12-01T10:00:00+00:00'}
+
+
+def parse(chunk):
+    """Eventos SSE de un bloque como (tipo, datos)"""
+    messages = []
+    for block in chunk.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        messages.append((fields['event'], json.loads(fields['data'])))
+    return messages
+
+
+def test_burst_is_coalesced_into_one_chunk():
+    async def scenario():
+        broker = ChangeBroker()
+        broker.attach(asyncio.get_running_loop())
+        subscription = broker.subscribe('ana')
+
+        async def connected():
+            return False
+
+        stream = broker.stream(subscription, [], connected)
+        assert (await stream.__anext__()).startswith('retry:')
+        next_chunk = asyncio.ensure_future(stream.__anext__())
+
+        # Ráfaga desde un hilo de sincronización: alta, dos ediciones y una baja
+        publisher = threading.Thread(target=lambda: [
+            broker.publish('ana', 1, [Change(CREATED, 'a', event('Clase')), Change(CREATED, 'b', event('Examen'))]),
+            broker.publish('ana', 3, [Change(UPDATED, 'a', event('Clase movida'))]),
+            broker.publish('ana', 4, [Change(DELETED, 'b', event('Examen'))]),
+            broker.publish('beto', 1, [Change(CREATED, 'c', event('Ajeno'))]),
+        ])
+        publisher.start()
+        publisher.join()
+
+        chunk = await asyncio.wait_for(next_chunk, timeout=2)
+        await stream.aclose()
+        return parse(chunk), broker.connection_count()
+
+    messages, connections = asyncio.run(scenario())
+    # Un alta editada sigue siendo un alta, con su último estado
+    assert [(kind, data['id'], data['version']) for kind, data in messages] == [(CREATED, 'a', 3), (DELETED, 'b', 4)]
+    assert messages[0][1]['event']['title'] == 'Clase movida'
+    assert messages[1][1]['event'] is None
+    assert connections == 0
+
+
+def test_slow_client_is_asked_to_resync():
+    async def scenario():
+        subscription = Subscription('ana', max_pending=2)
+        for index in range(3):
+            subscription.push({'id': f'e-{index}', 'kind': CREATED, 'version': index + 1, 'event': None})
+        return subscription.drain(), subscription.drain()
+
+    (messages, overflowed), (after, overflowed_after) = asyncio.run(scenario())
+    assert (messages, overflowed) == ([], True)
+    assert (after, overflowed_after) == ([], False)
@@ -0,0 +1,85 @@
+"""
+Feed de cambios (GET /changes): paginación con cursor, tombstones,
+compactación del log y cursores de otra ejecución del servidor.
+"""
+import pytest
+
+from app.services.change_tracking import (
+    CREATED,
+    DELETED,
+    UPDATED,
+    Change,
+    ChangeCursorExpired,
+    ChangeTracker
+)
+from config.settings import settings
+
+
+def event_body(title, day):
+    return {
+        'title': title,
+        'description': '',
+        'date': f'2025-05-{day:02d}T09:00:00+00:00',
+        'end_time': f'2025-05-{day:02d}T10:00:00+00:00',
+    }
+
+
+def read_feed(client, cursor, limit):
+    """Recorre el feed desde cursor en páginas de limit cambios"""
+    changes, pages = [], 0
+    while True:
+        page = client.get('/api/calendar/changes', params={'since': cursor, 'limit': limit}).json()
+        changes.extend(page['changes'])
+        cursor = page['cursor']
+        pages += 1
+        if not page['has_more']:
+            return changes, cursor, pages
+
+
+def test_feed_pages_latest_state_and_tombstones(client):
+    cursor = client.get('/api/calendar/changes').json()['cursor']
+
+    ids = [client.post('/api/calendar/events', json=event_body(f'Evento {day}', day)).json()['id'] for day in (1, 2, 3)]
+    client.put(f'/api/calendar/events/{ids[0]}', json={'title': 'Evento 1 (editado)'})
+    client.delete(f'/api/calendar/events/{ids[1]}')
+
+    changes, cursor, pages = read_feed(client, cursor, limit=2)
+    assert pages == 2
+    by_id = {change['id']: change for change in changes}
+    assert len(changes) == len(by_id) == 3
+    # Un alta editada sigue siendo un alta para el cliente, con su último estado
+    assert by_id[ids[0]]['kind'] == CREATED
+    assert by_id[ids[0]]['event']['title'] == 'Evento 1 (editado)'
+    assert by_id[ids[1]] == {'id': ids[1], 'kind': DELETED, 'version': by_id[ids[1]]['version'], 'event': None}
+    assert by_id[ids[2]]['kind'] == CREATED
+
+    # Ya al día: el siguiente cursor no trae nada
+    assert read_feed(client, cursor, limit=2)[0] == []
+
+
+def test_cursor_from_another_server_run_is_gone(client):
+    stale_cursor = ChangeTracker().encode_cursor(1)
+    assert client.get('/api/calendar/changes', params={'since': stale_cursor}).status_code == 410
+    assert client.get('/api/calendar/changes', params={'since': 'no-es-un-cursor'}).status_code == 400
+
+
+def test_compaction_keeps_last_change_per_event(monkeypatch):
+    tracker = ChangeTracker(history_size=100)
+    tracker.record('ana', [Change(CREATED, 'a', {'date': '2025-05-01T09:00:00+00:00'})])
+    tracker.record('ana', [Change(UPDATED, 'a', {'date': '2025-05-08T09:00:00+00:00'})])
+    tracker.record('ana', [Change(CREATED, 'b', {'date': '2025-05-02T09:00:00+00:00'})])
+    tracker.record('ana', [Change(DELETED, 'b', {'date': '2025-05-02T09:00:00+00:00'})])
+    assert tracker.version('ana', '2025-05-01T00:00:00+00:00', '2025-05-02T00:00:00+00:00') == 1
+
+    assert tracker.compact() == 2
+    assert tracker.changes_since('ana', 0, 10)[0] == [(2, CREATED, 'a'), (4, DELETED, 'b')]
+    # La entrada conservada cubre también la fecha anterior del evento: la
+    # ventana del 1 de mayo no puede volver a una versión ya vista
+    assert tracker.version('ana', '2025-05-01T00:00:00+00:00', '2025-05-02T00:00:00+00:00') == 2
+
+    # Tombstones vencidos: se descartan y los cursores anteriores expiran
+    monkeypatch.setattr(settings, 'CHANGE_TOMBSTONE_TTL', -1)
+    assert tracker.compact() == 1
+    with pytest.raises(ChangeCursorExpired):
+        tracker.changes_since('ana', 3, 10)
+    assert tracker.changes_since('ana', 4, 10)[0] == []
@@ -0,0 +1,63 @@
+"""
+ETag de los listados y candado de proceso único del registro de cambios.
+"""
+import os
+import subprocess
+import sys
+
+from app.services.change_tracking import ChangeTracker, claim_single_process
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EVENT = {
+    'title': 'Entrega',
+    'description': 'Proyecto final',
+    'date': '2025-03-10T15:00:00+00:00',
+    'end_time': '2025-03-10T16:00:00+00:00',
+}
+MARCH = {'from': '2025-03-01T00:00:00+00:00', 'to': '2025-04-01T00:00:00+00:00'}
+APRIL = {'from': '2025-04-01T00:00:00+00:00', 'to': '2025-05-01T00:00:00+00:00'}
+
+
+def test_etag_revalidates_until_a_write(client):
+    response = client.get('/api/calendar/events', params=MARCH)
+    etag = response.headers['ETag']
+    assert client.get('/api/calendar/events', params=MARCH, headers={'If-None-Match': etag}).status_code == 304
+
+    created = client.post('/api/calendar/events', json=EVENT).json()
+
+    response = client.get('/api/calendar/events', params=MARCH, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert [event['id'] for event in response.json()] == [created['id']]
+    assert response.headers['ETag'] != etag
+
+    # Un cambio en otra ventana no invalida la respuesta de marzo
+    etag = response.headers['ETag']
+    client.put(f"/api/calendar/events/{created['id']}", json={'title': 'Entrega final'})
+    assert client.get('/api/calendar/events', params=MARCH, headers={'If-None-Match': etag}).status_code == 200
+    etag = client.get('/api/calendar/events', params=MARCH).headers['ETag']
+    client.post('/api/calendar/events', json={**EVENT, 'date': '2025-04-02T15:00:00+00:00', 'end_time': '2025-04-02T16:00:00+00:00'})
+    assert client.get('/api/calendar/events', params=MARCH, headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/calendar/events', params=APRIL, headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_restart_invalidates_etags():
+    # Otro proceso (o un reinicio) tiene otro epoch: sus ETag nunca coinciden
+    assert ChangeTracker().etag('usuario') != ChangeTracker().etag('usuario')
+
+
+def test_second_process_cannot_claim_the_tracker(client):
+    # El servidor de pruebas ya tomó el candado al arrancar; un segundo
+    # worker con la misma configuración no puede arrancar
+    claim_single_process()
+    other_worker = subprocess.run(
+        [sys.executable, '-c', (
+            "from app.services.change_tracking import claim_single_process\n"
+            "try:\n"
+            "    claim_single_process()\n"
+            "except RuntimeError:\n"
+            "    raise SystemExit(3)\n"
+        )],
+        cwd=BACKEND_DIR,
+    )
+    assert other_worker.returncode == 3
@@ -0,0 +1,93 @@
+"""
+Sincronización incremental con syncToken y su recuperación ante 410 Gone.
+"""
+from datetime import datetime
+
+from app.routes.sync_routes import firebase_service
+
+# La carga completa lista desde el mes actual: fechas del año próximo
+NEXT_YEAR = datetime.now().year + 1
+
+
+def google_event(google, title, day, year=2025):
+    return google.put(
+        summary=title,
+        start={'dateTime': f'{year}-08-{day:02d}T09:00:00Z'},
+        end={'dateTime': f'{year}-08-{day:02d}T10:00:00Z'}
+    )
+
+
+def local_event(user_id, title, **fields):
+    return firebase_service.create_event({
+        'title': title,
+        'date': f'{NEXT_YEAR}-08-10T09:00:00+00:00',
+        'end_time': f'{NEXT_YEAR}-08-10T10:00:00+00:00',
+        'user_id': user_id,
+        **fields
+    })
+
+
+def test_incremental_run_uses_the_stored_token(google, delta_engine):
+    google_event(google, 'Primero', 1)
+    assert delta_engine.run()['full_resync'] is True
+
+    google_event(google, 'Segundo', 2)
+    result = delta_engine.run()
+    assert (result['full_resync'], result['created']) == (False, 1)
+    assert google.list_requests[-1]['syncToken'] == 'sync-1'
+
+
+def test_expired_token_falls_back_to_a_full_sync(google, delta_engine, user_id):
+    kept = google_event(google, 'Guardado', 1)
+    delta_engine.run()
+    token = delta_engine.state_store.get_token('primary')
+
+    # Google invalida el token: 410 Gone en la siguiente lista incremental
+    google.expired_tokens.add(token)
+    added = google_event(google, 'Nuevo', 2)
+    result = delta_engine.run()
+
+    assert result['full_resync'] is True and not result['errors']
+    # La carga completa concilia lo que ya estaba en lugar de duplicarlo
+    assert (result['created'], result['updated']) == (1, 1)
+    assert [request.get('syncToken') for request in google.list_requests[-2:]] == [token, None]
+    assert delta_engine.state_store.get_token('primary') == f"sync-{google.sequence}"
+    found = firebase_service.find_events_by_google_ids([kept['id'], added['id']], user_id)
+    assert {event['title'] for event in found.values()} == {'Guardado', 'Nuevo'}
+
+
+def test_full_resync_removes_events_deleted_during_the_gap(google, delta_engine, user_id):
+    deleted = google_event(google, 'Eliminado en Google', 1, NEXT_YEAR)
+    kept = google_event(google, 'Sigue', 2, NEXT_YEAR)
+    past = google_event(google, 'Ya pasó', 3)
+    delta_engine.run()
+    only_local = local_event(user_id, 'Solo local')
+    other_calendar = local_event(user_id, 'De otro calendario', google_event_id=deleted['id'] + '-otro', calendar_id='trabajo')
+
+    # Bajas en Google mientras el token no es válido
+    google.expired_tokens.add(delta_engine.state_store.get_token('primary'))
+    google.delete('primary', deleted['id'])
+    google.delete('primary', past['id'])
+    result = delta_engine.run()
+
+    assert result['full_resync'] is True and result['deleted'] == 1
+    found = firebase_service.find_events_by_google_ids([deleted['id'], kept['id'], past['id']], user_id)
+    # Lo que terminó antes del inicio de la carga completa no se puede comprobar: se conserva
+    assert set(found) == {kept['id'], past['id']}
+    assert firebase_service.get_event(only_local) and firebase_service.get_event(other_calendar)
+
+
+def test_incremental_deletes_are_batched(google, delta_engine, user_id, monkeypatch):
+    events = [google_event(google, f'Evento {day}', day) for day in (1, 2, 3)]
+    delta_engine.run()
+
+    def single_delete(firebase_id):
+        raise AssertionError("las bajas deben ir en lote")
+
+    monkeypatch.setattr(firebase_service, 'delete_event', single_delete)
+    for google_item in events[:2]:
+        google.delete('primary', google_item['id'])
+    result = delta_engine.run()
+
+    assert (result['full_resync'], result['deleted'], result['errors']) == (False, 2, [])
+    assert list(firebase_service.find_events_by_google_ids([e['id'] for e in events], user_id)) == [events[2]['id']]
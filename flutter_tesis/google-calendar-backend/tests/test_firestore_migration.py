@@ -0,0 +1,96 @@
+"""
+Migración de los eventos antiguos de Firestore (migrate_firestore.py).
+"""
+from datetime import datetime, timezone
+
+from app.services.firebase_sync import legacy_event_fixes
+from config.settings import settings
+from migrate_firestore import migrate_events
+
+
+class _Doc:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+        self.reference = doc_id
+
+    def to_dict(self):
+        return dict(self.store[self.id])
+
+
+class _Query:
+    """Consulta de Firestore ordenada por id de documento con limit/start_after"""
+
+    def __init__(self, store, limit=None, after=None):
+        self.store, self._limit, self._after = store, limit, after
+
+    def order_by(self, field):
+        return self
+
+    def limit(self, limit):
+        return _Query(self.store, limit, self._after)
+
+    def start_after(self, doc):
+        return _Query(self.store, self._limit, doc.id)
+
+    def stream(self):
+        ids = sorted(doc_id for doc_id in self.store if self._after is None or doc_id > self._after)
+        return [_Doc(self.store, doc_id) for doc_id in ids[:self._limit]]
+
+
+class _Batch:
+    def __init__(self, store):
+        self.store, self.updates = store, []
+
+    def update(self, reference, fields):
+        self.updates.append((reference, fields))
+
+    def commit(self):
+        for reference, fields in self.updates:
+            self.store[reference].update(fields)
+
+
+class FakeFirestore:
+    def __init__(self, events):
+        self.events = events
+
+    def collection(self, name):
+        assert name == 'events'
+        return _Query(self.events)
+
+    def batch(self):
+        return _Batch(self.events)
+
+
+def test_legacy_fixes():
+    fixes = legacy_event_fixes({'title': 'Antiguo', 'date': '2024-09-01T10:00:00'})
+    start = datetime(2024, 9, 1, 10, tzinfo=timezone.utc)
+    assert fixes == {'user_id': settings.DEFAULT_USER_ID, 'date': start, 'end_time': start}
+
+    series = legacy_event_fixes({
+        'user_id': 'ana',
+        'date': start,
+        'end_time': '2024-09-01T11:00:00Z',
+        'recurrence': ['RRULE:FREQ=WEEKLY'],
+    })
+    assert series == {'end_time': datetime(2024, 9, 1, 11, tzinfo=timezone.utc), 'recurring': True}
+
+    assert legacy_event_fixes({'user_id': 'ana', 'date': start, 'end_time': start}) == {}
+
+
+def test_migrate_events_pages_through_collection():
+    start = datetime(2024, 9, 1, 10, tzinfo=timezone.utc)
+    events = {f'doc-{i:02d}': {'title': f'Evento {i}', 'date': '2024-09-01T10:00:00Z'} for i in range(5)}
+    events['doc-05'] = {'user_id': 'ana', 'date': start, 'end_time': start}
+    events['doc-06'] = {'user_id': 'ana', 'date': 'no es una fecha'}
+    db = FakeFirestore(events)
+
+    assert migrate_events(db, dry_run=True, page_size=2) == {'reviewed': 7, 'migrated': 5, 'errors': 1}
+    assert events['doc-00']['date'] == '2024-09-01T10:00:00Z'
+
+    assert migrate_events(db, page_size=2) == {'reviewed': 7, 'migrated': 5, 'errors': 1}
+    assert events['doc-03'] == {
+        'title': 'Evento 3', 'user_id': settings.DEFAULT_USER_ID, 'date': start, 'end_time': start
+    }
+    # Una segunda pasada ya no encuentra nada que migrar
+    assert migrate_events(db, page_size=2)['migrated'] == 0
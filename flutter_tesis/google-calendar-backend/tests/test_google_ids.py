@@ -0,0 +1,86 @@
+"""
+Los IDs de Google Calendar se buscan por (user_id, google_event_id): dos
+usuarios con el mismo calendario compartido tienen cada uno su copia.
+"""
+import pytest
+
+from app.routes.sync_routes import firebase_service
+from app.services.delta_sync import DeltaSyncEngine, SyncStateStore
+from app.services.firebase_mock import FirebaseService as MemoryEventStore
+from app.services.log_store import LogEventStore
+from app.services.mock_firebase import MockFirebaseService
+from app.services.sqlite_store import SqliteEventStore
+
+from conftest import FakeCalendarService
+
+
+def event(title, user_id, **fields):
+    return {
+        'title': title,
+        'date': '2025-09-01T09:00:00+00:00',
+        'end_time': '2025-09-01T10:00:00+00:00',
+        'user_id': user_id,
+        **fields
+    }
+
+
+@pytest.fixture(params=['memory', 'json', 'log', 'sqlite'])
+def store(request, tmp_path, monkeypatch):
+    if request.param == 'memory':
+        yield MemoryEventStore()
+    elif request.param == 'json':
+        # Usa temp_events.json del directorio actual
+        monkeypatch.chdir(tmp_path)
+        yield MockFirebaseService()
+    elif request.param == 'log':
+        store = LogEventStore(str(tmp_path / 'log'))
+        yield store
+        store.close()
+    else:
+        yield SqliteEventStore(str(tmp_path / 'events.db'))
+
+
+def test_same_google_id_is_kept_per_user(store):
+    ana = store.create_event(event('De Ana', 'ana', google_event_id='g-1'))
+    beto = store.create_event(event('De Beto', 'beto', google_event_id='g-1'))
+    carla = store.create_event(event('De Carla', 'carla'))
+    assert store.add_google_id_to_event(carla, 'g-1')
+
+    for user_id, firebase_id in (('ana', ana), ('beto', beto), ('carla', carla)):
+        assert store.find_event_by_google_id('g-1', user_id)['firebase_id'] == firebase_id
+        assert store.find_events_by_google_ids(['g-1', 'g-2'], user_id)['g-1']['firebase_id'] == firebase_id
+    assert store.find_event_by_google_id('g-1', 'diego') is None
+
+    # Eliminar la copia de un usuario no afecta a las de los demás
+    store.delete_event(ana)
+    assert store.find_event_by_google_id('g-1', 'ana') is None
+    assert store.find_event_by_google_id('g-1', 'beto')['title'] == 'De Beto'
+
+
+def test_shared_calendar_syncs_into_each_user(google, token_store):
+    shared = google.put(
+        summary='Reunión compartida',
+        start={'dateTime': '2025-09-02T09:00:00Z'},
+        end={'dateTime': '2025-09-02T10:00:00Z'}
+    )
+    engines = {
+        user_id: DeltaSyncEngine(
+            FakeCalendarService(google, user_id),
+            firebase_service,
+            SyncStateStore(user_id, token_store)
+        )
+        for user_id in ('compartido-ana', 'compartido-beto')
+    }
+    for engine in engines.values():
+        assert engine.run()['created'] == 1
+
+    # Un cambio en Google actualiza la copia de cada usuario, sin cruzarlas
+    google.put(**{**shared, 'summary': 'Reunión movida'})
+    copies = {}
+    for user_id, engine in engines.items():
+        assert engine.run()['updated'] == 1
+        copies[user_id] = firebase_service.find_event_by_google_id(shared['id'], user_id)
+
+    assert {copy['title'] for copy in copies.values()} == {'Reunión movida'}
+    assert {copy['user_id'] for copy in copies.values()} == set(engines)
+    assert len({copy['firebase_id'] for copy in copies.values()}) == 2
@@ -0,0 +1,23 @@
+"""
+Importación desde Google de varios calendarios leídos en paralelo.
+"""
+
+
+def test_import_reads_every_calendar(client, google):
+    for calendar_id, days in (('primary', (3, 1)), ('trabajo', (2, 4, 5))):
+        for day in days:
+            google.put(
+                calendar_id,
+                summary=f'{calendar_id} {day}',
+                start={'dateTime': f'2025-02-{day:02d}T09:00:00Z'},
+                end={'dateTime': f'2025-02-{day:02d}T10:00:00Z'}
+            )
+
+    response = client.post('/api/sync/import-from-google', params={'calendar_ids': ['primary', 'trabajo', 'primary']})
+    assert response.json()['events_synced'] == 5
+
+    events = client.get('/api/calendar/events').json()
+    assert sorted((event['calendar_id'], event['title']) for event in events) == [
+        ('primary', 'primary 1'), ('primary', 'primary 3'),
+        ('trabajo', 'trabajo 2'), ('trabajo', 'trabajo 4'), ('trabajo', 'trabajo 5'),
+    ]
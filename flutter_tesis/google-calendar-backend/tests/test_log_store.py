@@ -0,0 +1,137 @@
+"""
+Almacén local snapshot + WAL: recuperación tras una caída y group commit.
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from app.services import log_store as log_store_module
+from app.services.log_store import LogEventStore
+from config.settings import settings
+
+
+def event(title, day=1, user_id='ana', **fields):
+    return {
+        'title': title,
+        'date': f'2025-06-{day:02d}T09:00:00+00:00',
+        'end_time': f'2025-06-{day:02d}T10:00:00+00:00',
+        'user_id': user_id,
+        **fields
+    }
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    return str(tmp_path / 'store')
+
+
+def test_recovers_after_truncated_wal(store_dir):
+    store = LogEventStore(store_dir)
+    kept = store.create_event(event('Guardado', google_event_id='g-1'))
+    updated = store.create_event(event('Original', day=2))
+    store.update_event(updated, {'title': 'Editado'})
+    store.close()
+
+    # Caída a mitad de una escritura: la última línea quedó incompleta
+    with open(os.path.join(store_dir, 'events.wal'), 'a', encoding='utf-8') as log:
+        log.write('{"op":"put","id":"perdido","data":{"title":"Inc')
+
+    store = LogEventStore(store_dir)
+    assert store.get_event(kept)['title'] == 'Guardado'
+    assert store.get_event(updated)['title'] == 'Editado'
+    assert store.get_event('perdido') is None
+    assert store.find_event_by_google_id('g-1', 'ana')['firebase_id'] == kept
+
+    # El resto incompleto se descartó: las escrituras nuevas se leen bien
+    added = store.create_event(event('Después de la caída', day=3))
+    store.close()
+    store = LogEventStore(store_dir)
+    assert {e['title'] for e in store.get_all_events()} == {'Guardado', 'Editado', 'Después de la caída'}
+    assert store.get_event(added) is not None
+    store.close()
+
+
+def test_recovers_interrupted_compaction(store_dir):
+    store = LogEventStore(store_dir)
+    first = store.create_event(event('Antes de compactar'))
+    store.close()
+
+    # Caída después de apartar el log y antes de escribir el snapshot
+    os.replace(os.path.join(store_dir, 'events.wal'), os.path.join(store_dir, 'events.wal.compacting'))
+    store = LogEventStore(store_dir)
+    assert store.get_event(first)['title'] == 'Antes de compactar'
+    assert not os.path.exists(os.path.join(store_dir, 'events.wal.compacting'))
+    store.close()
+
+    store = LogEventStore(store_dir)
+    assert store.get_event(first)['title'] == 'Antes de compactar'
+    store.close()
+
+
+def test_writes_return_after_a_shared_fsync(store_dir, monkeypatch):
+    monkeypatch.setattr(settings, 'LOCAL_STORE_SYNC_WRITES', True)
+    real_fsync = os.fsync
+    fsyncs = []
+
+    def slow_fsync(fileno):
+        # Un disco lento: las escrituras que llegan mientras tanto se agrupan
+        time.sleep(0.02)
+        fsyncs.append(fileno)
+        real_fsync(fileno)
+
+    monkeypatch.setattr(log_store_module.os, 'fsync', slow_fsync)
+    store = LogEventStore(store_dir)
+    tickets = threading.local()
+    append = store._append
+
+    def tracked_append(records):
+        tickets.last = append(records)
+        return tickets.last
+
+    monkeypatch.setattr(store, '_append', tracked_append)
+    synced_on_return = []
+
+    def writer(index):
+        store.create_event(event(f'Evento {index}'))
+        # Al retornar, la escritura de este hilo ya pasó por un fsync
+        synced_on_return.append(store._synced >= tickets.last)
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(synced_on_return) and len(synced_on_return) == 20
+    assert store._synced == store._written == 20
+    # Group commit: muchas menos sincronizaciones que escrituras
+    assert len(fsyncs) < 20
+    store.close()
+
+
+def test_recovery_rebuilds_the_date_index(store_dir):
+    store = LogEventStore(store_dir)
+    moved = store.create_event(event('Movido', day=1))
+    removed = store.create_event(event('Eliminado', day=2))
+    kept = store.create_event(event('Igual', day=3))
+    store.compact()
+    # Cambios posteriores al snapshot, solo en el WAL
+    store.update_event(moved, {'date': '2025-06-05T09:00:00+00:00', 'end_time': '2025-06-05T10:00:00+00:00'})
+    store.delete_event(removed)
+    store.close()
+
+    store = LogEventStore(store_dir)
+    events, _ = store.query_events(user_id='ana', date_from='2025-06-01T00:00:00+00:00')
+    assert [e['firebase_id'] for e in events] == [kept, moved]
+    overlapping = store.find_overlapping('2025-06-05T09:30:00+00:00', '2025-06-05T09:45:00+00:00', 'ana')
+    assert [e['firebase_id'] for e in overlapping] == [moved]
+    store.close()
+
+
+def test_log_size_counts_bytes(store_dir):
+    store = LogEventStore(store_dir)
+    store.create_event(event('Reunión con el equipo de diseño ñandú 🗓️'))
+    assert store._log_size == os.path.getsize(os.path.join(store_dir, 'events.wal'))
+    store.close()
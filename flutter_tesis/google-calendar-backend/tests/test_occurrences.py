@@ -0,0 +1,75 @@
+"""
+ETag de /occurrences: las excepciones de una serie, escritas por la
+importación o por la sincronización incremental, cambian el ETag.
+"""
+WINDOW = {'from': '2025-01-01T00:00:00+00:00', 'to': '2025-02-01T00:00:00+00:00'}
+
+
+def put_weekly_series(google):
+    return google.put(
+        id='serie-semanal',
+        summary='Clase',
+        start={'dateTime': '2025-01-06T10:00:00+00:00', 'timeZone': 'UTC'},
+        end={'dateTime': '2025-01-06T11:00:00+00:00', 'timeZone': 'UTC'},
+        recurrence=['RRULE:FREQ=WEEKLY;COUNT=4'],
+    )
+
+
+def put_exception(google, **fields):
+    return google.put(
+        id='serie-semanal_20250113T100000Z',
+        recurringEventId='serie-semanal',
+        originalStartTime={'dateTime': '2025-01-13T10:00:00+00:00', 'timeZone': 'UTC'},
+        **fields
+    )
+
+
+def get_occurrences(client, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get('/api/calendar/occurrences', params=WINDOW, headers=headers)
+
+
+def test_import_exception_changes_occurrences_etag(client, google):
+    put_weekly_series(google)
+    assert client.post('/api/sync/import-from-google').json()['success']
+
+    response = get_occurrences(client)
+    assert response.status_code == 200
+    assert len(response.json()) == 4
+    etag = response.headers['ETag']
+    assert get_occurrences(client, etag).status_code == 304
+
+    # Cancelar la segunda ocurrencia en Google y volver a importar
+    put_exception(google, status='cancelled')
+    assert client.post('/api/sync/import-from-google').json()['success']
+
+    response = get_occurrences(client, etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [event['original_start'] for event in response.json()] == [
+        '2025-01-06T10:00:00Z', '2025-01-20T10:00:00Z', '2025-01-27T10:00:00Z'
+    ]
+
+
+def test_delta_sync_exception_changes_occurrences_etag(client, google, delta_engine):
+    put_weekly_series(google)
+    assert delta_engine.run()['created'] == 1
+    etag = get_occurrences(client).headers['ETag']
+
+    # Instancia movida y renombrada: llega en la sincronización incremental
+    put_exception(
+        google,
+        summary='Clase (aula 2)',
+        start={'dateTime': '2025-01-14T10:00:00+00:00', 'timeZone': 'UTC'},
+        end={'dateTime': '2025-01-14T11:00:00+00:00', 'timeZone': 'UTC'},
+    )
+    result = delta_engine.run()
+    assert not result['full_resync']
+    assert result['updated'] == 1
+
+    response = get_occurrences(client, etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    moved = [event for event in response.json() if event['title'] == 'Clase (aula 2)']
+    assert len(moved) == 1
+    assert moved[0]['date'].startswith('2025-01-14T10:00:00')
@@ -0,0 +1,38 @@
+"""
+Limitador de cuota: buckets de usuario acotados y métricas por usuario.
+"""
+from fastapi.testclient import TestClient
+
+from app.services.rate_limiter import QuotaLimiter, get_quota_limiter
+from config.settings import settings
+
+
+def test_idle_and_excess_user_buckets_are_evicted(monkeypatch):
+    monkeypatch.setattr(settings, 'GOOGLE_QUOTA_USER_BUCKETS', 3)
+    limiter = QuotaLimiter()
+    for user in ('ana', 'beto', 'carla'):
+        limiter.call(lambda: None, user_id=user)
+    limiter.call(lambda: None, user_id='ana')
+
+    # El menos usado recientemente sale primero
+    limiter.call(lambda: None, user_id='diego')
+    assert list(limiter.user_buckets) == ['carla', 'ana', 'diego']
+
+    # Los buckets sin uso reciente se descartan aunque quede espacio
+    monkeypatch.setattr(settings, 'GOOGLE_QUOTA_USER_IDLE_SECONDS', 0)
+    limiter.call(lambda: None, user_id='elena')
+    assert list(limiter.user_buckets) == ['elena']
+
+
+def test_quota_route_reports_only_the_caller(app, client, user_id):
+    get_quota_limiter().call(lambda: None, user_id='otro-usuario')
+    get_quota_limiter().call(lambda: None, user_id=user_id)
+
+    metrics = client.get('/api/sync/quota').json()
+    assert set(metrics) == {'project', 'user', 'active_users', 'stats'}
+    assert metrics['user']['tokens'] < metrics['user']['capacity']
+    assert metrics['active_users'] >= 2
+    assert 'otro-usuario' not in str(metrics)
+
+    with TestClient(app) as anonymous:
+        assert anonymous.get('/api/sync/quota').status_code == 401
@@ -0,0 +1,67 @@
+"""
+Expansión local de series: EXDATE, excepciones y cambios de horario.
+"""
+from datetime import datetime, timezone
+
+from app.services.recurrence import expand_events, expand_occurrences
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+SERIES = {
+    'firebase_id': 'serie',
+    'title': 'Clase',
+    'date': '2025-03-03T09:00:00-05:00',
+    'end_time': '2025-03-03T10:00:00-05:00',
+    'time_zone': 'America/New_York',
+    'recurrence': ['RRULE:FREQ=WEEKLY;COUNT=4', 'EXDATE;TZID=America/New_York:20250317T090000'],
+}
+
+
+def test_exdate_and_daylight_saving():
+    occurrences = expand_occurrences(SERIES, utc(2025, 3, 1), utc(2025, 4, 1))
+    # Se mantiene las 9:00 locales tras el cambio de horario del 9 de marzo
+    assert [occurrence['original_start'] for occurrence in occurrences] == [
+        '2025-03-03T14:00:00Z', '2025-03-10T13:00:00Z', '2025-03-24T13:00:00Z'
+    ]
+    assert all(occurrence['series_id'] == 'serie' and 'recurrence' not in occurrence for occurrence in occurrences)
+
+
+def test_exceptions_cancel_edit_and_move_occurrences():
+    series = {**SERIES, 'exceptions': {
+        '2025-03-03T14:00:00Z': {'cancelled': True},
+        '2025-03-10T13:00:00Z': {'title': 'Clase de repaso'},
+        # Movida desde fuera de la ventana (24 de marzo) al 31
+        '2025-03-24T13:00:00Z': {'date': '2025-03-31T13:00:00+00:00', 'end_time': '2025-03-31T14:00:00+00:00'},
+    }}
+
+    window = expand_occurrences(series, utc(2025, 3, 1), utc(2025, 3, 15))
+    assert [(o['original_start'], o['title']) for o in window] == [('2025-03-10T13:00:00Z', 'Clase de repaso')]
+
+    moved = expand_occurrences(series, utc(2025, 3, 28), utc(2025, 4, 5))
+    assert [(o['original_start'], o['date']) for o in moved] == [('2025-03-24T13:00:00Z', '2025-03-31T13:00:00+00:00')]
+
+
+def test_expand_events_mixes_series_and_single_events():
+    single = {'firebase_id': 'simple', 'title': 'Examen', 'date': '2025-03-11T15:00:00+00:00', 'end_time': '2025-03-11T16:00:00+00:00'}
+    expanded = expand_events([single, SERIES], utc(2025, 3, 9), utc(2025, 3, 12))
+    assert [event.get('original_start', event['firebase_id']) for event in expanded] == ['2025-03-10T13:00:00Z', 'simple']
+
+
+def test_exceptions_are_checked_against_the_window():
+    series = {**SERIES, 'exceptions': {
+        # Del 10 de marzo (dentro de la ventana) al 2 de abril (fuera)
+        '2025-03-10T13:00:00Z': {'date': '2025-04-02T13:00:00+00:00', 'end_time': '2025-04-02T14:00:00+00:00'},
+        # Del 24 de marzo al 14 a las 23:30, sin fin propio: conserva la hora de duración
+        '2025-03-24T13:00:00Z': {'date': '2025-03-14T23:30:00+00:00'},
+    }}
+
+    window = expand_occurrences(series, utc(2025, 3, 8), utc(2025, 3, 15))
+    assert [(o['original_start'], o['date'], o['end_time']) for o in window] == [
+        ('2025-03-24T13:00:00Z', '2025-03-14T23:30:00+00:00', '2025-03-15T00:30:00+00:00')
+    ]
+    # Empieza antes de la ventana pero todavía la solapa
+    window = expand_occurrences(series, utc(2025, 3, 15, 0, 15), utc(2025, 3, 20))
+    assert [o['original_start'] for o in window] == ['2025-03-24T13:00:00Z']
@@ -0,0 +1,48 @@
+"""
+El despliegue (Dockerfile) instala requirements-render.txt, que fija
+pydantic 1. Esta prueba instala esa versión aparte y vuelve a correr las
+pruebas de la API con ella.
+"""
+import os
+import re
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_TESTS = ['tests/test_change_feed.py', 'tests/test_batch_events.py', 'tests/test_occurrences.py']
+
+
+def render_pin(package):
+    with open(os.path.join(BACKEND_DIR, 'requirements-render.txt')) as f:
+        for line in f:
+            if re.match(rf'{package}==', line.strip()):
+                return line.strip()
+    return None
+
+
+def test_api_runs_with_render_pydantic(tmp_path):
+    pin = render_pin('pydantic')
+    assert pin, "requirements-render.txt debe fijar pydantic"
+
+    target = str(tmp_path / 'render-site')
+    install = subprocess.run(
+        [sys.executable, '-m', 'pip', 'install', '--quiet', '--no-deps', '--target', target, pin, 'typing_extensions'],
+        capture_output=True, text=True
+    )
+    if install.returncode != 0:
+        pytest.skip(f"No se pudo instalar {pin}: {install.stderr.strip()[-200:]}")
+
+    env = {**os.environ, 'PYTHONPATH': target}
+    version = subprocess.run(
+        [sys.executable, '-c', 'import pydantic; print(pydantic.VERSION)'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert version.stdout.strip() == pin.split('==')[1]
+
+    result = subprocess.run(
+        [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider', *API_TESTS],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
@@ -0,0 +1,100 @@
+"""
+Almacén SQLite: transacciones de las escrituras en lote y escritores concurrentes.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from app.services.sqlite_store import SqliteEventStore
+from config.settings import settings
+
+
+def event(title, day=1, user_id='ana', **fields):
+    return {
+        'title': title,
+        'date': f'2025-11-{day:02d}T09:00:00+00:00',
+        'end_time': f'2025-11-{day:02d}T10:00:00+00:00',
+        'user_id': user_id,
+        **fields
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteEventStore(str(tmp_path / 'events.db'))
+
+
+def test_failed_batch_write_rolls_back(store, monkeypatch):
+    first = store.create_event(event('Primero'))
+    second = store.create_event(event('Segundo', day=2))
+    write_rows = store._write_rows
+
+    def failing_write(conn, rows):
+        write_rows(conn, rows[:1])
+        raise sqlite3.OperationalError("disco lleno")
+
+    monkeypatch.setattr(store, '_write_rows', failing_write)
+    with pytest.raises(sqlite3.OperationalError):
+        store.update_events({first: {'title': 'Primero editado'}, second: {'title': 'Segundo editado'}})
+    monkeypatch.undo()
+
+    # Ninguna de las dos actualizaciones quedó aplicada y la conexión sigue usable
+    assert {e['title'] for e in store.get_all_events()} == {'Primero', 'Segundo'}
+    assert store.update_events({first: {'title': 'Primero editado'}, 'no-existe': {}}) == {
+        first: None, 'no-existe': "Evento no encontrado"
+    }
+    assert store.get_event(first)['title'] == 'Primero editado'
+
+
+def test_concurrent_writers_do_not_lose_updates(store):
+    firebase_id = store.create_event(event('Compartido'))
+    errors = []
+
+    def writer(index):
+        try:
+            store.create_events([event(f'Evento {index}-{n}', day=3) for n in range(5)])
+            store.upsert_events({firebase_id: {f'campo_{index}': index}})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(store.get_all_events()) == 51
+    # Cada combinación leyó y escribió dentro de su transacción: no se pisaron
+    merged = store.get_event(firebase_id)
+    assert all(merged[f'campo_{index}'] == index for index in range(10))
+
+
+def test_old_database_is_migrated(tmp_path):
+    db_file = str(tmp_path / 'antigua.db')
+    conn = sqlite3.connect(db_file)
+    conn.execute(
+        "CREATE TABLE events (firebase_id TEXT PRIMARY KEY, google_event_id TEXT, date TEXT, "
+        "type TEXT, user_id TEXT NOT NULL, data TEXT NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO events VALUES ('viejo', NULL, NULL, NULL, 'ana', ?)",
+        ('{"firebase_id":"viejo","title":"Serie","user_id":"ana","date":"2025-11-03T09:00:00+00:00",'
+         '"end_time":"2025-11-03T10:00:00+00:00","recurrence":["RRULE:FREQ=WEEKLY"]}',)
+    )
+    conn.commit()
+    conn.close()
+
+    store = SqliteEventStore(db_file)
+    # La serie aparece en cualquier ventana posterior a su inicio
+    found = store.find_overlapping('2025-12-01T00:00:00+00:00', '2025-12-08T00:00:00+00:00', 'ana')
+    assert [e['firebase_id'] for e in found] == ['viejo']
+
+
+def test_event_without_owner_goes_to_the_default_user(store):
+    firebase_id, other = (result['firebase_id'] for result in store.create_events([
+        event('Sin dueño', user_id=None), event('Con dueño')
+    ]))
+    assert store.find_overlapping('2025-11-01T00:00:00+00:00', '2025-11-02T00:00:00+00:00', settings.DEFAULT_USER_ID)[0]['firebase_id'] == firebase_id
+    assert store.get_event(other)['user_id'] == 'ana'
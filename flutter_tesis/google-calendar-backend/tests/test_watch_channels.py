@@ -0,0 +1,93 @@
+"""
+Avisos del webhook de Google Calendar y sincronizaciones de un mismo calendario.
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from app.routes import sync_routes
+from app.services.watch_channels import WatchChannelManager
+from config.settings import settings
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+def test_webhook_schedules_one_sync(client, google, user_id, delta_engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, 'WEBHOOK_DEBOUNCE_SECONDS', 0.05)
+    state_file = tmp_path / 'channels.json'
+    state_file.write_text(json.dumps({'canal-1': {'token': 'secreto', 'calendar_id': 'primary', 'user_id': user_id}}))
+    manager = WatchChannelManager(lambda owner: delta_engine, str(state_file))
+    # El registro se leyó al crear el manager: los avisos no vuelven a leer el archivo
+    state_file.unlink()
+    monkeypatch.setattr(sync_routes, 'watch_channel_manager', manager)
+    google.put(summary='Desde Google', start={'dateTime': '2025-07-01T09:00:00Z'}, end={'dateTime': '2025-07-01T10:00:00Z'})
+
+    headers = {'X-Goog-Channel-Id': 'canal-1', 'X-Goog-Channel-Token': 'secreto'}
+    assert client.post('/api/sync/webhook', headers={**headers, 'X-Goog-Resource-State': 'sync'}).status_code == 200
+    for _ in range(3):
+        assert client.post('/api/sync/webhook', headers={**headers, 'X-Goog-Resource-State': 'exists'}).status_code == 200
+    wrong = {**headers, 'X-Goog-Channel-Token': 'otro', 'X-Goog-Resource-State': 'exists'}
+    assert client.post('/api/sync/webhook', headers=wrong).status_code == 404
+
+    # La ráfaga de avisos se agrupa en una sola sincronización
+    wait_for(lambda: google.list_requests and not manager._scheduled)
+    assert len(google.list_requests) == 1
+    assert delta_engine.state_store.get_token('primary') == f"sync-{google.sequence}"
+
+
+def test_runs_of_the_same_calendar_are_chained(google, delta_engine, monkeypatch):
+    google.put(summary='Evento', start={'dateTime': '2025-07-02T09:00:00Z'}, end={'dateTime': '2025-07-02T10:00:00Z'})
+    running, overlaps = [], []
+    list_events = google.list
+
+    def slow_list(calendar_id, params):
+        overlaps.append(len(running))
+        running.append(calendar_id)
+        try:
+            time.sleep(0.05)
+            return list_events(calendar_id, params)
+        finally:
+            running.remove(calendar_id)
+
+    monkeypatch.setattr(google, 'list', slow_list)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(delta_engine.run('primary'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # La segunda sincronización esperó y continuó desde el token de la primera
+    assert overlaps == [0, 0]
+    assert sorted(result['created'] for result in results) == [0, 1]
+    assert [request.get('syncToken') for request in google.list_requests] == [None, f"sync-{google.sequence}"]
+
+
+class _WatchCalendarService:
+    def watch_events(self, channel, calendar_id='primary'):
+        return {'resourceId': f"recurso-{channel['id']}", 'expiration': '4102444800000'}
+
+    def stop_channel(self, channel_id, resource_id):
+        return True
+
+
+def test_registry_is_kept_in_memory_and_persisted(tmp_path):
+    engine = SimpleNamespace(calendar_service=_WatchCalendarService())
+    state_file = str(tmp_path / 'channels.json')
+    manager = WatchChannelManager(lambda owner: engine, state_file)
+
+    channel = manager.register('primary', 'ana')
+    assert manager.handle_notification(channel['id'], 'sync', channel['token'])
+    # Otra ejecución del servidor recupera el canal del archivo
+    assert set(WatchChannelManager(lambda owner: engine, state_file).list_channels('ana')) == {channel['id']}
+
+    assert not manager.stop(channel['id'], 'beto')
+    assert manager.stop(channel['id'], 'ana')
+    assert not manager.handle_notification(channel['id'], 'exists', channel['token'])
+    assert WatchChannelManager(lambda owner: engine, state_file).list_channels() == {}